@@ -21,12 +21,33 @@ def create_app():
     app.config['WTF_CSRF_ENABLED'] = True
     app.config['WTF_CSRF_TIME_LIMIT'] = 3600  # 1 hour
     
+    # Expose per-request SQL totals as X-Query-* response headers
+    app.config['QUERY_STATS_HEADERS'] = os.environ.get('QUERY_STATS_HEADERS', 'False').lower() in ['true', '1', 'yes']
+    
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
     # Initialize CSRF Protection
     csrf = CSRFProtect()
     csrf.init_app(app)
 
+    # Initialize query instrumentation, request metrics (/metrics), render caches,
+    # the write-behind buffers (listing views, read receipts), scheduled analytics rollups,
+    # online presence, listing search and the background loader of the in-memory listing indexes
+    from app import query_stats, metrics, cache, view_counts, read_receipts, analytics, presence, text_search, listing_mirror
+    query_stats.init_app(app)
+    metrics.init_app(app)
+    cache.init_app(app)
+    view_counts.init_app(app)
+    read_receipts.init_app(app)
+    analytics.init_app(app)
+    presence.init_app(app)
+    text_search.init_app(app)
+    listing_mirror.init_app(app)
+
+    # Maintenance CLI commands (flask --app run <command>)
+    from app.commands import register_commands
+    register_commands(app)
+
     # Initialize Flask-Login
     login_manager = LoginManager()
     login_manager.init_app(app)
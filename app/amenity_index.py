@@ -0,0 +1,90 @@
+"""
+Canonical amenity vocabulary and bitmasks
+
+Every amenity in AMENITIES owns one bit, its position in the tuple. A
+listing's amenities are stored both as text (listings.amenities, for display
+and keyword search) and as listings.amenity_mask. Rows are decoded from the
+mask, so loading a listing parses no strings. Names outside the vocabulary
+are kept in the text column but carry no bit.
+
+Bits are persisted: only ever append to AMENITIES, never reorder or remove.
+
+Search filters on the masks in the catalog's amenity_mask column (see
+app/catalog.py): "wifi AND air conditioning AND parking" is one AND per
+listing over a NumPy array.
+"""
+import re
+from functools import lru_cache
+
+# (key, label); the bit of an amenity is its position
+AMENITIES = (
+    ('wifi', 'WiFi'),
+    ('air_conditioning', 'Air Conditioning'),
+    ('kitchen', 'Kitchen'),
+    ('parking', 'Parking'),
+    ('tv', 'TV'),
+    ('balcony', 'Balcony'),
+    ('pool', 'Pool'),
+    ('heating', 'Heating'),
+    ('pet_friendly', 'Pet Friendly'),
+    ('washer', 'Washer'),
+    ('workspace', 'Workspace'),
+    ('generator', 'Power Backup'),
+    ('hot_water', 'Hot Water'),
+)
+
+BITS = {key: 1 << bit for bit, (key, _) in enumerate(AMENITIES)}
+LABELS = dict(AMENITIES)
+
+ALIASES = {
+    'wi_fi': 'wifi',
+    'wireless': 'wifi',
+    'internet': 'wifi',
+    'ac': 'air_conditioning',
+    'a_c': 'air_conditioning',
+    'aircon': 'air_conditioning',
+    'television': 'tv',
+    'pets': 'pet_friendly',
+    'pets_allowed': 'pet_friendly',
+    'washing_machine': 'washer',
+    'laundry': 'washer',
+    'desk': 'workspace',
+    'power_backup': 'generator',
+    'ips': 'generator',
+    'geyser': 'hot_water',
+}
+
+_SEPARATORS = re.compile(r'[\s\-/]+')
+
+
+def canonical(name):
+    """Vocabulary key for an amenity name ('Wi-Fi', 'Air Conditioning', 'AC'...), or None"""
+    key = _SEPARATORS.sub('_', name.strip().lower())
+    key = ALIASES.get(key, key)
+    return key if key in BITS else None
+
+
+def to_mask(names):
+    """Bitmask of the vocabulary amenities among names"""
+    mask = 0
+    for name in names:
+        key = canonical(name)
+        if key:
+            mask |= BITS[key]
+    return mask
+
+
+@lru_cache(maxsize=4096)
+def _keys(mask):
+    return tuple(key for key, bit in BITS.items() if mask & bit)
+
+
+def from_mask(mask):
+    """Vocabulary keys set in a bitmask, in vocabulary order"""
+    return list(_keys(mask or 0))
+
+
+def normalize(names):
+    """Text-column form of names: vocabulary amenities as keys, others kept as given"""
+    cleaned = [name.strip() for name in names if name and name.strip()]
+    return ','.join(dict.fromkeys(canonical(name) or name for name in cleaned))
@@ -0,0 +1,213 @@
+"""
+Host analytics from daily rollups
+
+`listing_daily_stats` holds one row per listing per day:
+
+    bookings     bookings made that day (not cancelled)
+    nights_sold  nights of stay falling on that day (from booking_nights)
+    revenue      those nights' share of their booking's total price
+    views        listing page views, added by add_views()
+
+refresh() keeps the booking columns current incrementally. It reads only the
+bookings whose updated_at moved past the `bookings` watermark, recomputes the
+listing-days they touch from the source tables and then advances the
+watermark. Recomputing is idempotent, so a failed run is simply repeated.
+Booking dates never change after creation, so a booking's current dates are
+the days it affects. Rows removed outright (user deletion) leave no
+updated_at behind; `flask rollup-analytics --full` rebuilds everything.
+
+Each worker runs refresh() every ANALYTICS_ROLLUP_INTERVAL seconds on a
+background thread, under a MySQL named lock so only one worker rolls up at a
+time. With the interval set to 0, schedule the command instead, e.g.
+
+    */5 * * * *  cd /path/to/otithi && .venv/bin/flask --app run rollup-analytics
+
+Dashboards read only the rollup table, never scan `bookings`.
+"""
+from datetime import date, datetime, timedelta
+from config import Config
+from app.database import db
+from app.write_behind import BackgroundFlusher
+
+BOOKINGS_JOB = 'bookings'
+EPOCH = datetime(1970, 1, 1)
+
+# MySQL named lock held by the worker running a scheduled rollup
+ROLLUP_LOCK = 'otithi_analytics_rollup'
+
+
+def get_watermark(job=BOOKINGS_JOB):
+    rows = db.execute_query("SELECT watermark FROM analytics_watermarks WHERE job = %s", (job,))
+    return rows[0]['watermark'] if rows else EPOCH
+
+
+def _set_watermark(job, watermark):
+    db.execute_update("""
+        INSERT INTO analytics_watermarks (job, watermark) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE watermark = VALUES(watermark)
+    """, (job, watermark))
+
+
+def _rollup_listing(listing_id, first_day, last_day):
+    """Recompute the booking columns of one listing for days [first_day, last_day]"""
+    db.execute_update("""
+        UPDATE listing_daily_stats SET bookings = 0, nights_sold = 0, revenue = 0
+        WHERE listing_id = %s AND day BETWEEN %s AND %s
+    """, (listing_id, first_day, last_day))
+    db.execute_update("""
+        INSERT INTO listing_daily_stats (listing_id, day, nights_sold, revenue)
+        SELECT bn.listing_id, bn.night, COUNT(*), SUM(b.total_price / DATEDIFF(b.check_out, b.check_in))
+        FROM booking_nights bn
+        JOIN bookings b ON b.booking_id = bn.booking_id
+        WHERE bn.listing_id = %s AND bn.night BETWEEN %s AND %s
+        GROUP BY bn.listing_id, bn.night
+        ON DUPLICATE KEY UPDATE nights_sold = VALUES(nights_sold), revenue = VALUES(revenue)
+    """, (listing_id, first_day, last_day))
+    db.execute_update("""
+        INSERT INTO listing_daily_stats (listing_id, day, bookings)
+        SELECT listing_id, DATE(created_at), COUNT(*)
+        FROM bookings
+        WHERE listing_id = %s AND status != 'cancelled'
+          AND created_at >= %s AND created_at < %s
+        GROUP BY listing_id, DATE(created_at)
+        ON DUPLICATE KEY UPDATE bookings = VALUES(bookings)
+    """, (listing_id, first_day, last_day + timedelta(days=1)))
+
+
+def refresh(full=False):
+    """Roll up bookings changed since the watermark. Returns (bookings, listings) processed.
+
+    Changes from the last ANALYTICS_WATERMARK_LAG seconds are left for the next
+    run, so transactions still in flight when the run starts are not skipped.
+    """
+    watermark = EPOCH if full else get_watermark()
+    now = db.execute_query("SELECT NOW() AS now")[0]['now']
+    upto = now - timedelta(seconds=Config.ANALYTICS_WATERMARK_LAG)
+    if upto <= watermark:
+        return 0, 0
+
+    changed = db.execute_query("""
+        SELECT listing_id, MIN(LEAST(check_in, DATE(created_at))) AS first_day,
+               MAX(GREATEST(check_out, DATE(created_at))) AS last_day, COUNT(*) AS bookings
+        FROM bookings
+        WHERE updated_at >= %s AND updated_at < %s
+        GROUP BY listing_id
+    """, (watermark, upto))
+
+    if full:
+        # Listing-days whose bookings are all gone would otherwise keep their old totals
+        db.execute_update("UPDATE listing_daily_stats SET bookings = 0, nights_sold = 0, revenue = 0")
+    for row in changed:
+        with db.transaction():
+            _rollup_listing(row['listing_id'], row['first_day'], row['last_day'])
+    _set_watermark(BOOKINGS_JOB, upto)
+    return sum(row['bookings'] for row in changed), len(changed)
+
+
+def add_views(counts):
+    """Add page views, given as {(listing_id, day): views}"""
+    if not counts:
+        return 0
+    # Key order keeps concurrent flushes from different workers from deadlocking
+    rows = [(listing_id, day, views) for (listing_id, day), views in sorted(counts.items())]
+    placeholders = ', '.join(['(%s, %s, %s)'] * len(rows))
+    params = tuple(value for row in rows for value in row)
+    return db.execute_update(f"""
+        INSERT INTO listing_daily_stats (listing_id, day, views) VALUES {placeholders}
+        ON DUPLICATE KEY UPDATE views = views + VALUES(views)
+    """, params)
+
+
+def get_host_summary(host_id, days=30):
+    """Totals for a host over the last `days` days, plus all-time views.
+
+    Returns {'days', 'bookings', 'nights_sold', 'revenue', 'views', 'total_views',
+    'occupancy'} where occupancy is the percentage of active listing-nights sold.
+    """
+    start = date.today() - timedelta(days=days)
+    end = date.today()
+    rows = db.execute_query("""
+        SELECT
+            SUM(CASE WHEN s.day >= %s AND s.day < %s THEN s.bookings ELSE 0 END) AS bookings,
+            SUM(CASE WHEN s.day >= %s AND s.day < %s THEN s.nights_sold ELSE 0 END) AS nights_sold,
+            SUM(CASE WHEN s.day >= %s AND s.day < %s THEN s.revenue ELSE 0 END) AS revenue,
+            SUM(CASE WHEN s.day >= %s AND s.day < %s THEN s.views ELSE 0 END) AS views,
+            SUM(s.views) AS total_views,
+            (SELECT COUNT(*) FROM listings WHERE host_id = %s AND is_active = 1) AS active_listings
+        FROM listings l
+        JOIN listing_daily_stats s ON s.listing_id = l.listing_id
+        WHERE l.host_id = %s
+    """, (start, end) * 4 + (host_id, host_id))
+    row = rows[0] if rows else {}
+    active_listings = row.get('active_listings') or 0
+    nights_sold = int(row.get('nights_sold') or 0)
+    return {
+        'days': days,
+        'bookings': int(row.get('bookings') or 0),
+        'nights_sold': nights_sold,
+        'revenue': float(row.get('revenue') or 0),
+        'views': int(row.get('views') or 0),
+        'total_views': int(row.get('total_views') or 0),
+        'occupancy': round(100 * nights_sold / (active_listings * days), 1) if active_listings else 0.0
+    }
+
+
+def get_host_trend(host_id, start, end):
+    """Daily totals across a host's listings for days [start, end), one entry per day"""
+    rows = db.execute_query("""
+        SELECT s.day, SUM(s.bookings) AS bookings, SUM(s.nights_sold) AS nights_sold,
+               SUM(s.revenue) AS revenue, SUM(s.views) AS views
+        FROM listings l
+        JOIN listing_daily_stats s ON s.listing_id = l.listing_id
+        WHERE l.host_id = %s AND s.day >= %s AND s.day < %s
+        GROUP BY s.day
+    """, (host_id, start, end))
+    by_day = {row['day']: row for row in rows}
+
+    trend = []
+    day = start
+    while day < end:
+        row = by_day.get(day, {})
+        trend.append({
+            'day': day.isoformat(),
+            'bookings': int(row.get('bookings') or 0),
+            'nights_sold': int(row.get('nights_sold') or 0),
+            'revenue': float(row.get('revenue') or 0),
+            'views': int(row.get('views') or 0)
+        })
+        day += timedelta(days=1)
+    return trend
+
+
+class RollupScheduler(BackgroundFlusher):
+    """Runs refresh() every ANALYTICS_ROLLUP_INTERVAL seconds in each worker, one worker at a time"""
+
+    thread_name = 'analytics-rollup'
+
+    def __init__(self, interval=Config.ANALYTICS_ROLLUP_INTERVAL):
+        super().__init__(interval)
+
+    def start(self):
+        if self.interval > 0:
+            self._ensure_thread()
+
+    def reset(self):
+        """Nothing is buffered between runs"""
+
+    def flush(self):
+        """Roll up unless another worker is already doing so. Returns refresh()'s result, or None."""
+        try:
+            with db.named_lock(ROLLUP_LOCK) as locked:
+                return refresh() if locked else None
+        except Exception as e:
+            print(f"Error rolling up analytics: {e}")
+            return None
+
+
+rollup_scheduler = RollupScheduler()
+
+
+def init_app(app):
+    @app.before_request
+    def start_rollup_scheduler():
+        rollup_scheduler.start()
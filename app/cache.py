@@ -0,0 +1,135 @@
+"""
+In-process caches for rendered template fragments and whole pages
+
+Entries are keyed on per-listing version numbers that are bumped whenever the
+listing_changed signal fires, so a card is re-rendered only after its listing,
+images or reviews change. Each worker process keeps its own cache; the TTLs
+bound how long another worker's writes can take to show up.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from flask import request, make_response
+from markupsafe import Markup
+from config import Config
+from app.signals import listing_changed
+
+# Stands in for the per-session CSRF token inside cached page bodies
+CSRF_PLACEHOLDER = '__otithi_csrf_token__'
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a TTL (seconds)"""
+
+    def __init__(self, max_entries=1000, default_ttl=60):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.default_ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_set(self, key, factory, ttl=None):
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.set(key, value, ttl)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+fragment_cache = TTLCache(max_entries=Config.FRAGMENT_CACHE_MAX_ENTRIES, default_ttl=Config.FRAGMENT_CACHE_TTL)
+page_cache = TTLCache(max_entries=64, default_ttl=Config.PAGE_CACHE_TTL)
+
+_versions_lock = threading.Lock()
+_listing_versions = {}
+_catalog_version = 0
+
+
+def listing_version(listing_id):
+    """Current cache version of a listing (its card, detail data and reviews)"""
+    return _listing_versions.get(listing_id, 0)
+
+
+def catalog_version():
+    """Version that changes whenever any listing changes"""
+    return _catalog_version
+
+
+def _on_listing_changed(sender, listing_id=None, **extra):
+    global _catalog_version
+    with _versions_lock:
+        _listing_versions[listing_id] = _listing_versions.get(listing_id, 0) + 1
+        _catalog_version += 1
+    page_cache.clear()
+
+
+listing_changed.connect(_on_listing_changed)
+
+
+def cached_fragment(name, *key_parts, ttl=None, caller=None):
+    """Jinja helper: {% call cached_fragment('listing-card', id, version) %}...{% endcall %}"""
+    key = (name,) + key_parts
+    html = fragment_cache.get(key)
+    if html is None:
+        html = Markup(caller())
+        fragment_cache.set(key, html, ttl)
+    return html
+
+
+def get_page(key):
+    """Return the cached (etag, body) for a page, or None"""
+    return page_cache.get(key)
+
+
+def store_page(key, html):
+    """Cache a rendered page with its CSRF token swapped for a placeholder; returns (etag, body)"""
+    from flask_wtf.csrf import generate_csrf
+    body = html.replace(generate_csrf(), CSRF_PLACEHOLDER)
+    etag = hashlib.md5(body.encode('utf-8')).hexdigest()
+    page_cache.set(key, (etag, body))
+    return etag, body
+
+
+def page_response(etag, body):
+    """Build a 304 or 200 response for a cached page body"""
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        from flask_wtf.csrf import generate_csrf
+        response = make_response(body.replace(CSRF_PLACEHOLDER, generate_csrf()))
+    response.set_etag(etag, weak=True)
+    # The body carries a per-session CSRF token, so shared caches must not store it
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def init_app(app):
+    """Expose the fragment cache helper to templates"""
+    app.jinja_env.globals['cached_fragment'] = cached_fragment
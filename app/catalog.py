@@ -0,0 +1,251 @@
+"""
+Columnar snapshot of the active listings for filtering and sorting
+
+Browse and search filter the whole catalog but render one page of it. The
+snapshot keeps the fields they filter and sort on in NumPy columns, one row
+per active listing:
+
+    listing_id, price, guests, rating, reviews, latitude, longitude,
+    room_type (index into ROOM_TYPES), amenity_mask, created_at
+
+search() turns price, guest, room type, amenity and distance filters into
+boolean masks, selects the requested page with a partial sort and returns
+only listing ids; the caller hydrates just those with Listing.get_many().
+
+Rows are updated in place: a changed listing overwrites its row, a new one
+is appended (columns grow by doubling) and a removed one is replaced by the
+last row. The snapshot is a ListingMirror (see app/listing_mirror.py); its
+updated_at also covers listing_rating_stats, so review writes in other
+workers reach the rating column on the next sync.
+"""
+import threading
+import numpy as np
+from app.geo_index import EARTH_RADIUS_KM
+from app.listing_mirror import ListingMirror, warmer
+from app.signals import listing_changed
+
+ROOM_TYPES = ('entire_place', 'private_room', 'shared_room')
+ROOM_TYPE_CODES = {room_type: code for code, room_type in enumerate(ROOM_TYPES)}
+
+COLUMNS = (
+    ('listing_id', np.int64),
+    ('price', np.float64),
+    ('guests', np.int32),
+    ('rating', np.float32),
+    ('reviews', np.int32),
+    ('latitude', np.float64),   # NaN without coordinates
+    ('longitude', np.float64),
+    ('room_type', np.int8),     # -1 if not in ROOM_TYPES
+    ('amenity_mask', np.uint64),
+    ('created_at', np.int64),   # Unix seconds
+)
+
+ORDERS = ('newest', 'price', 'rating', 'distance', 'rank')
+
+
+def _distances_km(lat, lon, latitudes, longitudes):
+    """Haversine distance from one point to arrays of points"""
+    phi1, phi2 = np.radians(lat), np.radians(latitudes)
+    a = (np.sin((phi2 - phi1) / 2) ** 2
+         + np.cos(phi1) * np.cos(phi2) * np.sin(np.radians(longitudes - lon) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def _top(primary, secondary, count):
+    """Indexes of the `count` smallest (primary, secondary) pairs, in order.
+
+    Partitions on the primary key first so only the rows that can reach the
+    page are fully sorted. Rows tied with the last one are all kept until the
+    final sort, so pages are stable.
+    """
+    if count >= len(primary):
+        return np.lexsort((secondary, primary))
+    kth = np.partition(primary, count - 1)[count - 1]
+    candidates = np.flatnonzero(primary <= kth)
+    return candidates[np.lexsort((secondary[candidates], primary[candidates]))][:count]
+
+
+class CatalogSnapshot(ListingMirror):
+    """NumPy columns over the active listings"""
+
+    QUERY = """
+        SELECT l.listing_id, GREATEST(l.updated_at, COALESCE(rs.updated_at, l.updated_at)) AS updated_at,
+               l.price_per_night, l.max_guests, l.room_type, l.amenity_mask, l.created_at,
+               loc.latitude, loc.longitude, rs.review_count, rs.rating_sum
+        FROM listings l
+        LEFT JOIN locations loc ON l.location_id = loc.location_id
+        LEFT JOIN listing_rating_stats rs ON rs.listing_id = l.listing_id
+        WHERE l.is_active = 1
+    """
+    SYNC_QUERY = """
+        SELECT l.listing_id, GREATEST(l.updated_at, COALESCE(rs.updated_at, l.updated_at)) AS updated_at
+        FROM listings l
+        LEFT JOIN listing_rating_stats rs ON rs.listing_id = l.listing_id
+        WHERE l.is_active = 1
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._columns = {name: np.zeros(0, dtype) for name, dtype in COLUMNS}
+        self._size = 0
+        self._rows = {}  # listing_id -> row
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    @staticmethod
+    def _values(row):
+        review_count = row['review_count'] or 0
+        return (
+            row['listing_id'],
+            float(row['price_per_night']),
+            row['max_guests'] or 0,
+            float(row['rating_sum']) / review_count if review_count else 0.0,
+            review_count,
+            float(row['latitude']) if row['latitude'] is not None else np.nan,
+            float(row['longitude']) if row['longitude'] is not None else np.nan,
+            ROOM_TYPE_CODES.get(row['room_type'], -1),
+            row['amenity_mask'] or 0,
+            int(row['created_at'].timestamp()) if row['created_at'] else 0,
+        )
+
+    def load(self, rows):
+        values = [self._values(row) for row in rows]
+        columns = {}
+        for position, (name, dtype) in enumerate(COLUMNS):
+            columns[name] = np.fromiter((value[position] for value in values), dtype, count=len(values))
+        with self._lock:
+            self._columns = columns
+            self._size = len(values)
+            self._rows = {row[0]: index for index, row in enumerate(values)}
+
+    def index(self, row):
+        values = self._values(row)
+        with self._lock:
+            index = self._rows.get(values[0])
+            if index is None:
+                index = self._size
+                if index == len(self._columns['listing_id']):
+                    self._grow()
+                self._size += 1
+                self._rows[values[0]] = index
+            for (name, _), value in zip(COLUMNS, values):
+                self._columns[name][index] = value
+
+    def _grow(self):
+        capacity = max(2 * len(self._columns['listing_id']), 64)
+        for name, dtype in COLUMNS:
+            column = np.zeros(capacity, dtype)
+            column[:self._size] = self._columns[name][:self._size]
+            self._columns[name] = column
+
+    def unindex(self, listing_id):
+        with self._lock:
+            index = self._rows.pop(listing_id, None)
+            if index is None:
+                return
+            last = self._size - 1
+            if index != last:
+                for column in self._columns.values():
+                    column[index] = column[last]
+                self._rows[int(self._columns['listing_id'][index])] = index
+            self._size = last
+
+    def search(self, min_price=None, max_price=None, guests=None, room_types=None, amenity_mask=0,
+               near=None, radius_km=None, listing_ids=None, exclude_ids=None,
+               order='newest', offset=0, limit=None):
+        """One page of the active listings matching every given filter.
+
+        near is (lat, lon); with it, listings without coordinates are left out
+        and radius_km, if given, bounds the distance. listing_ids restricts the
+        result to those listings and, with order='rank', orders it as given.
+        Returns {'ids', 'total', 'distances'}, distances being {id: km} for the
+        page when near is given.
+        """
+        if order not in ORDERS:
+            raise ValueError(f"Unknown order {order!r}")
+        if (order == 'distance' and near is None) or (order == 'rank' and listing_ids is None):
+            order = 'newest'
+        self.ensure_current()
+        with self._lock:
+            size = self._size
+            columns = {name: column[:size] for name, column in self._columns.items()}
+            ids = columns['listing_id']
+            keep = np.ones(size, dtype=bool)
+            if min_price is not None:
+                keep &= columns['price'] >= min_price
+            if max_price is not None:
+                keep &= columns['price'] <= max_price
+            if guests:
+                keep &= columns['guests'] >= guests
+            if room_types:
+                codes = [ROOM_TYPE_CODES[room_type] for room_type in room_types if room_type in ROOM_TYPE_CODES]
+                keep &= np.isin(columns['room_type'], codes)
+            if amenity_mask:
+                required = np.uint64(amenity_mask)
+                keep &= (columns['amenity_mask'] & required) == required
+            if listing_ids is not None:
+                wanted = np.fromiter(listing_ids, np.int64)
+                keep &= np.isin(ids, wanted)
+            if exclude_ids:
+                keep &= ~np.isin(ids, np.fromiter(exclude_ids, np.int64))
+            distances = None
+            if near is not None:
+                distances = _distances_km(near[0], near[1], columns['latitude'], columns['longitude'])
+                # NaN distances (no coordinates) fail every comparison
+                keep &= distances <= (radius_km if radius_km is not None else np.inf)
+
+            rows = np.flatnonzero(keep)
+            selected = ids[rows]
+            if order == 'newest':
+                primary, secondary = -columns['created_at'][rows], -selected
+            elif order == 'price':
+                primary, secondary = columns['price'][rows], selected
+            elif order == 'rating':
+                primary, secondary = -columns['rating'][rows], -columns['reviews'][rows]
+            elif order == 'distance':
+                primary, secondary = distances[rows], selected
+            else:
+                # Position of each selected id in listing_ids
+                ranking = np.argsort(wanted, kind='stable')
+                primary, secondary = ranking[np.searchsorted(wanted[ranking], selected)], selected
+            count = len(rows) if limit is None else min(offset + limit, len(rows))
+            page = _top(primary, secondary, count)[offset:]
+            page_rows = rows[page]
+            return {
+                'ids': ids[page_rows].tolist(),
+                'total': len(rows),
+                'distances': dict(zip(ids[page_rows].tolist(), distances[page_rows].round(2).tolist()))
+                             if distances is not None else {}
+            }
+
+    def prices(self, listing_ids):
+        """{listing_id: nightly price} for listings in the snapshot"""
+        with self._lock:
+            price = self._columns['price']
+            return {listing_id: float(price[self._rows[listing_id]])
+                    for listing_id in listing_ids if listing_id in self._rows}
+
+
+snapshot = CatalogSnapshot()
+warmer.register(snapshot)
+
+
+def search(**filters):
+    """See CatalogSnapshot.search"""
+    return snapshot.search(**filters)
+
+
+def prices(listing_ids):
+    return snapshot.prices(listing_ids)
+
+
+def _on_listing_changed(sender, listing_id=None, reason=None, **extra):
+    if reason in ('created', 'updated', 'reviews'):
+        snapshot.refresh_listing(listing_id)
+    elif reason == 'deleted':
+        snapshot.remove_listing(listing_id)
+
+
+listing_changed.connect(_on_listing_changed)
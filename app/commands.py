@@ -0,0 +1,81 @@
+"""
+Maintenance commands, run with `flask --app run <command>`
+"""
+import click
+from mysql.connector import IntegrityError
+
+
+def register_commands(app):
+    """Attach the maintenance CLI commands to the app"""
+
+    @app.cli.command('backfill-booking-nights')
+    def backfill_booking_nights():
+        """Rebuild booking_nights from the bookings table"""
+        from app.database import db
+        from app.models import Booking
+
+        released = db.execute_update("""
+            DELETE bn FROM booking_nights bn
+            JOIN bookings b ON bn.booking_id = b.booking_id
+            WHERE b.status = 'cancelled'
+        """)
+
+        bookings = db.execute_query("""
+            SELECT booking_id, listing_id, check_in, check_out FROM bookings
+            WHERE status != 'cancelled'
+            ORDER BY created_at, booking_id
+        """)
+        claimed = 0
+        conflicts = []
+        for booking in bookings:
+            try:
+                with db.transaction():
+                    # Rewrite the booking's nights so edited dates are picked up too
+                    Booking.release_nights(booking['booking_id'])
+                    claimed += Booking.claim_nights(booking['booking_id'], booking['listing_id'],
+                                                    booking['check_in'], booking['check_out'])
+            except IntegrityError:
+                conflicts.append(booking['booking_id'])
+
+        click.echo(f"Claimed {claimed} nights for {len(bookings) - len(conflicts)} bookings, "
+                   f"released nights of cancelled bookings ({released} rows).")
+        if conflicts:
+            # Earlier bookings keep their nights; these overlap them and need manual review
+            click.echo(f"Overlapping bookings left without nights: {', '.join(map(str, conflicts))}")
+
+    @app.cli.command('rebuild-rating-stats')
+    def rebuild_rating_stats():
+        """Recompute listing_rating_stats (rating totals and histograms) from the reviews table"""
+        from app.models import Review
+
+        rows = Review.refresh_rating_stats()
+        click.echo(f"Rebuilt rating stats for {rows} listings.")
+
+    @app.cli.command('rollup-analytics')
+    @click.option('--full', is_flag=True, help='Recompute every listing-day instead of only recent changes.')
+    def rollup_analytics(full):
+        """Roll bookings changed since the last run into listing_daily_stats"""
+        from app import analytics
+
+        bookings, listings = analytics.refresh(full=full)
+        click.echo(f"Rolled up {bookings} changed bookings across {listings} listings "
+                   f"(watermark {analytics.get_watermark()}).")
+
+    @app.cli.command('backfill-amenity-masks')
+    def backfill_amenity_masks():
+        """Canonicalize listings.amenities and recompute amenity_mask from it"""
+        from app import amenity_index
+        from app.database import db
+
+        rows = db.execute_query("SELECT listing_id, amenities, amenity_mask FROM listings")
+        updated = 0
+        for row in rows:
+            names = (row['amenities'] or '').split(',')
+            amenities = amenity_index.normalize(names)
+            mask = amenity_index.to_mask(names)
+            if amenities != (row['amenities'] or '') or mask != row['amenity_mask']:
+                updated += db.execute_update(
+                    "UPDATE listings SET amenities = %s, amenity_mask = %s WHERE listing_id = %s",
+                    (amenities, mask, row['listing_id'])
+                )
+        click.echo(f"Updated amenities of {updated} of {len(rows)} listings.")
@@ -0,0 +1,50 @@
+"""
+Per-user counters for the profile statistics
+
+The profile page polls /api/profile/data for its stat cards. Each number is a
+COUNT(*) over an indexed column, all read in one round trip and cached per user
+for a short TTL. Writes that change a count call invalidate() for the users
+involved; the TTL bounds staleness for the rest (bulk deletes, other workers).
+"""
+from config import Config
+from app.cache import TTLCache
+from app.database import db
+
+counter_cache = TTLCache(max_entries=10000, default_ttl=Config.COUNTERS_CACHE_TTL)
+
+
+def _load(user_id):
+    query = """
+        SELECT
+            (SELECT COUNT(*) FROM favorites WHERE user_id = %s) AS favorites,
+            (SELECT COUNT(*) FROM reviews WHERE reviewer_id = %s) AS reviews,
+            (SELECT COUNT(*) FROM bookings WHERE user_id = %s) AS bookings,
+            (SELECT COUNT(*) FROM listings WHERE host_id = %s) AS properties,
+            (SELECT COUNT(*) FROM bookings b
+             JOIN listings l ON l.listing_id = b.listing_id
+             WHERE l.host_id = %s) AS host_bookings
+    """
+    rows = db.execute_query(query, (user_id,) * 5)
+    if not rows:
+        return None
+    return {name: int(value or 0) for name, value in rows[0].items()}
+
+
+def get_counts(user_id):
+    """Get {'favorites', 'reviews', 'bookings', 'properties', 'host_bookings'} for a user"""
+    counts = counter_cache.get(user_id)
+    if counts is None:
+        counts = _load(user_id)
+        if counts is None:
+            # Don't cache a failed read
+            return dict.fromkeys(('favorites', 'reviews', 'bookings', 'properties', 'host_bookings'), 0)
+        counter_cache.set(user_id, counts)
+    return counts
+
+
+def invalidate(*user_ids):
+    """Drop cached counts for these users once the current transaction (if any) commits"""
+    def drop():
+        for user_id in user_ids:
+            counter_cache.delete(user_id)
+    db.on_commit(drop)
@@ -1,14 +1,24 @@
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, pooling
+from mysql.connector.errors import PoolError
+from contextlib import contextmanager
 from config import Config
 import logging
 import time
 import threading
+from app import query_stats
 
 class Database:
     def __init__(self):
         self.connection = None
         self._lock = threading.Lock()
+        self._pool = None
+        self._pool_in_use = 0
+        self._pool_waiting = 0
+        # The pool raises as soon as it is empty; waiting on this first makes
+        # callers queue for a connection instead
+        self._pool_slots = threading.BoundedSemaphore(Config.MYSQL_POOL_SIZE)
+        self._local = threading.local()
         self.connect()
     
     def connect(self):
@@ -127,8 +137,153 @@ class Database:
         except Error as e:
             print(f"Error initializing schema: {e}")
     
+    def get_pool(self):
+        """Lazily create the connection pool used for transactions"""
+        with self._lock:
+            if self._pool is None:
+                self._pool = pooling.MySQLConnectionPool(
+                    pool_name='otithi_tx',
+                    pool_size=Config.MYSQL_POOL_SIZE,
+                    pool_reset_session=True,
+                    host=Config.MYSQL_HOST,
+                    port=Config.MYSQL_PORT,
+                    user=Config.MYSQL_USER,
+                    password=Config.MYSQL_PASSWORD,
+                    database=Config.MYSQL_DATABASE,
+                    autocommit=False,
+                    connection_timeout=60,
+                    charset='utf8mb4',
+                    collation='utf8mb4_unicode_ci',
+                    use_unicode=True
+                )
+            return self._pool
+    
+    @contextmanager
+    def transaction(self):
+        """Run several statements on one pinned connection and commit them once.
+        
+        While the block is active, execute_query/execute_insert/execute_update on
+        this thread go through the pinned connection and raise on error instead of
+        retrying, so a failure anywhere rolls the whole unit back. Nested calls
+        join the outer transaction.
+        """
+        if getattr(self._local, 'tx_connection', None) is not None:
+            self._local.tx_depth += 1
+            try:
+                yield self
+            finally:
+                self._local.tx_depth -= 1
+            return
+        
+        connection = self._checkout()
+        self._local.tx_connection = connection
+        self._local.tx_depth = 1
+        self._local.on_commit = []
+        try:
+            connection.start_transaction()
+            yield self
+            connection.commit()
+        except Exception:
+            try:
+                connection.rollback()
+            except Error as e:
+                print(f"Error rolling back transaction: {e}")
+            raise
+        finally:
+            self._local.tx_connection = None
+            self._local.tx_depth = 0
+            self._checkin(connection)
+        
+        callbacks, self._local.on_commit = self._local.on_commit, []
+        for callback in callbacks:
+            callback()
+    
+    def _checkout(self):
+        """Take a pool connection, waiting up to MYSQL_POOL_TIMEOUT seconds for one to free up"""
+        with self._lock:
+            self._pool_waiting += 1
+        try:
+            acquired = self._pool_slots.acquire(timeout=Config.MYSQL_POOL_TIMEOUT)
+        finally:
+            with self._lock:
+                self._pool_waiting -= 1
+        if not acquired:
+            raise PoolError(f"No pooled connection became free within {Config.MYSQL_POOL_TIMEOUT}s")
+        try:
+            connection = self.get_pool().get_connection()
+        except Exception:
+            self._pool_slots.release()
+            raise
+        with self._lock:
+            self._pool_in_use += 1
+        return connection
+    
+    def _checkin(self, connection):
+        try:
+            # Returns the connection to the pool
+            connection.close()
+        finally:
+            with self._lock:
+                self._pool_in_use -= 1
+            self._pool_slots.release()
+    
+    @contextmanager
+    def named_lock(self, name):
+        """Try to take a MySQL named lock (GET_LOCK) without waiting; yields whether it was taken.
+        
+        Named locks belong to a session, so the lock is taken and released on
+        a pool connection held for the whole block, never the shared one.
+        """
+        connection = self._checkout()
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute("SELECT GET_LOCK(%s, 0)", (name,))
+                locked = bool(cursor.fetchone()[0])
+                try:
+                    yield locked
+                finally:
+                    if locked:
+                        cursor.execute("SELECT RELEASE_LOCK(%s)", (name,))
+                        cursor.fetchone()
+            finally:
+                cursor.close()
+        finally:
+            self._checkin(connection)
+    
+    def on_commit(self, callback):
+        """Run callback once the current transaction commits, or right away outside one"""
+        if self.in_transaction():
+            self._local.on_commit.append(callback)
+        else:
+            callback()
+    
+    def in_transaction(self):
+        """Check whether the current thread is inside db.transaction()"""
+        return getattr(self._local, 'tx_connection', None) is not None
+    
+    def _execute_in_transaction(self, query, params, mode):
+        """Execute a statement on the pinned transaction connection"""
+        cursor = self._local.tx_connection.cursor(dictionary=True)
+        try:
+            started = time.perf_counter()
+            cursor.execute(query, params or ())
+            if mode == 'query':
+                result = cursor.fetchall()
+                query_stats.record(query, time.perf_counter() - started, len(result))
+                return result
+            query_stats.record(query, time.perf_counter() - started, cursor.rowcount)
+            if mode == 'insert':
+                return cursor.lastrowid
+            return cursor.rowcount
+        finally:
+            cursor.close()
+    
     def execute_query(self, query, params=None):
         """Execute a SELECT query with improved connection handling"""
+        if self.in_transaction():
+            return self._execute_in_transaction(query, params, 'query')
+        
         max_retries = 3
         for attempt in range(max_retries):
             try:
@@ -146,8 +301,10 @@ class Database:
                     return []
                 
                 cursor = self.connection.cursor(dictionary=True)
+                started = time.perf_counter()
                 cursor.execute(query, params or ())
                 result = cursor.fetchall()
+                query_stats.record(query, time.perf_counter() - started, len(result))
                 cursor.close()
                 return result
                 
@@ -167,6 +324,9 @@ class Database:
     
     def execute_insert(self, query, params=None):
         """Execute an INSERT query with improved connection handling"""
+        if self.in_transaction():
+            return self._execute_in_transaction(query, params, 'insert')
+        
         max_retries = 3
         for attempt in range(max_retries):
             try:
@@ -184,7 +344,9 @@ class Database:
                     return None
                 
                 cursor = self.connection.cursor(dictionary=True)
+                started = time.perf_counter()
                 cursor.execute(query, params or ())
+                query_stats.record(query, time.perf_counter() - started, cursor.rowcount)
                 last_id = cursor.lastrowid
                 cursor.close()
                 return last_id
@@ -205,6 +367,9 @@ class Database:
     
     def execute_update(self, query, params=None):
         """Execute an UPDATE/DELETE query with improved connection handling"""
+        if self.in_transaction():
+            return self._execute_in_transaction(query, params, 'update')
+        
         max_retries = 3
         for attempt in range(max_retries):
             try:
@@ -222,8 +387,10 @@ class Database:
                     return 0
                 
                 cursor = self.connection.cursor(dictionary=True)
+                started = time.perf_counter()
                 cursor.execute(query, params or ())
                 affected_rows = cursor.rowcount
+                query_stats.record(query, time.perf_counter() - started, affected_rows)
                 cursor.close()
                 return affected_rows
                 
@@ -276,6 +443,16 @@ class Database:
         except Exception:
             return "Connected but unhealthy"
     
+    def get_pool_status(self):
+        """Connection and pool state for health checks, without running queries"""
+        return {
+            'connected': self.connection is not None,
+            'pool_created': self._pool is not None,
+            'pool_size': Config.MYSQL_POOL_SIZE,
+            'in_use': self._pool_in_use,
+            'waiting': self._pool_waiting
+        }
+    
     def close(self):
         """Close database connection"""
         with self._lock:
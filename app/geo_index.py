@@ -0,0 +1,300 @@
+"""
+Grid index over listing coordinates for nearby and map-viewport search
+
+Listings are bucketed into CELL_DEGREES x CELL_DEGREES cells of latitude and
+longitude. A radius or bounding-box query visits only the cells the area
+covers, or the occupied cells when the area spans more cells than are
+occupied, then filters by exact position and sorts by great-circle
+distance. Listings without coordinates are not indexed.
+
+For the map, listings are clustered on a fixed grid per zoom level. At zoom
+z the world is split into 2^z x 2^z tiles of 360 / 2^z degrees, and each
+tile into CLUSTER_GRID x CLUSTER_GRID cells. A cell's cluster is its
+listings' count, centroid and lowest nightly price. A tile's clusters are
+computed once and cached by (zoom, x, y) until a listing on it changes, so
+a viewport costs a lookup per tile it overlaps and panning reuses the tiles
+already seen.
+
+The index is a ListingMirror (see app/listing_mirror.py) and follows
+listing_changed. Coordinates edited on a location row alone do not move the
+listing's updated_at and show up on the next full load.
+"""
+import heapq
+import math
+import threading
+from config import Config
+from app.cache import TTLCache
+from app.listing_mirror import ListingMirror, warmer
+from app.signals import listing_changed
+
+# About 5.5 km north to south
+CELL_DEGREES = 0.05
+
+# Map clusters: each tile is split into CLUSTER_GRID x CLUSTER_GRID cells,
+# down to tiles of 360 / 2^MAX_ZOOM degrees
+CLUSTER_GRID = 8
+MAX_ZOOM = 20
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Great-circle (haversine) distance between two points"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    """Points bucketed by fixed-size latitude/longitude cells"""
+
+    def __init__(self, cell_degrees=CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._points = {}  # id -> (lat, lon)
+        self._cells = {}   # (row, col) -> ids
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._points)
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees)
+
+    def load(self, points):
+        """Replace the whole index with (id, lat, lon) points"""
+        positions = {point_id: (lat, lon) for point_id, lat, lon in points}
+        cells = {}
+        for point_id, (lat, lon) in positions.items():
+            cells.setdefault(self._cell(lat, lon), set()).add(point_id)
+        with self._lock:
+            self._points = positions
+            self._cells = cells
+
+    def add(self, point_id, lat, lon):
+        with self._lock:
+            self._remove(point_id)
+            self._points[point_id] = (lat, lon)
+            self._cells.setdefault(self._cell(lat, lon), set()).add(point_id)
+
+    def remove(self, point_id):
+        with self._lock:
+            self._remove(point_id)
+
+    def _remove(self, point_id):
+        position = self._points.pop(point_id, None)
+        if position is None:
+            return
+        cell = self._cell(*position)
+        ids = self._cells[cell]
+        ids.discard(point_id)
+        if not ids:
+            del self._cells[cell]
+
+    def _in_box(self, south, west, north, east):
+        """(id, lat, lon) of the points inside a box; west > east crosses the antimeridian"""
+        if west > east:
+            return self._in_box(south, west, north, 180.0) + self._in_box(south, -180.0, north, east)
+        first_row, first_col = self._cell(south, west)
+        last_row, last_col = self._cell(north, east)
+        if (last_row - first_row + 1) * (last_col - first_col + 1) > len(self._cells):
+            cells = [ids for (row, col), ids in self._cells.items()
+                     if first_row <= row <= last_row and first_col <= col <= last_col]
+        else:
+            cells = [self._cells[(row, col)]
+                     for row in range(first_row, last_row + 1)
+                     for col in range(first_col, last_col + 1)
+                     if (row, col) in self._cells]
+        points = []
+        for ids in cells:
+            for point_id in ids:
+                lat, lon = self._points[point_id]
+                if south <= lat <= north and west <= lon <= east:
+                    points.append((point_id, lat, lon))
+        return points
+
+    def position(self, point_id):
+        """(lat, lon) of a point, or None"""
+        return self._points.get(point_id)
+
+    def points_in_box(self, south, west, north, east):
+        with self._lock:
+            return self._in_box(south, west, north, east)
+
+    def near(self, lat, lon, radius_km, limit):
+        """[(id, distance_km)] of the nearest points within radius_km, nearest first"""
+        lat_span = radius_km / KM_PER_DEGREE
+        south, north = max(lat - lat_span, -90.0), min(lat + lat_span, 90.0)
+        cos_lat = min(math.cos(math.radians(south)), math.cos(math.radians(north)))
+        if south == -90.0 or north == 90.0 or radius_km >= KM_PER_DEGREE * 180 * cos_lat:
+            west, east = -180.0, 180.0
+        else:
+            lon_span = radius_km / (KM_PER_DEGREE * cos_lat)
+            west = (lon - lon_span + 180) % 360 - 180
+            east = (lon + lon_span + 180) % 360 - 180
+        points = self.points_in_box(south, west, north, east)
+        hits = []
+        for point_id, point_lat, point_lon in points:
+            distance = distance_km(lat, lon, point_lat, point_lon)
+            if distance <= radius_km:
+                hits.append((distance, point_id))
+        return [(point_id, distance) for distance, point_id in heapq.nsmallest(limit, hits)]
+
+    def within(self, south, west, north, east, limit, origin=None):
+        """[(id, distance_km)] of points inside the box, nearest to origin (default: its centre) first"""
+        if origin is None:
+            center_lon = (west + east) / 2 if west <= east else (west + east + 360) / 2
+            origin = ((south + north) / 2, (center_lon + 180) % 360 - 180)
+        points = self.points_in_box(south, west, north, east)
+        hits = [(distance_km(origin[0], origin[1], lat, lon), point_id) for point_id, lat, lon in points]
+        return [(point_id, distance) for distance, point_id in heapq.nsmallest(limit, hits)]
+
+
+class GeoMirror(ListingMirror):
+    """Grid index over the coordinates of the active listings, with map clusters per tile"""
+
+    QUERY = """
+        SELECT l.listing_id, l.updated_at, l.price_per_night, loc.latitude, loc.longitude
+        FROM listings l
+        JOIN locations loc ON l.location_id = loc.location_id
+        WHERE l.is_active = 1
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.grid = GridIndex()
+        self.prices = {}
+        self.tile_cache = TTLCache(max_entries=Config.MAP_TILE_CACHE_MAX_ENTRIES, default_ttl=Config.MAP_TILE_CACHE_TTL)
+
+    @staticmethod
+    def _point(row):
+        if row['latitude'] is None or row['longitude'] is None:
+            return None
+        return row['listing_id'], float(row['latitude']), float(row['longitude'])
+
+    def _drop_tiles(self, position):
+        """Forget the cached tiles containing a position, at every zoom"""
+        if position is None:
+            return
+        lat, lon = position
+        for zoom in range(MAX_ZOOM + 1):
+            size = tile_degrees(zoom)
+            self.tile_cache.delete((zoom, int((lon + 180) // size), int((lat + 90) // size)))
+
+    def load(self, rows):
+        self.grid.load(point for point in map(self._point, rows) if point)
+        self.prices = {row['listing_id']: float(row['price_per_night']) for row in rows}
+        self.tile_cache.clear()
+
+    def index(self, row):
+        listing_id = row['listing_id']
+        self._drop_tiles(self.grid.position(listing_id))
+        point = self._point(row)
+        if point:
+            self.grid.add(*point)
+            self._drop_tiles(point[1:])
+        else:
+            self.grid.remove(listing_id)
+        self.prices[listing_id] = float(row['price_per_night'])
+
+    def unindex(self, listing_id):
+        self._drop_tiles(self.grid.position(listing_id))
+        self.grid.remove(listing_id)
+        self.prices.pop(listing_id, None)
+
+    def tile_clusters(self, zoom, x, y):
+        """[[lat, lon, count, min_price]] for tile (x, y) at zoom, cached until a listing on it changes"""
+        key = (zoom, x, y)
+        clusters = self.tile_cache.get(key)
+        if clusters is None:
+            clusters = self._cluster_tile(zoom, x, y)
+            self.tile_cache.set(key, clusters)
+        return clusters
+
+    def _cluster_tile(self, zoom, x, y):
+        size = tile_degrees(zoom)
+        cell = size / CLUSTER_GRID
+        south, west = y * size - 90, x * size - 180
+        points = self.grid.points_in_box(south, west, min(south + size, 90.0), min(west + size, 180.0))
+        buckets = {}
+        for listing_id, lat, lon in points:
+            row, col = int((lat + 90) // cell), int((lon + 180) // cell)
+            # A point on a tile edge belongs to the tile its cell is in
+            if row // CLUSTER_GRID != y or col // CLUSTER_GRID != x:
+                continue
+            price = self.prices.get(listing_id, 0.0)
+            bucket = buckets.get((row, col))
+            if bucket is None:
+                buckets[(row, col)] = [lat, lon, 1, price]
+            else:
+                bucket[0] += lat
+                bucket[1] += lon
+                bucket[2] += 1
+                bucket[3] = min(bucket[3], price)
+        return [[round(lat_sum / count, 5), round(lon_sum / count, 5), count, min_price]
+                for lat_sum, lon_sum, count, min_price in buckets.values()]
+
+
+def tile_degrees(zoom):
+    """Width and height in degrees of a map tile at zoom"""
+    return 360.0 / 2 ** zoom
+
+
+def _tile_ranges(south, west, north, east, zoom):
+    size = tile_degrees(zoom)
+    columns = 2 ** zoom
+    first_x, last_x = min(int((west + 180) // size), columns - 1), min(int((east + 180) // size), columns - 1)
+    if west > east:
+        xs = [range(first_x, columns), range(0, last_x + 1)]
+    else:
+        xs = [range(first_x, last_x + 1)]
+    ys = range(int((south + 90) // size), int((min(north, 90.0 - 1e-9) + 90) // size) + 1)
+    return xs, ys
+
+
+def tile_count(south, west, north, east, zoom):
+    """Number of tiles at zoom that cover a box"""
+    xs, ys = _tile_ranges(south, west, north, east, zoom)
+    return sum(len(columns) for columns in xs) * len(ys)
+
+
+def tiles_for_box(south, west, north, east, zoom):
+    """(x, y) of the tiles at zoom that cover a box; west > east crosses the antimeridian"""
+    xs, ys = _tile_ranges(south, west, north, east, zoom)
+    return [(x, y) for y in ys for columns in xs for x in columns]
+
+
+mirror = GeoMirror()
+warmer.register(mirror)
+
+
+def near(lat, lon, radius_km, limit):
+    """[(listing_id, distance_km)] within radius_km of a point, nearest first"""
+    mirror.ensure_current()
+    return mirror.grid.near(lat, lon, radius_km, limit)
+
+
+def within(south, west, north, east, limit, origin=None):
+    """[(listing_id, distance_km)] inside a bounding box, nearest to origin (default: its centre) first"""
+    mirror.ensure_current()
+    return mirror.grid.within(south, west, north, east, limit, origin)
+
+
+def clusters(south, west, north, east, zoom):
+    """[[lat, lon, count, min_price]] clustering the listings on the tiles at zoom that cover a box"""
+    mirror.ensure_current()
+    result = []
+    for x, y in tiles_for_box(south, west, north, east, zoom):
+        result.extend(mirror.tile_clusters(zoom, x, y))
+    return result
+
+
+def _on_listing_changed(sender, listing_id=None, reason=None, **extra):
+    if reason in ('created', 'updated'):
+        mirror.refresh_listing(listing_id)
+    elif reason == 'deleted':
+        mirror.remove_listing(listing_id)
+
+
+listing_changed.connect(_on_listing_changed)
@@ -0,0 +1,161 @@
+"""
+In-process structures mirrored from the active listings
+
+A mirror is loaded with one query on first use and then kept current in two
+ways. The owning module forwards listing_changed, so this worker's writes
+are re-read as soon as they commit. Every LISTING_INDEX_SYNC_INTERVAL
+seconds the mirror also re-reads the listings whose updated_at moved, which
+picks up other workers' writes, and drops the listings no longer active.
+
+Subclasses set QUERY, a SELECT over `listings l` returning l.listing_id and
+l.updated_at and ending in its WHERE clause, and implement load(rows),
+index(row) and unindex(listing_id). A mirror that also depends on other
+tables overrides SYNC_QUERY so its updated_at covers them too.
+
+Mirrors registered with `warmer` are loaded by a background thread as each
+worker starts and synced by it afterwards, so requests rarely pay for
+either. A caller that must not wait can check `ready` first.
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from config import Config
+from app.database import db
+from app.write_behind import BackgroundFlusher
+
+# Listings re-read per query while syncing
+SYNC_BATCH_SIZE = 500
+
+
+class ListingMirror(ABC):
+    """Base for in-process indexes over the active listings"""
+
+    QUERY = None
+    SYNC_QUERY = "SELECT listing_id, updated_at FROM listings WHERE is_active = 1"
+
+    def __init__(self, sync_interval=Config.LISTING_INDEX_SYNC_INTERVAL):
+        self.sync_interval = sync_interval
+        self._updated_at = {}
+        self._loaded = False
+        self._synced_at = 0.0
+        self._load_lock = threading.Lock()
+
+    @abstractmethod
+    def load(self, rows):
+        """Replace the whole mirror with these rows"""
+
+    @abstractmethod
+    def index(self, row):
+        """Add or replace one listing"""
+
+    @abstractmethod
+    def unindex(self, listing_id):
+        """Drop one listing"""
+
+    @property
+    def ready(self):
+        """Whether the mirror has been loaded in this process"""
+        return self._loaded
+
+    def ensure_current(self):
+        """Load on first use and sync once the interval has passed"""
+        if self._loaded and time.monotonic() - self._synced_at < self.sync_interval:
+            return
+        # One request loads or syncs; the rest keep using the mirror as it is
+        if not self._load_lock.acquire(blocking=not self._loaded):
+            return
+        try:
+            if not self._loaded:
+                rows = db.execute_query(self.QUERY)
+                self.load(rows)
+                self._updated_at = {row['listing_id']: row['updated_at'] for row in rows}
+                self._loaded = True
+            elif time.monotonic() - self._synced_at >= self.sync_interval:
+                self._sync()
+            self._synced_at = time.monotonic()
+        finally:
+            self._load_lock.release()
+
+    def _index(self, row):
+        self.index(row)
+        self._updated_at[row['listing_id']] = row['updated_at']
+
+    def _unindex(self, listing_id):
+        self.unindex(listing_id)
+        self._updated_at.pop(listing_id, None)
+
+    def _sync(self):
+        """Re-read listings written by other workers and drop the ones no longer active"""
+        rows = db.execute_query(self.SYNC_QUERY)
+        current = {row['listing_id']: row['updated_at'] for row in rows}
+        if not current and self._updated_at:
+            # An empty result is as likely a failed query as an empty catalog
+            return
+        for listing_id in set(self._updated_at) - set(current):
+            self._unindex(listing_id)
+        changed = [listing_id for listing_id, updated_at in current.items()
+                   if self._updated_at.get(listing_id) != updated_at]
+        for offset in range(0, len(changed), SYNC_BATCH_SIZE):
+            batch = changed[offset:offset + SYNC_BATCH_SIZE]
+            placeholders = ', '.join(['%s'] * len(batch))
+            for row in db.execute_query(f"{self.QUERY} AND l.listing_id IN ({placeholders})", tuple(batch)):
+                self._index(row)
+
+    def refresh_listing(self, listing_id):
+        if not self._loaded:
+            return
+        rows = db.execute_query(f"{self.QUERY} AND l.listing_id = %s", (listing_id,))
+        if rows:
+            self._index(rows[0])
+        else:
+            self._unindex(listing_id)
+
+    def remove_listing(self, listing_id):
+        if self._loaded:
+            self._unindex(listing_id)
+
+
+class MirrorWarmer(BackgroundFlusher):
+    """Loads registered mirrors in the background when a worker starts, then keeps them synced"""
+
+    thread_name = 'listing-mirror-warmer'
+
+    def __init__(self, interval=Config.LISTING_INDEX_SYNC_INTERVAL):
+        super().__init__(interval)
+        self._mirrors = []
+
+    def register(self, mirror):
+        if mirror not in self._mirrors:
+            self._mirrors.append(mirror)
+
+    def start(self):
+        self._ensure_thread()
+
+    def reset(self):
+        """Mirrors copied from the parent process are still valid"""
+
+    def flush(self):
+        for mirror in list(self._mirrors):
+            try:
+                # A pooled connection of its own: the shared one belongs to request threads
+                with db.transaction():
+                    mirror.ensure_current()
+            except Exception as e:
+                print(f"Error loading {type(mirror).__name__}: {e}")
+
+    def _run(self):
+        # Load right away rather than one interval after the worker starts
+        self.flush()
+        super()._run()
+
+
+warmer = MirrorWarmer()
+
+
+def init_app(app):
+    warmer.start()
+
+    @app.before_request
+    def start_mirror_warmer():
+        # Threads don't survive fork; this restarts the warmer in each worker
+        warmer.start()
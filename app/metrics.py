@@ -0,0 +1,244 @@
+"""
+Request timing middleware and a Prometheus-style /metrics endpoint
+
+/metrics is only served to clients in METRICS_ALLOWED_IPS (localhost by
+default) or presenting METRICS_TOKEN as a bearer token; anyone else gets a 404.
+"""
+import hmac
+import threading
+import time
+from flask import g, request, before_render_template, template_rendered
+from werkzeug.wsgi import ClosingIterator
+from config import Config
+
+# Latency buckets in seconds, shared by all histograms
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS_PATH = '/metrics'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values"""
+
+    def __init__(self, name, help_text, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                labels = list(zip(self.label_names, label_values))
+                for bound, count in zip(self.buckets, series['counts']):
+                    lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', bound)])} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', '+Inf')])} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {series['sum']:.6f}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {series['count']}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter keyed by a tuple of label values"""
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(list(zip(self.label_names, label_values)))} {value}")
+        return lines
+
+
+class Gauge:
+    """Single value gauge, either set directly or read from a callback"""
+
+    def __init__(self, name, help_text, callback=None):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self._value -= amount
+
+    def render(self):
+        value = self.callback() if self.callback else self._value
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class MetricsRegistry:
+    """All application metrics, rendered in the text exposition format"""
+
+    def __init__(self):
+        self.request_duration = Histogram(
+            'otithi_http_request_duration_seconds', 'Request latency by endpoint', ('endpoint', 'method'))
+        self.requests_total = Counter(
+            'otithi_http_requests_total', 'Completed requests by endpoint and status', ('endpoint', 'method', 'status'))
+        self.db_duration = Histogram(
+            'otithi_db_time_seconds', 'Time spent in SQL per request', ('endpoint',))
+        self.db_queries_total = Counter(
+            'otithi_db_queries_total', 'SQL statements executed by endpoint', ('endpoint',))
+        self.template_duration = Histogram(
+            'otithi_template_render_seconds', 'Template render time by template', ('template',))
+        self.in_flight = Gauge('otithi_http_requests_in_flight', 'Requests currently being served')
+        self.extra_gauges = []
+
+    def add_gauge(self, name, help_text, callback):
+        self.extra_gauges = [gauge for gauge in self.extra_gauges if gauge.name != name]
+        self.extra_gauges.append(Gauge(name, help_text, callback))
+
+    def render(self):
+        lines = []
+        for metric in (self.request_duration, self.requests_total, self.db_duration,
+                       self.db_queries_total, self.template_duration, self.in_flight, *self.extra_gauges):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """WSGI middleware that times every request and serves /metrics itself"""
+
+    def __init__(self, wsgi_app, metrics_registry, allowed_ips=(), token=''):
+        self.wsgi_app = wsgi_app
+        self.registry = metrics_registry
+        self.allowed_ips = frozenset(allowed_ips)
+        self.token = token
+
+    def _authorized(self, environ):
+        if environ.get('REMOTE_ADDR') in self.allowed_ips:
+            return True
+        if not self.token:
+            return False
+        header = environ.get('HTTP_AUTHORIZATION', '')
+        scheme, _, credentials = header.partition(' ')
+        return scheme.lower() == 'bearer' and hmac.compare_digest(credentials.strip().encode(), self.token.encode())
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO') == METRICS_PATH:
+            if not self._authorized(environ):
+                body = b'Not Found\n'
+                start_response('404 NOT FOUND', [
+                    ('Content-Type', 'text/plain; charset=utf-8'),
+                    ('Content-Length', str(len(body)))
+                ])
+                return [body]
+            body = self.registry.render().encode('utf-8')
+            start_response('200 OK', [
+                ('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'),
+                ('Content-Length', str(len(body))),
+                ('Cache-Control', 'no-store')
+            ])
+            return [body]
+
+        started = time.perf_counter()
+        status_holder = {}
+
+        def capture_status(status, headers, exc_info=None):
+            status_holder['status'] = status.split(' ', 1)[0]
+            return start_response(status, headers, exc_info)
+
+        self.registry.in_flight.inc()
+        try:
+            app_iter = self.wsgi_app(environ, capture_status)
+        except Exception:
+            self.registry.in_flight.dec()
+            raise
+
+        def finish():
+            self.registry.in_flight.dec()
+            endpoint = environ.get('otithi.endpoint', '<unmatched>')
+            method = environ.get('REQUEST_METHOD', 'GET')
+            self.registry.request_duration.observe((endpoint, method), time.perf_counter() - started)
+            self.registry.requests_total.inc((endpoint, method, status_holder.get('status', '500')))
+            if 'otithi.db_seconds' in environ:
+                self.registry.db_duration.observe((endpoint,), environ['otithi.db_seconds'])
+                self.registry.db_queries_total.inc((endpoint,), environ['otithi.db_queries'])
+
+        return ClosingIterator(app_iter, [finish])
+
+
+def _pool_saturated(pool_status):
+    return pool_status['in_use'] >= pool_status['pool_size']
+
+
+def init_app(app):
+    """Wrap the app with the timing middleware and hook endpoint/DB/template timings"""
+    from app.database import db
+
+    registry.add_gauge('otithi_db_pool_size', 'Connections in the transaction pool',
+                       lambda: db.get_pool_status()['pool_size'])
+    registry.add_gauge('otithi_db_pool_in_use', 'Transaction connections currently checked out',
+                       lambda: db.get_pool_status()['in_use'])
+    registry.add_gauge('otithi_db_pool_saturated', '1 while every transaction connection is checked out',
+                       lambda: int(_pool_saturated(db.get_pool_status())))
+    registry.add_gauge('otithi_db_pool_waiting', 'Callers waiting for a transaction connection',
+                       lambda: db.get_pool_status()['waiting'])
+
+    @app.before_request
+    def record_endpoint():
+        request.environ['otithi.endpoint'] = request.endpoint or '<unmatched>'
+
+    @app.teardown_request
+    def record_db_time(exc=None):
+        stats = g.get('query_stats')
+        if stats is not None:
+            request.environ['otithi.db_seconds'] = stats.total_ms / 1000
+            request.environ['otithi.db_queries'] = stats.count
+
+    def template_started(sender, template, context, **extra):
+        g.setdefault('template_timers', []).append(time.perf_counter())
+
+    def template_finished(sender, template, context, **extra):
+        timers = g.get('template_timers')
+        if timers:
+            registry.template_duration.observe((template.name or '<string>',), time.perf_counter() - timers.pop())
+
+    before_render_template.connect(template_started, app, weak=False)
+    template_rendered.connect(template_finished, app, weak=False)
+
+    app.wsgi_app = MetricsMiddleware(app.wsgi_app, registry,
+                                     allowed_ips=Config.METRICS_ALLOWED_IPS, token=Config.METRICS_TOKEN)
@@ -1,7 +1,17 @@
+import base64
+import hashlib
 from datetime import datetime, date, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from mysql.connector import IntegrityError, errorcode
+from config import Config
+from app.cache import TTLCache
 from app.database import db
+from app.signals import notify_listing_changed
+from app import amenity_index, counters, geo_index, pricing, read_receipts
+
+# user_id -> frozenset of favorited listing ids
+favorites_cache = TTLCache(max_entries=10000, default_ttl=Config.FAVORITES_CACHE_TTL)
 
 class User(UserMixin):
     def __init__(self, id, full_name, email, password_hash, phone=None, bio=None, user_type='guest', 
@@ -101,6 +111,41 @@ class User(UserMixin):
             )
         return None
     
+    @staticmethod
+    def get_many(user_ids):
+        """Get users by ID, in the order given, in one query"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return []
+        placeholders = ', '.join(['%s'] * len(user_ids))
+        query = f"""
+            SELECT u.*, ud.profile_photo, ud.phone, ud.bio, 
+                   ud.user_type, ud.join_date, ud.verified, ud.is_active,
+                   ud.created_at, ud.updated_at
+            FROM users u
+            LEFT JOIN user_details ud ON u.user_id = ud.user_id
+            WHERE u.user_id IN ({placeholders})
+        """
+        rows = {row['user_id']: row for row in db.execute_query(query, tuple(user_ids))}
+        users = []
+        for user_id in user_ids:
+            user_data = rows.get(user_id)
+            if user_data is None:
+                continue
+            users.append(User(
+                id=user_data['user_id'],
+                full_name=user_data['name'],
+                email=user_data['email'],
+                password_hash=user_data.get('password_hash', ''),
+                phone=user_data.get('phone', ''),
+                bio=user_data.get('bio', ''),
+                user_type=user_data.get('user_type', 'guest'),
+                profile_photo=user_data.get('profile_photo', ''),
+                joined_date=user_data.get('join_date'),
+                verified=user_data.get('verified', False)
+            ))
+        return users
+    
     @staticmethod
     def get_by_email(email):
         """Get user by email - Updated for new schema"""
@@ -135,23 +180,24 @@ class User(UserMixin):
         password_hash = generate_password_hash(password)
         
         try:
-            # First create user in users table
-            user_query = """
-                INSERT INTO users (name, email, password_hash)
-                VALUES (%s, %s, %s)
-            """
-            user_id = db.execute_insert(user_query, (full_name, email, password_hash))
-            
-            if user_id:
-                # Then create user details
-                details_query = """
-                    INSERT INTO user_details (user_id, phone, bio, user_type, join_date, verified, is_active)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+            # Both rows are written in one transaction so a user never exists without details
+            with db.transaction():
+                user_query = """
+                    INSERT INTO users (name, email, password_hash)
+                    VALUES (%s, %s, %s)
                 """
-                db.execute_insert(details_query, (
-                    user_id, phone, bio, user_type, datetime.now(), False, True
-                ))
+                user_id = db.execute_insert(user_query, (full_name, email, password_hash))
                 
+                if user_id:
+                    details_query = """
+                        INSERT INTO user_details (user_id, phone, bio, user_type, join_date, verified, is_active)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    """
+                    db.execute_insert(details_query, (
+                        user_id, phone, bio, user_type, datetime.now(), False, True
+                    ))
+            
+            if user_id:
                 return User.get(user_id)
         except Exception as e:
             print(f"Error creating user: {e}")
@@ -280,8 +326,9 @@ class User(UserMixin):
             user_values.append(self.id)
             success = db.execute_update(query, tuple(user_values))
         
-        # Update user_details table if needed
-        if details_updates and success:
+        # Update user_details table if needed; a name change also moves its
+        # updated_at, which versions the host section of listing pages
+        if (details_updates or user_updates) and success:
             details_updates.append("updated_at = %s")
             details_values.extend([datetime.now(), self.id])
             query = f"UPDATE user_details SET {', '.join(details_updates)} WHERE user_id = %s"
@@ -308,24 +355,32 @@ class User(UserMixin):
         try:
             print(f"DEBUG: Starting delete for user ID {self.id}")
             
-            # Delete associated reviews
-            print(f"DEBUG: Deleting reviews for user {self.id}")
-            db.execute_update("DELETE FROM reviews WHERE user_id = %s", (self.id,))
-            
-            # Delete associated bookings
-            print(f"DEBUG: Deleting bookings for user {self.id}")
-            db.execute_update("DELETE FROM bookings WHERE user_id = %s", (self.id,))
-            
-            # Delete listings if user is a host
-            print(f"DEBUG: Checking listings for user {self.id}")
-            listings = Listing.get_by_host(self.id)
-            for listing in listings:
-                print(f"DEBUG: Deleting listing {listing.id}")
-                listing.delete()
+            with db.transaction():
+                # Delete associated reviews
+                print(f"DEBUG: Deleting reviews for user {self.id}")
+                reviewed = db.execute_query("SELECT DISTINCT listing_id FROM reviews WHERE reviewer_id = %s", (self.id,))
+                db.execute_update("DELETE FROM reviews WHERE reviewer_id = %s", (self.id,))
+                Review.refresh_rating_stats([row['listing_id'] for row in reviewed])
+                for row in reviewed:
+                    notify_listing_changed(row['listing_id'], 'reviews')
+                
+                # Delete associated bookings
+                print(f"DEBUG: Deleting bookings for user {self.id}")
+                db.execute_update("DELETE FROM bookings WHERE user_id = %s", (self.id,))
+                
+                # Delete listings if user is a host
+                print(f"DEBUG: Checking listings for user {self.id}")
+                listings = Listing.get_by_host(self.id)
+                for listing in listings:
+                    print(f"DEBUG: Deleting listing {listing.id}")
+                    if not listing.delete():
+                        raise RuntimeError(f"Failed to delete listing {listing.id}")
+                
+                # Delete user
+                print(f"DEBUG: Deleting user record for {self.id}")
+                db.execute_update("DELETE FROM users WHERE user_id = %s", (self.id,))
+                counters.invalidate(self.id)
             
-            # Delete user
-            print(f"DEBUG: Deleting user record for {self.id}")
-            db.execute_update("DELETE FROM users WHERE user_id = %s", (self.id,))
             print(f"DEBUG: User {self.id} deleted successfully")
             return True
         except Exception as e:
@@ -606,6 +661,7 @@ class ListingImage:
         image_id = db.execute_insert(query, (listing_id, image_filename, image_order, is_primary, datetime.now()))
         
         if image_id:
+            notify_listing_changed(listing_id, 'images')
             return ListingImage.get(image_id)
         return None
 
@@ -650,18 +706,28 @@ class ListingImage:
     @staticmethod
     def set_primary(listing_id, image_id):
         """Set an image as primary (and unset others)"""
-        # First, unset all primary images for this listing
-        query1 = "UPDATE listing_images SET is_primary = FALSE WHERE listing_id = %s"
-        db.execute_update(query1, (listing_id,))
-        
-        # Then set the specified image as primary
-        query2 = "UPDATE listing_images SET is_primary = TRUE WHERE image_id = %s AND listing_id = %s"
-        return db.execute_update(query2, (image_id, listing_id))
+        try:
+            with db.transaction():
+                # First, unset all primary images for this listing
+                query1 = "UPDATE listing_images SET is_primary = FALSE WHERE listing_id = %s"
+                db.execute_update(query1, (listing_id,))
+                
+                # Then set the specified image as primary
+                query2 = "UPDATE listing_images SET is_primary = TRUE WHERE image_id = %s AND listing_id = %s"
+                updated = db.execute_update(query2, (image_id, listing_id))
+                notify_listing_changed(listing_id, 'images')
+                return updated
+        except Exception as e:
+            print(f"Error setting primary image: {e}")
+            return 0
 
     def delete(self):
         """Delete this image"""
         query = "DELETE FROM listing_images WHERE image_id = %s"
-        return db.execute_update(query, (self.id,))
+        deleted = db.execute_update(query, (self.id,))
+        if deleted:
+            notify_listing_changed(self.listing_id, 'images')
+        return deleted
 
 
 class Listing:
@@ -748,7 +814,7 @@ class Listing:
                 location_id=listing_data['location_id'],
                 property_type=listing_data['room_type'],
                 guests=listing_data['max_guests'],
-                amenities=listing_data['amenities'].split(',') if listing_data['amenities'] else [],
+                amenities=amenity_index.from_mask(listing_data['amenity_mask']),
                 created_date=listing_data['created_at'],
                 is_active=listing_data['is_active']
             )
@@ -767,35 +833,88 @@ class Listing:
             
             return listing
         return None
-    
+
+    @staticmethod
+    def get_version_stamp(listing_id):
+        """Get a cheap version stamp for everything the listing detail page shows.
+
+        Returns a dict with 'etag' (hash of the stamp) and 'last_modified' (latest update
+        time of the listing, its images, reviews, bookings and host profile), or None if
+        the listing doesn't exist. Counts are included so deletes change the stamp too,
+        and the host's name since users has no updated_at of its own.
+        """
+        query = """
+            SELECT l.updated_at AS listing_updated,
+                   loc.address, loc.city, loc.country, loc.latitude, loc.longitude,
+                   ud.updated_at AS host_updated, u.name AS host_name,
+                   (SELECT MAX(uploaded_at) FROM listing_images WHERE listing_id = l.listing_id) AS images_updated,
+                   (SELECT COUNT(*) FROM listing_images WHERE listing_id = l.listing_id) AS image_count,
+                   (SELECT MAX(image_id) FROM listing_images WHERE listing_id = l.listing_id AND is_primary = 1) AS primary_image,
+                   rs.updated_at AS reviews_updated, rs.review_count,
+                   (SELECT MAX(updated_at) FROM bookings WHERE listing_id = l.listing_id) AS bookings_updated,
+                   (SELECT COUNT(*) FROM bookings WHERE listing_id = l.listing_id) AS booking_count
+            FROM listings l
+            LEFT JOIN locations loc ON l.location_id = loc.location_id
+            LEFT JOIN users u ON u.user_id = l.host_id
+            LEFT JOIN user_details ud ON ud.user_id = l.host_id
+            LEFT JOIN listing_rating_stats rs ON rs.listing_id = l.listing_id
+            WHERE l.listing_id = %s AND l.is_active = 1
+        """
+        result = db.execute_query(query, (listing_id,))
+        if not result:
+            return None
+
+        stamp = result[0]
+        timestamps = [stamp[key] for key in ('listing_updated', 'host_updated', 'images_updated',
+                                             'reviews_updated', 'bookings_updated') if stamp[key]]
+        raw = '|'.join(str(stamp[key]) for key in sorted(stamp))
+        return {
+            'etag': hashlib.md5(f"{listing_id}|{raw}".encode('utf-8')).hexdigest(),
+            'last_modified': max(timestamps) if timestamps else None
+        }
+
+    @staticmethod
+    def get_pricing_basics(listing_id):
+        """Get the nightly price, guest limit and host of an active listing, or None"""
+        query = """
+            SELECT price_per_night, max_guests, host_id FROM listings
+            WHERE listing_id = %s AND is_active = 1
+        """
+        result = db.execute_query(query, (listing_id,))
+        return result[0] if result else None
+
     @staticmethod
     def get_all():
-        """Get all active listings with location, images, and host information"""
+        """Get all active listings with location, rating, images and host information in two queries"""
         query = """
             SELECT l.*, loc.address as location_address, loc.city as location_city, 
                    loc.country as location_country, loc.latitude, loc.longitude,
-                   u.name as host_name, u.email as host_email, ud.profile_photo as host_profile_photo
+                   u.name as host_name, u.email as host_email, ud.profile_photo as host_profile_photo,
+                   rs.review_count, rs.rating_sum
             FROM listings l 
             LEFT JOIN locations loc ON l.location_id = loc.location_id 
             LEFT JOIN users u ON l.host_id = u.user_id
             LEFT JOIN user_details ud ON u.user_id = ud.user_id
+            LEFT JOIN listing_rating_stats rs ON rs.listing_id = l.listing_id
             WHERE l.is_active = 1
             ORDER BY l.created_at DESC
         """
         results = db.execute_query(query)
+        
+        images = {}
+        for row in db.execute_query("""
+            SELECT li.listing_id, li.image_filename
+            FROM listing_images li
+            JOIN listings l ON l.listing_id = li.listing_id
+            WHERE l.is_active = 1
+            ORDER BY li.listing_id, li.is_primary DESC, li.image_order ASC
+        """):
+            images.setdefault(row['listing_id'], []).append(row['image_filename'])
+        
         listings = []
         for listing_data in results:
-            # Calculate rating and review count
-            rating_query = """
-                SELECT AVG(rating) as avg_rating, COUNT(*) as review_count 
-                FROM reviews WHERE listing_id = %s
-            """
-            rating_result = db.execute_query(rating_query, (listing_data['listing_id'],))
-            avg_rating = float(rating_result[0]['avg_rating']) if rating_result[0]['avg_rating'] else 0.0
-            review_count = rating_result[0]['review_count']
-            
-            # Get listing images
-            images = ListingImage.get_by_listing(listing_data['listing_id'])
+            review_count = listing_data['review_count'] or 0
+            avg_rating = float(listing_data['rating_sum']) / review_count if review_count else 0.0
             
             listing = Listing(
                 id=listing_data['listing_id'],
@@ -806,12 +925,12 @@ class Listing:
                 location_id=listing_data['location_id'],
                 property_type=listing_data['room_type'],
                 guests=listing_data['max_guests'],
-                amenities=listing_data['amenities'].split(',') if listing_data['amenities'] else [],
+                amenities=amenity_index.from_mask(listing_data['amenity_mask']),
                 created_date=listing_data['created_at'],
                 rating=avg_rating,
                 reviews_count=review_count,
                 available=True,
-                images=[img.image_filename for img in images],
+                images=images.get(listing_data['listing_id'], []),
                 is_active=bool(listing_data.get('is_active', 1))
             )
             
@@ -865,7 +984,7 @@ class Listing:
                 location_id=listing_data['location_id'],
                 property_type=listing_data['room_type'],
                 guests=listing_data['max_guests'],
-                amenities=listing_data['amenities'].split(',') if listing_data['amenities'] else [],
+                amenities=amenity_index.from_mask(listing_data['amenity_mask']),
                 created_date=listing_data['created_at'],
                 rating=avg_rating,
                 reviews_count=review_count,
@@ -884,6 +1003,169 @@ class Listing:
             listings.append(listing)
         return listings
     
+    @staticmethod
+    def get_host_portfolio(host_id, occupancy_days=30):
+        """Get all of a host's listings with their dashboard figures in four grouped queries.
+
+        Besides the usual fields, each Listing carries booking_count, pending_count,
+        upcoming_booked_nights and occupancy: the percentage of the next
+        occupancy_days nights that are booked.
+        """
+        query = """
+            SELECT l.*, loc.address, loc.city, loc.country, loc.latitude, loc.longitude,
+                   rs.review_count, rs.rating_sum
+            FROM listings l
+            LEFT JOIN locations loc ON l.location_id = loc.location_id
+            LEFT JOIN listing_rating_stats rs ON rs.listing_id = l.listing_id
+            WHERE l.host_id = %s
+            ORDER BY l.created_at DESC
+        """
+        results = db.execute_query(query, (host_id,))
+        if not results:
+            return []
+        
+        booking_counts = {row['listing_id']: row for row in db.execute_query("""
+            SELECT b.listing_id, COUNT(*) AS booking_count, SUM(b.status = 'pending') AS pending_count
+            FROM bookings b
+            JOIN listings l ON l.listing_id = b.listing_id
+            WHERE l.host_id = %s
+            GROUP BY b.listing_id
+        """, (host_id,))}
+        
+        today = date.today()
+        booked_nights = {row['listing_id']: row['nights'] for row in db.execute_query("""
+            SELECT bn.listing_id, COUNT(*) AS nights
+            FROM booking_nights bn
+            JOIN listings l ON l.listing_id = bn.listing_id
+            WHERE l.host_id = %s AND bn.night >= %s AND bn.night < %s
+            GROUP BY bn.listing_id
+        """, (host_id, today, today + timedelta(days=occupancy_days)))}
+        
+        images = {}
+        for row in db.execute_query("""
+            SELECT li.listing_id, li.image_filename
+            FROM listing_images li
+            JOIN listings l ON l.listing_id = li.listing_id
+            WHERE l.host_id = %s
+            ORDER BY li.listing_id, li.is_primary DESC, li.image_order ASC
+        """, (host_id,)):
+            images.setdefault(row['listing_id'], []).append(row['image_filename'])
+        
+        listings = []
+        for listing_data in results:
+            listing_id = listing_data['listing_id']
+            review_count = listing_data['review_count'] or 0
+            listing = Listing(
+                id=listing_id,
+                title=listing_data['title'],
+                description=listing_data['description'],
+                price=float(listing_data['price_per_night']),
+                host_id=listing_data['host_id'],
+                location_id=listing_data['location_id'],
+                property_type=listing_data['room_type'],
+                guests=listing_data['max_guests'],
+                amenities=amenity_index.from_mask(listing_data['amenity_mask']),
+                created_date=listing_data['created_at'],
+                rating=round(float(listing_data['rating_sum']) / review_count, 1) if review_count else 0.0,
+                reviews_count=review_count,
+                available=bool(listing_data.get('is_active', 1)),
+                images=images.get(listing_id, []),
+                is_active=bool(listing_data.get('is_active', 1))
+            )
+            
+            listing.address = listing_data.get('address', '')
+            listing.city = listing_data.get('city', '')
+            listing.country = listing_data.get('country', '')
+            listing.location = f"{listing.city}, {listing.country}" if listing.city and listing.country else ""
+            listing.latitude = float(listing_data['latitude']) if listing_data['latitude'] else None
+            listing.longitude = float(listing_data['longitude']) if listing_data['longitude'] else None
+            
+            counts = booking_counts.get(listing_id, {})
+            listing.booking_count = counts.get('booking_count', 0)
+            listing.pending_count = int(counts.get('pending_count') or 0)
+            listing.upcoming_booked_nights = booked_nights.get(listing_id, 0)
+            listing.occupancy = round(100 * listing.upcoming_booked_nights / occupancy_days) if occupancy_days else 0
+            listings.append(listing)
+        return listings
+    
+    @staticmethod
+    def get_many(listing_ids):
+        """Get active listings by ID, in the order given, with location, rating and images in two queries"""
+        listing_ids = list(listing_ids)
+        if not listing_ids:
+            return []
+        placeholders = ', '.join(['%s'] * len(listing_ids))
+        query = f"""
+            SELECT l.*, loc.address, loc.city, loc.country, loc.latitude, loc.longitude,
+                   rs.review_count, rs.rating_sum
+            FROM listings l
+            LEFT JOIN locations loc ON l.location_id = loc.location_id
+            LEFT JOIN listing_rating_stats rs ON rs.listing_id = l.listing_id
+            WHERE l.listing_id IN ({placeholders}) AND l.is_active = 1
+        """
+        rows = {row['listing_id']: row for row in db.execute_query(query, tuple(listing_ids))}
+        
+        images = {}
+        for row in db.execute_query(f"""
+            SELECT listing_id, image_filename
+            FROM listing_images
+            WHERE listing_id IN ({placeholders})
+            ORDER BY listing_id, is_primary DESC, image_order ASC
+        """, tuple(listing_ids)):
+            images.setdefault(row['listing_id'], []).append(row['image_filename'])
+        
+        listings = []
+        for listing_id in listing_ids:
+            listing_data = rows.get(listing_id)
+            if listing_data is None:
+                continue
+            review_count = listing_data['review_count'] or 0
+            listing = Listing(
+                id=listing_id,
+                title=listing_data['title'],
+                description=listing_data['description'],
+                price=float(listing_data['price_per_night']),
+                host_id=listing_data['host_id'],
+                location_id=listing_data['location_id'],
+                property_type=listing_data['room_type'],
+                guests=listing_data['max_guests'],
+                amenities=amenity_index.from_mask(listing_data['amenity_mask']),
+                created_date=listing_data['created_at'],
+                rating=round(float(listing_data['rating_sum']) / review_count, 1) if review_count else 0.0,
+                reviews_count=review_count,
+                available=True,
+                images=images.get(listing_id, []),
+                is_active=True
+            )
+            
+            listing.address = listing_data.get('address', '')
+            listing.city = listing_data.get('city', '')
+            listing.country = listing_data.get('country', '')
+            listing.location = f"{listing.city}, {listing.country}" if listing.city and listing.country else ""
+            listing.latitude = float(listing_data['latitude']) if listing_data['latitude'] is not None else None
+            listing.longitude = float(listing_data['longitude']) if listing_data['longitude'] is not None else None
+            listings.append(listing)
+        return listings
+    
+    @staticmethod
+    def _with_distances(hits):
+        """Listings for [(listing_id, distance_km)] hits, in order, each with distance_km set"""
+        distances = dict(hits)
+        listings = Listing.get_many(distances)
+        for listing in listings:
+            listing.distance_km = round(distances[listing.id], 2)
+        return listings
+    
+    @staticmethod
+    def search_near(latitude, longitude, radius_km=10, limit=50):
+        """Get active listings within radius_km of a point, nearest first"""
+        return Listing._with_distances(geo_index.near(latitude, longitude, radius_km, limit))
+    
+    @staticmethod
+    def search_bbox(south, west, north, east, limit=50, origin=None):
+        """Get active listings inside a bounding box, nearest to origin (default: the box centre) first"""
+        return Listing._with_distances(geo_index.within(south, west, north, east, limit, origin))
+    
     @staticmethod
     def create(title, description, price, host_id, location_id, property_type='entire_place',
                guests=1, amenities=None):
@@ -900,7 +1182,8 @@ class Listing:
             f.write(f"  property_type: {property_type}\n")
             f.write(f"  guests: {guests}\n")
             
-        amenities_str = ','.join(amenities) if amenities else ''
+        amenities_str = amenity_index.normalize(amenities or [])
+        amenity_mask = amenity_index.to_mask(amenities or [])
         
         # Validate that location_id is provided
         if not location_id:
@@ -912,8 +1195,8 @@ class Listing:
         # Create the listing with the simplified schema
         listing_query = """
             INSERT INTO listings (host_id, title, description, room_type, price_per_night, 
-                                max_guests, amenities, location_id, created_at, is_active)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                                max_guests, amenities, amenity_mask, location_id, created_at, is_active)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         """
         
         try:
@@ -930,37 +1213,30 @@ class Listing:
                 f.write(f"  created_at: {datetime.now()}\\n")
                 f.write(f"  is_active: True\\n")
                 
-            listing_id = db.execute_insert(listing_query, (
-                host_id, title, description, property_type, price, guests, 
-                amenities_str, location_id, datetime.now(), True
-            ))
-            
-            with open('/tmp/otithi_debug.log', 'a') as f:
-                f.write(f"SQL execution result: listing_id = {listing_id}\\n")
-            
-            if listing_id:
-                # Update the location with the listing_id to create bidirectional relationship
-                try:
+            # The listing row and the location back-reference commit together
+            with db.transaction():
+                listing_id = db.execute_insert(listing_query, (
+                    host_id, title, description, property_type, price, guests, 
+                    amenities_str, amenity_mask, location_id, datetime.now(), True
+                ))
+                
+                with open('/tmp/otithi_debug.log', 'a') as f:
+                    f.write(f"SQL execution result: listing_id = {listing_id}\\n")
+                
+                if listing_id:
+                    # Update the location with the listing_id to create bidirectional relationship
                     update_location_query = "UPDATE locations SET listing_id = %s WHERE location_id = %s"
                     rows_updated = db.execute_update(update_location_query, (listing_id, location_id))
                     
                     with open('/tmp/otithi_debug.log', 'a') as f:
                         f.write(f"Updated location {location_id} with listing_id {listing_id}. Rows affected: {rows_updated}\\n")
-                    
-                    if rows_updated > 0:
-                        with open('/tmp/otithi_debug.log', 'a') as f:
-                            f.write(f"SUCCESS: Listing created with ID {listing_id} and location updated\\n")
-                        return Listing.get(listing_id)
-                    else:
-                        with open('/tmp/otithi_debug.log', 'a') as f:
-                            f.write(f"WARNING: Listing created but location update failed\\n")
-                        return Listing.get(listing_id)  # Still return the listing even if location update fails
-                        
-                except Exception as update_error:
-                    with open('/tmp/otithi_debug.log', 'a') as f:
-                        f.write(f"ERROR updating location with listing_id: {str(update_error)}\\n")
-                    # Still return the listing even if location update fails
-                    return Listing.get(listing_id)
+            
+            if listing_id:
+                with open('/tmp/otithi_debug.log', 'a') as f:
+                    f.write(f"SUCCESS: Listing created with ID {listing_id}\\n")
+                notify_listing_changed(listing_id, 'created')
+                counters.invalidate(host_id)
+                return Listing.get(listing_id)
             else:
                 with open('/tmp/otithi_debug.log', 'a') as f:
                     f.write("ERROR: No listing_id returned from database\\n")
@@ -976,63 +1252,57 @@ class Listing:
     def is_available(self, check_in, check_out):
         """Check if listing is available for given dates"""
         query = """
-            SELECT COUNT(*) as count FROM bookings 
-            WHERE listing_id = %s AND status != 'cancelled' 
-            AND ((check_in <= %s AND check_out > %s) OR (check_in < %s AND check_out >= %s))
+            SELECT 1 FROM booking_nights
+            WHERE listing_id = %s AND night >= %s AND night < %s
+            LIMIT 1
         """
-        result = db.execute_query(query, (self.id, check_in, check_in, check_out, check_out))
-        return result[0]['count'] == 0 if result else False
+        return not db.execute_query(query, (self.id, check_in, check_out))
     
-    def get_unavailable_dates(self):
-        """Get list of unavailable dates"""
+    @staticmethod
+    def get_unavailable_listing_ids(check_in, check_out):
+        """Get the ids of all listings with at least one booked night in [check_in, check_out)"""
         query = """
-            SELECT check_in, check_out FROM bookings 
-            WHERE listing_id = %s AND status != 'cancelled'
+            SELECT DISTINCT listing_id FROM booking_nights
+            WHERE night >= %s AND night < %s
+        """
+        results = db.execute_query(query, (check_in, check_out))
+        return {row['listing_id'] for row in results}
+    
+    @staticmethod
+    def get_booked_ranges(listing_id, start, end):
+        """Get merged [start, end) date ranges booked within the window [start, end).
+
+        Returns a list of (start, end) date tuples clipped to the window, or None if
+        the listing doesn't exist.
         """
-        results = db.execute_query(query, (self.id,))
-        unavailable_dates = []
+        query = """
+            SELECT b.check_in, b.check_out
+            FROM listings l
+            LEFT JOIN bookings b ON b.listing_id = l.listing_id AND b.status != 'cancelled'
+                AND b.check_in < %s AND b.check_out > %s
+            WHERE l.listing_id = %s AND l.is_active = 1
+            ORDER BY b.check_in
+        """
+        results = db.execute_query(query, (end, start, listing_id))
+        if not results:
+            return None
         
-        for booking in results:
-            try:
-                # Get the date values
-                check_in_date = booking['check_in']
-                check_out_date = booking['check_out']
-                
-                # Convert datetime to date if needed
-                if hasattr(check_in_date, 'date') and not isinstance(check_in_date, date):
-                    check_in_date = check_in_date.date()
-                if hasattr(check_out_date, 'date') and not isinstance(check_out_date, date):
-                    check_out_date = check_out_date.date()
-                
-                # Generate all dates in the range using date arithmetic
-                current = check_in_date
-                one_day = timedelta(days=1)  # Use the module-level import
-                
-                while current < check_out_date:
-                    unavailable_dates.append(current.strftime('%Y-%m-%d'))
-                    current = current + one_day
-                    
-            except Exception:
-                # Skip any problematic booking records
+        ranges = []
+        for row in results:
+            if row['check_in'] is None:
                 continue
-                
-        return unavailable_dates
+            range_start = max(row['check_in'], start)
+            range_end = min(row['check_out'], end)
+            if ranges and range_start <= ranges[-1][1]:
+                # Overlapping or back-to-back stays merge into one range
+                ranges[-1] = (ranges[-1][0], max(ranges[-1][1], range_end))
+            else:
+                ranges.append((range_start, range_end))
+        return ranges
     
     def calculate_total_price(self, check_in, check_out, guests=1):
         """Calculate total price for booking"""
-        nights = (check_out - check_in).days
-        base_price = self.price * nights
-        cleaning_fee = 500  # Fixed cleaning fee
-        service_fee = base_price * 0.15  # 15% service fee
-        total = base_price + cleaning_fee + service_fee
-        
-        return {
-            'nights': nights,
-            'base_price': base_price,
-            'cleaning_fee': cleaning_fee,
-            'service_fee': service_fee,
-            'total': total
-        }
+        return pricing.quote(self.id, self.price, check_in, check_out, guests)
     
     def update(self, title=None, description=None, price=None, property_type=None, guests=None, amenities=None):
         """Update listing details"""
@@ -1065,28 +1335,37 @@ class Listing:
             self.guests = guests
             
         if amenities:
-            amenities_str = ','.join(amenities) if isinstance(amenities, list) else amenities
+            names = amenities if isinstance(amenities, list) else amenities.split(',')
+            amenity_mask = amenity_index.to_mask(names)
             update_fields.append("amenities = %s")
-            update_values.append(amenities_str)
-            self.amenities = amenities if isinstance(amenities, list) else amenities.split(',')
+            update_values.append(amenity_index.normalize(names))
+            update_fields.append("amenity_mask = %s")
+            update_values.append(amenity_mask)
+            self.amenities = amenity_index.from_mask(amenity_mask)
         
         if update_fields:
             query = f"UPDATE listings SET {', '.join(update_fields)} WHERE listing_id = %s"
             update_values.append(self.id)
-            return db.execute_update(query, tuple(update_values))
+            updated = db.execute_update(query, tuple(update_values))
+            notify_listing_changed(self.id, 'updated')
+            return updated
         return True
     
     def delete(self):
         """Delete listing and all associated data"""
         try:
-            # Delete associated reviews
-            db.execute_update("DELETE FROM reviews WHERE listing_id = %s", (self.id,))
-            
-            # Delete associated bookings
-            db.execute_update("DELETE FROM bookings WHERE listing_id = %s", (self.id,))
-            
-            # Delete listing
-            db.execute_update("DELETE FROM listings WHERE listing_id = %s", (self.id,))
+            with db.transaction():
+                # Delete associated reviews and their rating summary
+                db.execute_update("DELETE FROM reviews WHERE listing_id = %s", (self.id,))
+                db.execute_update("DELETE FROM listing_rating_stats WHERE listing_id = %s", (self.id,))
+                
+                # Delete associated bookings
+                db.execute_update("DELETE FROM bookings WHERE listing_id = %s", (self.id,))
+                
+                # Delete listing
+                db.execute_update("DELETE FROM listings WHERE listing_id = %s", (self.id,))
+                notify_listing_changed(self.id, 'deleted')
+                counters.invalidate(self.host_id)
             return True
         except Exception as e:
             print(f"Error deleting listing: {e}")
@@ -1103,6 +1382,10 @@ class Listing:
         query = "UPDATE listings SET approved = TRUE WHERE listing_id = %s"
         return db.execute_update(query, (self.id,))
 
+class DuplicateReviewError(Exception):
+    """Raised by Review.create when the reviewer already reviewed the listing"""
+
+
 class Review:
     def __init__(self, id, listing_id, user_id, rating, comment, created_date=None, booking_id=None):
         self.id = id
@@ -1118,10 +1401,14 @@ class Review:
         self.booking_id = booking_id
     
     @staticmethod
-    def get_all():
-        """Get all reviews"""
-        query = "SELECT * FROM reviews ORDER BY review_date DESC"
-        results = db.execute_query(query)
+    def get_all(limit=None):
+        """Get all reviews, newest first (only the newest `limit` if given)"""
+        query = "SELECT * FROM reviews ORDER BY review_date DESC, review_id DESC"
+        params = None
+        if limit:
+            query += " LIMIT %s"
+            params = (int(limit),)
+        results = db.execute_query(query, params)
         reviews = []
         for review_data in results:
             reviews.append(Review(
@@ -1135,17 +1422,32 @@ class Review:
         return reviews
     
     @staticmethod
-    def get_by_listing(listing_id):
-        """Get all reviews for a listing with user names and profile photos"""
-        query = """
+    def get_by_listing(listing_id, limit=None, cursor=None):
+        """Get reviews for a listing with user names and profile photos, newest first.
+
+        With limit, returns one page; pass Review.encode_cursor() of the last review
+        of a page as cursor to get the next one.
+        """
+        conditions = ["r.listing_id = %s"]
+        params = [listing_id]
+        if cursor:
+            review_date, review_id = Review.decode_cursor(cursor)
+            conditions.append("(r.review_date < %s OR (r.review_date = %s AND r.review_id < %s))")
+            params.extend([review_date, review_date, review_id])
+        
+        query = f"""
             SELECT r.*, u.name as user_name, ud.profile_photo 
             FROM reviews r 
             LEFT JOIN users u ON r.reviewer_id = u.user_id 
             LEFT JOIN user_details ud ON u.user_id = ud.user_id
-            WHERE r.listing_id = %s 
-            ORDER BY r.review_date DESC
+            WHERE {' AND '.join(conditions)}
+            ORDER BY r.review_date DESC, r.review_id DESC
         """
-        results = db.execute_query(query, (listing_id,))
+        if limit:
+            query += " LIMIT %s"
+            params.append(int(limit))
+        
+        results = db.execute_query(query, tuple(params))
         reviews = []
         for review_data in results:
             review = Review(
@@ -1163,34 +1465,153 @@ class Review:
         return reviews
     
     @staticmethod
-    def get_by_user(user_id):
-        """Get all reviews written by a user"""
-        query = "SELECT * FROM reviews WHERE reviewer_id = %s ORDER BY review_date DESC"
-        results = db.execute_query(query, (user_id,))
+    def encode_cursor(review):
+        """Opaque pagination cursor pointing just past the given review"""
+        raw = f"{review.review_date.isoformat()}|{review.id}"
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+    
+    @staticmethod
+    def decode_cursor(cursor):
+        """Parse a cursor from encode_cursor(); raises ValueError if it is malformed"""
+        try:
+            review_date, review_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+            return datetime.fromisoformat(review_date), int(review_id)
+        except (TypeError, UnicodeError, ValueError) as e:
+            raise ValueError(f"Invalid review cursor: {e}")
+    
+    @staticmethod
+    def star_bucket(rating):
+        """Histogram bucket (1-5 stars) for a rating, matching SQL ROUND()"""
+        return min(5, max(1, int(float(rating) + 0.5)))
+    
+    @staticmethod
+    def get_rating_stats(listing_id):
+        """Get a listing's review count, average rating and 1-5 star histogram"""
+        query = "SELECT * FROM listing_rating_stats WHERE listing_id = %s"
+        result = db.execute_query(query, (listing_id,))
+        row = result[0] if result else None
+        count = row['review_count'] if row else 0
+        return {
+            'count': count,
+            'average': float(row['rating_sum']) / count if count else 0.0,
+            'histogram': {stars: (row[f'stars_{stars}'] if row else 0) for stars in range(5, 0, -1)}
+        }
+    
+    @staticmethod
+    def refresh_rating_stats(listing_ids=None):
+        """Recompute listing_rating_stats from the reviews table (all listings if listing_ids is None)"""
+        filter_sql = ""
+        params = ()
+        if listing_ids is not None:
+            listing_ids = list(listing_ids)
+            if not listing_ids:
+                return 0
+            filter_sql = f"WHERE listing_id IN ({', '.join(['%s'] * len(listing_ids))})"
+            params = tuple(listing_ids)
+        
+        bucket = "LEAST(5, GREATEST(1, ROUND(rating)))"
+        with db.transaction():
+            db.execute_update(f"DELETE FROM listing_rating_stats {filter_sql}", params)
+            return db.execute_update(f"""
+                INSERT INTO listing_rating_stats
+                    (listing_id, review_count, rating_sum, stars_1, stars_2, stars_3, stars_4, stars_5)
+                SELECT listing_id, COUNT(*), SUM(rating),
+                       SUM({bucket} = 1), SUM({bucket} = 2), SUM({bucket} = 3),
+                       SUM({bucket} = 4), SUM({bucket} = 5)
+                FROM reviews
+                {filter_sql}{' AND' if filter_sql else 'WHERE'} rating IS NOT NULL
+                GROUP BY listing_id
+            """, params)
+    
+    @staticmethod
+    def get_by_user(user_id, limit=None, cursor=None):
+        """Get reviews written by a user with their listing's title and location, newest first.
+
+        Pages the same way as get_by_listing. Reviews of deleted listings keep
+        listing_title None.
+        """
+        conditions = ["r.reviewer_id = %s"]
+        params = [user_id]
+        if cursor:
+            review_date, review_id = Review.decode_cursor(cursor)
+            conditions.append("(r.review_date < %s OR (r.review_date = %s AND r.review_id < %s))")
+            params.extend([review_date, review_date, review_id])
+        
+        query = f"""
+            SELECT r.*, l.title AS listing_title, loc.city, loc.country
+            FROM reviews r
+            LEFT JOIN listings l ON l.listing_id = r.listing_id
+            LEFT JOIN locations loc ON loc.location_id = l.location_id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY r.review_date DESC, r.review_id DESC
+        """
+        if limit:
+            query += " LIMIT %s"
+            params.append(int(limit))
+        
+        results = db.execute_query(query, tuple(params))
         reviews = []
         for review_data in results:
-            reviews.append(Review(
+            review = Review(
                 id=review_data['review_id'],
                 listing_id=review_data['listing_id'],
                 user_id=review_data['reviewer_id'],
                 rating=float(review_data['rating']),
                 comment=review_data['comments'],
                 created_date=review_data['review_date']
-            ))
+            )
+            review.listing_title = review_data['listing_title']
+            review.listing_location = f"{review_data['city']}, {review_data['country']}" if review_data['city'] else ''
+            reviews.append(review)
         return reviews
+    
+    @staticmethod
+    def count_by_user(user_id):
+        """Count the reviews a user has written"""
+        result = db.execute_query("SELECT COUNT(*) AS count FROM reviews WHERE reviewer_id = %s", (user_id,))
+        return result[0]['count'] if result else 0
 
     @staticmethod
     def create(listing_id, user_id, rating, comment, booking_id=None):
-        """Create a new review"""
+        """Create a new review.
+
+        Each guest can review a listing once; the unique (listing_id, reviewer_id)
+        key enforces it and a second attempt raises DuplicateReviewError.
+        """
         query = """
             INSERT INTO reviews (reviewer_id, listing_id, booking_id, rating, comments, review_date)
             VALUES (%s, %s, %s, %s, %s, %s)
         """
-        review_id = db.execute_insert(query, (user_id, listing_id, booking_id, rating, comment, datetime.now()))
+        try:
+            with db.transaction():
+                review_id = db.execute_insert(query, (user_id, listing_id, booking_id, rating, comment, datetime.now()))
+                if rating is not None:
+                    stars_column = f"stars_{Review.star_bucket(rating)}"
+                    db.execute_update(f"""
+                        INSERT INTO listing_rating_stats (listing_id, review_count, rating_sum, {stars_column})
+                        VALUES (%s, 1, %s, 1)
+                        ON DUPLICATE KEY UPDATE review_count = review_count + 1,
+                            rating_sum = rating_sum + VALUES(rating_sum),
+                            {stars_column} = {stars_column} + 1
+                    """, (listing_id, rating))
+                notify_listing_changed(listing_id, 'reviews')
+                counters.invalidate(user_id)
+        except IntegrityError as e:
+            if e.errno == errorcode.ER_DUP_ENTRY:
+                raise DuplicateReviewError(f"User {user_id} has already reviewed listing {listing_id}")
+            print(f"Error creating review: {e}")
+            return None
+        except Exception as e:
+            print(f"Error creating review: {e}")
+            return None
         
-        if review_id:
-            return Review.get(review_id)
-        return None
+        return Review.get(review_id)
+    
+    @staticmethod
+    def exists(listing_id, user_id):
+        """Check if a user has already reviewed a listing"""
+        query = "SELECT 1 FROM reviews WHERE listing_id = %s AND reviewer_id = %s LIMIT 1"
+        return bool(db.execute_query(query, (listing_id, user_id)))
     
     @staticmethod
     def get(review_id):
@@ -1213,9 +1634,8 @@ class Review:
     @staticmethod
     def has_user_reviewed_booking(user_id, booking_id):
         """Check if a user has already reviewed a specific booking"""
-        query = "SELECT * FROM reviews WHERE reviewer_id = %s AND booking_id = %s"
-        result = db.execute_query(query, (user_id, booking_id))
-        return len(result) > 0
+        query = "SELECT 1 FROM reviews WHERE booking_id = %s AND reviewer_id = %s LIMIT 1"
+        return bool(db.execute_query(query, (booking_id, user_id)))
     
     @staticmethod
     def get_by_booking(booking_id):
@@ -1356,32 +1776,84 @@ class Booking:
             ))
         return bookings
     
+    @staticmethod
+    def nights(check_in, check_out):
+        """Every night of a stay, check-in inclusive and check-out exclusive"""
+        return [check_in + timedelta(days=offset) for offset in range((check_out - check_in).days)]
+    
+    @staticmethod
+    def claim_nights(booking_id, listing_id, check_in, check_out):
+        """Insert the booking's rows into booking_nights.
+
+        Raises IntegrityError if any night is already held by another booking.
+        """
+        nights = Booking.nights(check_in, check_out)
+        if not nights:
+            return 0
+        placeholders = ', '.join(['(%s, %s, %s)'] * len(nights))
+        params = []
+        for night in nights:
+            params.extend([listing_id, night, booking_id])
+        query = f"INSERT INTO booking_nights (listing_id, night, booking_id) VALUES {placeholders}"
+        return db.execute_update(query, tuple(params))
+    
+    @staticmethod
+    def release_nights(booking_id):
+        """Free every night held by a booking"""
+        return db.execute_update("DELETE FROM booking_nights WHERE booking_id = %s", (booking_id,))
+    
     @staticmethod
     def create(listing_id, user_id, check_in, check_out, guests=1):
-        """Create a new booking"""
-        listing = Listing.get(listing_id)
-        if not listing:
+        """Create a new booking, atomically claiming its nights.
+
+        The booking row and its booking_nights rows are written in one transaction;
+        the (listing_id, night) primary key rejects any overlap, so reservations for
+        different dates of the same listing never wait on each other. Returns None if
+        the listing doesn't exist or the dates are taken.
+        """
+        if check_out <= check_in:
             return None
-        
-        # Check availability
-        if not listing.is_available(check_in, check_out):
+        try:
+            with db.transaction():
+                rows = db.execute_query(
+                    "SELECT price_per_night, host_id FROM listings WHERE listing_id = %s AND is_active = 1",
+                    (listing_id,)
+                )
+                if not rows:
+                    return None
+                
+                price_breakdown = pricing.quote(listing_id, rows[0]['price_per_night'], check_in, check_out, guests)
+                total_price = price_breakdown['total']
+                created_at = datetime.now()
+                
+                # MariaDB has no INSERT ... RETURNING, so the booking is built from the values we insert
+                query = """
+                    INSERT INTO bookings (user_id, listing_id, check_in, check_out, guests, total_price, created_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """
+                booking_id = db.execute_insert(query, (
+                    user_id, listing_id, check_in, check_out, guests, total_price, created_at
+                ))
+                Booking.claim_nights(booking_id, listing_id, check_in, check_out)
+                counters.invalidate(user_id, rows[0]['host_id'])
+        except IntegrityError:
+            # Another booking already holds at least one of these nights
+            return None
+        except Exception as e:
+            print(f"Error creating booking: {e}")
             return None
         
-        # Calculate price with proper guest count
-        price_breakdown = listing.calculate_total_price(check_in, check_out, guests)
-        total_price = price_breakdown['total']
-        
-        query = """
-            INSERT INTO bookings (user_id, listing_id, check_in, check_out, guests, total_price, created_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """
-        booking_id = db.execute_insert(query, (
-            user_id, listing_id, check_in, check_out, guests, total_price, datetime.now()
-        ))
-        
-        if booking_id:
-            return Booking.get(booking_id)
-        return None
+        return Booking(
+            id=booking_id,
+            listing_id=listing_id,
+            user_id=user_id,
+            check_in=check_in,
+            check_out=check_out,
+            guests=guests,
+            total_price=total_price,
+            status='pending',
+            created_date=created_at
+        )
     
     @staticmethod
     def get(booking_id):
@@ -1416,9 +1888,16 @@ class Booking:
         return False
     
     def cancel(self):
-        """Cancel a booking"""
+        """Cancel a booking and release its nights"""
         query = "UPDATE bookings SET status = 'cancelled', updated_at = %s WHERE booking_id = %s"
-        return db.execute_update(query, (datetime.now(), self.id))
+        try:
+            with db.transaction():
+                updated = db.execute_update(query, (datetime.now(), self.id))
+                Booking.release_nights(self.id)
+        except Exception as e:
+            print(f"Error cancelling booking: {e}")
+            return 0
+        return updated
     
     def complete(self):
         """Mark booking as completed"""
@@ -1439,7 +1918,22 @@ class Booking:
             query = f"UPDATE bookings SET {', '.join(update_fields)} WHERE booking_id = %s"
             update_values.append(self.id)
             
-            if db.execute_update(query, tuple(update_values)):
+            try:
+                with db.transaction():
+                    updated = db.execute_update(query, tuple(update_values))
+                    # Keep booking_nights in step: cancelled bookings hold no nights
+                    if new_status == 'cancelled':
+                        Booking.release_nights(self.id)
+                    elif self.status == 'cancelled':
+                        Booking.claim_nights(self.id, self.listing_id, self.check_in, self.check_out)
+            except IntegrityError:
+                print(f"Cannot reinstate booking {self.id}: its dates have been booked since")
+                return False
+            except Exception as e:
+                print(f"Error updating booking status: {e}")
+                return False
+            
+            if updated:
                 self.status = new_status
                 return True
         return False
@@ -1494,6 +1988,59 @@ class Booking:
         delta = self.check_out - self.check_in
         return delta.days
     
+    @staticmethod
+    def get_timeline(user_id):
+        """Get a guest's bookings with everything the bookings page shows, in one query.
+
+        Each Booking carries listing_title, listing_location, listing_image, host_id,
+        host_name, confirmed_by_name and has_reviewed. Bookings of inactive listings
+        are left out.
+        """
+        query = """
+            SELECT b.*, l.title AS listing_title, l.host_id,
+                   loc.city, loc.country,
+                   (SELECT li.image_filename FROM listing_images li
+                    WHERE li.listing_id = b.listing_id
+                    ORDER BY li.is_primary DESC, li.image_order ASC
+                    LIMIT 1) AS listing_image,
+                   h.name AS host_name,
+                   c.name AS confirmed_by_name,
+                   EXISTS (SELECT 1 FROM reviews r
+                           WHERE r.listing_id = b.listing_id AND r.reviewer_id = b.user_id) AS has_reviewed
+            FROM bookings b
+            JOIN listings l ON l.listing_id = b.listing_id AND l.is_active = 1
+            LEFT JOIN locations loc ON loc.location_id = l.location_id
+            LEFT JOIN users h ON h.user_id = l.host_id
+            LEFT JOIN users c ON c.user_id = b.confirmed_by
+            WHERE b.user_id = %s
+            ORDER BY b.created_at DESC
+        """
+        results = db.execute_query(query, (user_id,))
+        bookings = []
+        for booking_data in results:
+            booking = Booking(
+                id=booking_data['booking_id'],
+                listing_id=booking_data['listing_id'],
+                user_id=booking_data['user_id'],
+                check_in=booking_data['check_in'],
+                check_out=booking_data['check_out'],
+                guests=booking_data.get('guests', 1),
+                total_price=float(booking_data['total_price']),
+                status=booking_data['status'],
+                created_date=booking_data['created_at'],
+                confirmed_by=booking_data['confirmed_by'],
+                confirmed_at=booking_data['confirmed_at']
+            )
+            booking.listing_title = booking_data['listing_title']
+            booking.listing_location = f"{booking_data['city']}, {booking_data['country']}" if booking_data['city'] else ''
+            booking.listing_image = booking_data['listing_image'] or 'demo_listing_1.jpg'
+            booking.host_id = booking_data['host_id']
+            booking.host_name = booking_data['host_name'] or 'Unknown Host'
+            booking.confirmed_by_name = booking_data['confirmed_by_name']
+            booking.has_reviewed = bool(booking_data['has_reviewed'])
+            bookings.append(booking)
+        return bookings
+    
     @staticmethod
     def get_upcoming_checkins(user_id, days_ahead=7):
         """Get upcoming check-ins within specified days"""
@@ -1595,31 +2142,69 @@ class Favorite:
             ))
         return favorites
     
+    @staticmethod
+    def get_listing_ids(user_id):
+        """Get the set of listing ids a user has favorited (cached per user)"""
+        def load():
+            query = "SELECT listing_id FROM favorites WHERE user_id = %s"
+            return frozenset(row['listing_id'] for row in db.execute_query(query, (user_id,)))
+        return favorites_cache.get_or_set(user_id, load)
+    
+    @staticmethod
+    def check_many(user_id, listing_ids):
+        """Get which of the given listing ids the user has favorited"""
+        favorited = Favorite.get_listing_ids(user_id)
+        return {listing_id for listing_id in listing_ids if listing_id in favorited}
+    
+    @staticmethod
+    def get_listings_by_user(user_id):
+        """Get a user's favorite active listings with their card details, newest favorite first"""
+        query = """
+            SELECT l.listing_id, l.title, l.room_type, l.price_per_night,
+                   loc.city, loc.country,
+                   (SELECT li.image_filename FROM listing_images li
+                    WHERE li.listing_id = l.listing_id
+                    ORDER BY li.is_primary DESC, li.image_order ASC
+                    LIMIT 1) AS image,
+                   rs.review_count, rs.rating_sum
+            FROM favorites f
+            JOIN listings l ON l.listing_id = f.listing_id AND l.is_active = 1
+            LEFT JOIN locations loc ON loc.location_id = l.location_id
+            LEFT JOIN listing_rating_stats rs ON rs.listing_id = l.listing_id
+            WHERE f.user_id = %s
+            ORDER BY f.created_at DESC, f.favorite_id DESC
+        """
+        return db.execute_query(query, (user_id,))
+    
     @staticmethod
     def add(user_id, listing_id):
-        """Add a listing to favorites"""
-        # Check if already favorited
-        query = "SELECT * FROM favorites WHERE user_id = %s AND listing_id = %s"
-        existing = db.execute_query(query, (user_id, listing_id))
-        if existing:
-            return False  # Already favorited
-        
-        query = "INSERT INTO favorites (user_id, listing_id, created_at) VALUES (%s, %s, %s)"
-        favorite_id = db.execute_insert(query, (user_id, listing_id, datetime.now()))
-        return favorite_id is not None
+        """Add a listing to favorites; False if it was already favorited or is not an active listing"""
+        query = """
+            INSERT IGNORE INTO favorites (user_id, listing_id, created_at)
+            SELECT %s, listing_id, %s FROM listings WHERE listing_id = %s AND is_active = 1
+        """
+        added = db.execute_update(query, (user_id, datetime.now(), listing_id)) > 0
+        # Another worker may have written since this one cached the set
+        favorites_cache.delete(user_id)
+        if added:
+            counters.invalidate(user_id)
+        return added
     
     @staticmethod
     def remove(user_id, listing_id):
-        """Remove a listing from favorites"""
+        """Remove a listing from favorites; False if it was not favorited"""
         query = "DELETE FROM favorites WHERE user_id = %s AND listing_id = %s"
-        return db.execute_update(query, (user_id, listing_id))
+        removed = db.execute_update(query, (user_id, listing_id)) > 0
+        favorites_cache.delete(user_id)
+        if removed:
+            counters.invalidate(user_id)
+        return removed
     
     @staticmethod
     def is_favorited(user_id, listing_id):
-        """Check if a listing is favorited by a user"""
-        query = "SELECT * FROM favorites WHERE user_id = %s AND listing_id = %s"
-        result = db.execute_query(query, (user_id, listing_id))
-        return len(result) > 0
+        """Check if a listing is favorited by a user, from the database rather than the cached set"""
+        query = "SELECT 1 FROM favorites WHERE user_id = %s AND listing_id = %s LIMIT 1"
+        return bool(db.execute_query(query, (user_id, listing_id)))
 
 
 class Message:
@@ -1664,6 +2249,7 @@ class Message:
         ))
         
         if message_id:
+            read_receipts.message_sent(sender_id, receiver_id)
             return Message.get(message_id)
         return None
     
@@ -1748,17 +2334,13 @@ class Message:
     
     @staticmethod
     def mark_conversation_as_read(user1_id, user2_id, reader_id):
-        """Mark all messages in a conversation as read for the reader"""
-        query = """
-            UPDATE messages 
-            SET is_read = %s, read_at = %s 
-            WHERE ((sender_id = %s AND receiver_id = %s) OR (sender_id = %s AND receiver_id = %s))
-            AND receiver_id = %s
-            AND is_read = %s
+        """Mark all messages in a conversation as read for the reader.
+
+        The UPDATE is written behind in a batch, and skipped when the reader is
+        known to have nothing unread; returns False in that case.
         """
-        return db.execute_update(query, (
-            True, datetime.now(), user1_id, user2_id, user2_id, user1_id, reader_id, False
-        ))
+        sender_id = user2_id if reader_id == user1_id else user1_id
+        return read_receipts.mark_read(reader_id, sender_id)
     
     @staticmethod
     def get_user_conversations(user_id):
@@ -0,0 +1,163 @@
+"""
+Online presence for the messaging UI
+
+Every authenticated request is a heartbeat: touch() stamps the user's last
+activity in the registry, and a user counts as online for PRESENCE_TIMEOUT
+seconds after it. Lookups are dictionary reads, and presence(user_ids)
+answers a whole inbox in one call.
+
+Backends (PRESENCE_BACKEND):
+
+    local     in this process only; exact for a single worker and the
+              stand-in for development and tests
+    database  shared across workers through the user_presence table.
+              Heartbeats are coalesced per user and upserted by a
+              background thread every PRESENCE_FLUSH_INTERVAL seconds;
+              lookups read all requested users in one query
+
+A backend provides touch(user_id, when) and last_seen_many(user_ids).
+"""
+import threading
+from datetime import datetime, timedelta
+from flask import request, session
+from config import Config
+from app.database import db
+from app.write_behind import BackgroundFlusher
+
+
+class LocalPresenceBackend:
+    """Last-seen times held in this process"""
+
+    # Touches between sweeps of expired entries
+    SWEEP_EVERY = 1000
+
+    def __init__(self, timeout=Config.PRESENCE_TIMEOUT):
+        self.timeout = timeout
+        self._last_seen = {}
+        self._lock = threading.Lock()
+        self._touches = 0
+
+    def touch(self, user_id, when):
+        with self._lock:
+            self._last_seen[user_id] = when
+            self._touches += 1
+            if self._touches >= self.SWEEP_EVERY:
+                self._touches = 0
+                cutoff = when - timedelta(seconds=self.timeout)
+                self._last_seen = {uid: seen for uid, seen in self._last_seen.items() if seen >= cutoff}
+
+    def last_seen_many(self, user_ids):
+        last_seen = self._last_seen
+        return {user_id: last_seen[user_id] for user_id in user_ids if user_id in last_seen}
+
+
+class DatabasePresenceBackend(BackgroundFlusher):
+    """Last-seen times shared through the user_presence table"""
+
+    thread_name = 'presence-flush'
+
+    def __init__(self, interval=Config.PRESENCE_FLUSH_INTERVAL, timeout=Config.PRESENCE_TIMEOUT):
+        super().__init__(interval)
+        # This worker's own heartbeats answer lookups before they are flushed
+        self.local = LocalPresenceBackend(timeout)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def touch(self, user_id, when):
+        self._ensure_thread()
+        self.local.touch(user_id, when)
+        with self._lock:
+            self._pending[user_id] = when
+
+    def reset(self):
+        with self._lock:
+            self._pending = {}
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            rows = sorted(pending.items())
+            placeholders = ', '.join(['(%s, %s)'] * len(rows))
+            params = tuple(value for row in rows for value in row)
+            try:
+                # Inside a transaction database errors raise instead of being swallowed
+                with db.transaction():
+                    db.execute_update(f"""
+                        INSERT INTO user_presence (user_id, last_seen) VALUES {placeholders}
+                        ON DUPLICATE KEY UPDATE last_seen = GREATEST(last_seen, VALUES(last_seen))
+                    """, params)
+            except Exception as e:
+                print(f"Error flushing presence: {e}")
+                with self._lock:
+                    for user_id, when in rows:
+                        self._pending.setdefault(user_id, when)
+                return 0
+            return len(rows)
+
+    def last_seen_many(self, user_ids):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        placeholders = ', '.join(['%s'] * len(user_ids))
+        rows = db.execute_query(
+            f"SELECT user_id, last_seen FROM user_presence WHERE user_id IN ({placeholders})",
+            tuple(user_ids)
+        )
+        last_seen = {row['user_id']: row['last_seen'] for row in rows}
+        for user_id, seen in self.local.last_seen_many(user_ids).items():
+            if user_id not in last_seen or seen > last_seen[user_id]:
+                last_seen[user_id] = seen
+        return last_seen
+
+
+BACKENDS = {
+    'local': LocalPresenceBackend,
+    'database': DatabasePresenceBackend,
+}
+
+backend = LocalPresenceBackend()
+
+
+def touch(user_id):
+    """Record activity by a user"""
+    backend.touch(user_id, datetime.now())
+
+
+def last_seen(user_ids):
+    """Get {user_id: last activity} for the users seen recently enough to be remembered"""
+    return backend.last_seen_many(user_ids)
+
+
+def presence(user_ids):
+    """Get {user_id: is_online} for many users in one lookup"""
+    cutoff = datetime.now() - timedelta(seconds=Config.PRESENCE_TIMEOUT)
+    seen = last_seen(user_ids)
+    return {user_id: user_id in seen and seen[user_id] >= cutoff for user_id in user_ids}
+
+
+def is_online(user_id):
+    return presence([user_id])[user_id]
+
+
+def init_app(app):
+    global backend
+    backend_class = BACKENDS.get(Config.PRESENCE_BACKEND)
+    if backend_class is None:
+        raise ValueError(f"Unknown PRESENCE_BACKEND {Config.PRESENCE_BACKEND!r}; use one of {', '.join(BACKENDS)}")
+    backend = backend_class()
+    if isinstance(backend, BackgroundFlusher):
+        backend.register_shutdown()
+
+    @app.before_request
+    def record_presence():
+        # The session already names the user, so no user lookup is needed here
+        user_id = session.get('_user_id')
+        if user_id and request.endpoint != 'static':
+            try:
+                touch(int(user_id))
+            except ValueError:
+                pass
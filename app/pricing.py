@@ -0,0 +1,269 @@
+"""
+Nightly pricing engine: per-listing rules and cached stay quotes
+
+Rules are stored as one small JSON document per listing in `listing_pricing`:
+
+    {
+        "weekend": {"days": [4, 5], "pct": 20},
+        "seasons": [{"start": "12-15", "end": "01-15", "price": 2500},
+                    {"start": "04-10", "end": "04-20", "pct": 30}],
+        "length_of_stay": [{"min_nights": 7, "pct": 10}, {"min_nights": 28, "pct": 25}],
+        "extra_guest": {"included": 2, "fee": 300},
+        "cleaning_fee": 500
+    }
+
+Weekend days are Python weekdays (Monday = 0). Seasons recur every year from
+start (inclusive) to end (exclusive), wrapping over New Year when end <= start;
+the first matching season sets a night's rate, either as a fixed price or as a
+percentage on the base price. Weekend nights get their surcharge on top.
+
+A quote splits the stay at season boundaries and prices each run of nights in
+one step, counting its weekend nights arithmetically, so the cost depends on
+the number of rules rather than the length of the stay.
+"""
+import json
+from datetime import date, timedelta
+from config import Config
+from app.cache import TTLCache
+from app.database import db
+from app.signals import listing_changed, notify_listing_changed
+
+SERVICE_FEE_RATE = 0.15
+DEFAULT_CLEANING_FEE = 500
+
+# Rules for listings without a listing_pricing row
+NO_RULES = {'version': 0, 'rules': {}}
+
+rules_cache = TTLCache(max_entries=5000, default_ttl=Config.PRICING_RULES_TTL)
+quote_cache = TTLCache(max_entries=20000, default_ttl=Config.QUOTE_CACHE_TTL)
+
+
+def _parse_month_day(value):
+    month, day = (int(part) for part in value.split('-'))
+    date(2000, month, day)  # Validates the pair, allowing Feb 29
+    return month, day
+
+
+def _percentage(value, name):
+    pct = float(value)
+    if pct <= -100:
+        raise ValueError(f"{name} percentage must be greater than -100")
+    return pct
+
+
+def validate_rules(rules):
+    """Check and normalize a rules document; raises ValueError with a readable message"""
+    if not isinstance(rules, dict):
+        raise ValueError("Pricing rules must be a JSON object")
+    normalized = {}
+    try:
+        if rules.get('weekend'):
+            days = sorted({int(day) for day in rules['weekend'].get('days', [4, 5])})
+            if any(day < 0 or day > 6 for day in days):
+                raise ValueError("Weekend days must be between 0 (Monday) and 6 (Sunday)")
+            normalized['weekend'] = {'days': days, 'pct': _percentage(rules['weekend']['pct'], 'Weekend')}
+
+        seasons = []
+        for season in rules.get('seasons') or []:
+            entry = {'start': season['start'], 'end': season['end']}
+            _parse_month_day(entry['start'])
+            _parse_month_day(entry['end'])
+            if 'price' in season:
+                entry['price'] = float(season['price'])
+                if entry['price'] <= 0:
+                    raise ValueError("Season prices must be positive")
+            else:
+                entry['pct'] = _percentage(season['pct'], 'Season')
+            seasons.append(entry)
+        if seasons:
+            normalized['seasons'] = seasons
+
+        discounts = []
+        for discount in rules.get('length_of_stay') or []:
+            min_nights = int(discount['min_nights'])
+            pct = float(discount['pct'])
+            if min_nights < 1 or not 0 <= pct < 100:
+                raise ValueError("Length-of-stay discounts need min_nights >= 1 and 0 <= pct < 100")
+            discounts.append({'min_nights': min_nights, 'pct': pct})
+        if discounts:
+            normalized['length_of_stay'] = sorted(discounts, key=lambda d: d['min_nights'])
+
+        if rules.get('extra_guest'):
+            included = int(rules['extra_guest']['included'])
+            fee = float(rules['extra_guest']['fee'])
+            if included < 1 or fee < 0:
+                raise ValueError("Extra guest pricing needs included >= 1 and a non-negative fee")
+            normalized['extra_guest'] = {'included': included, 'fee': fee}
+
+        if 'cleaning_fee' in rules:
+            normalized['cleaning_fee'] = float(rules['cleaning_fee'])
+            if normalized['cleaning_fee'] < 0:
+                raise ValueError("Cleaning fee cannot be negative")
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"Malformed pricing rules: {e}")
+    return normalized
+
+
+def load_rules(listing_ids):
+    """Get {listing_id: {'version', 'rules'}} for many listings, reading only cache misses"""
+    found = {}
+    missing = []
+    for listing_id in listing_ids:
+        entry = rules_cache.get(listing_id)
+        if entry is None:
+            missing.append(listing_id)
+        else:
+            found[listing_id] = entry
+
+    if missing:
+        placeholders = ', '.join(['%s'] * len(missing))
+        rows = db.execute_query(
+            f"SELECT listing_id, rules, version FROM listing_pricing WHERE listing_id IN ({placeholders})",
+            tuple(missing)
+        )
+        loaded = {}
+        for row in rows:
+            try:
+                loaded[row['listing_id']] = {'version': row['version'], 'rules': json.loads(row['rules'])}
+            except (TypeError, ValueError):
+                print(f"Ignoring unreadable pricing rules for listing {row['listing_id']}")
+        for listing_id in missing:
+            entry = loaded.get(listing_id, NO_RULES)
+            rules_cache.set(listing_id, entry)
+            found[listing_id] = entry
+    return found
+
+
+def get_rules(listing_id):
+    """Get the pricing rules entry for one listing"""
+    return load_rules([listing_id])[listing_id]
+
+
+def save_rules(listing_id, rules):
+    """Validate and store a listing's rules, bumping its version. Returns the stored rules."""
+    normalized = validate_rules(rules)
+    query = """
+        INSERT INTO listing_pricing (listing_id, rules, version)
+        VALUES (%s, %s, 1)
+        ON DUPLICATE KEY UPDATE rules = VALUES(rules), version = version + 1
+    """
+    db.execute_update(query, (listing_id, json.dumps(normalized, separators=(',', ':'))))
+    notify_listing_changed(listing_id, 'pricing')
+    return normalized
+
+
+def _month_day_date(year, month_day):
+    month, day = month_day
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return date(year, 3, 1)  # Feb 29 outside leap years
+
+
+def _season_intervals(seasons, check_in, check_out):
+    """Concrete [start, end) intervals of each season overlapping the stay, in rule order"""
+    intervals = []
+    for index, season in enumerate(seasons):
+        start_md = _parse_month_day(season['start'])
+        end_md = _parse_month_day(season['end'])
+        for year in range(check_in.year - 1, check_out.year + 1):
+            start = _month_day_date(year, start_md)
+            end = _month_day_date(year + 1 if end_md <= start_md else year, end_md)
+            if start < check_out and end > check_in:
+                intervals.append((max(start, check_in), min(end, check_out), index))
+    return intervals
+
+
+def _count_weekdays(start, end, weekdays):
+    """Number of nights in [start, end) falling on the given weekdays"""
+    full_weeks, remainder = divmod((end - start).days, 7)
+    first = start.weekday()
+    return full_weeks * len(weekdays) + sum(1 for offset in range(remainder) if (first + offset) % 7 in weekdays)
+
+
+def compute_quote(base_price, rules, check_in, check_out, guests=1):
+    """Price a stay under the given rules without touching caches or the database"""
+    nights = (check_out - check_in).days
+    seasons = rules.get('seasons', [])
+    weekend = rules.get('weekend')
+
+    intervals = _season_intervals(seasons, check_in, check_out)
+    boundaries = sorted({check_in, check_out}
+                        | {start for start, _, _ in intervals}
+                        | {end for _, end, _ in intervals})
+
+    base_total = 0.0
+    weekend_nights = 0
+    for run_start, run_end in zip(boundaries, boundaries[1:]):
+        season_index = min((index for start, end, index in intervals if start <= run_start < end), default=None)
+        rate = base_price
+        if season_index is not None:
+            season = seasons[season_index]
+            rate = season['price'] if 'price' in season else base_price * (1 + season['pct'] / 100)
+
+        run_nights = (run_end - run_start).days
+        run_weekend = _count_weekdays(run_start, run_end, set(weekend['days'])) if weekend else 0
+        base_total += rate * (run_nights - run_weekend)
+        if run_weekend:
+            base_total += rate * (1 + weekend['pct'] / 100) * run_weekend
+            weekend_nights += run_weekend
+
+    discount_pct = 0.0
+    for discount in rules.get('length_of_stay', []):
+        if nights >= discount['min_nights']:
+            discount_pct = discount['pct']
+    discount = base_total * discount_pct / 100
+
+    extra_guest_fee = 0.0
+    if rules.get('extra_guest'):
+        extra_guests = max(0, guests - rules['extra_guest']['included'])
+        extra_guest_fee = extra_guests * rules['extra_guest']['fee'] * nights
+
+    cleaning_fee = rules.get('cleaning_fee', DEFAULT_CLEANING_FEE)
+    service_fee = (base_total - discount + extra_guest_fee) * SERVICE_FEE_RATE
+    total = base_total - discount + extra_guest_fee + cleaning_fee + service_fee
+
+    return {
+        'nights': nights,
+        'base_price': round(base_total, 2),
+        'weekend_nights': weekend_nights,
+        'discount': round(discount, 2),
+        'discount_pct': discount_pct,
+        'extra_guest_fee': round(extra_guest_fee, 2),
+        'cleaning_fee': round(cleaning_fee, 2),
+        'service_fee': round(service_fee, 2),
+        'total': round(total, 2),
+        'average_nightly': round(base_total / nights, 2) if nights else 0.0
+    }
+
+
+def quote(listing_id, base_price, check_in, check_out, guests=1, rules_entry=None):
+    """Cached price breakdown for a stay; base_price is the listing's nightly price"""
+    if rules_entry is None:
+        rules_entry = get_rules(listing_id)
+    key = (listing_id, check_in, check_out, guests, float(base_price), rules_entry['version'])
+    return quote_cache.get_or_set(
+        key, lambda: compute_quote(float(base_price), rules_entry['rules'], check_in, check_out, guests))
+
+
+def quote_many(listings, check_in, check_out, guests=1):
+    """Quotes for many Listing objects at once, loading all their rules in one query"""
+    return quote_prices({listing.id: listing.price for listing in listings}, check_in, check_out, guests)
+
+
+def quote_prices(base_prices, check_in, check_out, guests=1):
+    """Quotes for {listing_id: nightly base price}, loading all their rules in one query"""
+    entries = load_rules(list(base_prices))
+    return {
+        listing_id: quote(listing_id, base_price, check_in, check_out, guests, entries[listing_id])
+        for listing_id, base_price in base_prices.items()
+    }
+
+
+def _on_listing_changed(sender, listing_id=None, reason=None, **extra):
+    # Quotes are keyed on the base price and rules version, so only the rules need dropping
+    if reason in ('pricing', 'deleted'):
+        rules_cache.delete(listing_id)
+
+
+listing_changed.connect(_on_listing_changed)
@@ -0,0 +1,119 @@
+"""
+SQL instrumentation: per-request query totals, slow-query log and N+1 detection
+"""
+import logging
+import os
+import re
+import sys
+from flask import g, has_request_context, request
+from config import Config
+
+logger = logging.getLogger('otithi.sql')
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_LITERAL_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r'IN \((?:\?, )+\?\)', re.IGNORECASE)
+
+# Frames from these modules are skipped when looking for the code that issued a query
+_INTERNAL_MODULES = ('app.database', 'app.query_stats', 'contextlib')
+
+# Keep at most this many individual queries per request for inspection
+MAX_RECORDED_QUERIES = 200
+
+
+def fingerprint(query):
+    """Normalize SQL so every execution of the same statement shape maps to one key"""
+    normalized = _WHITESPACE_RE.sub(' ', query).strip()
+    normalized = normalized.replace('%s', '?')
+    normalized = _LITERAL_RE.sub('?', normalized)
+    return _IN_LIST_RE.sub('IN (?)', normalized)
+
+
+def find_caller():
+    """Return 'file:line in function' for the first frame outside the database layer"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_globals.get('__name__') not in _INTERNAL_MODULES:
+            code = frame.f_code
+            return f"{os.path.basename(code.co_filename)}:{frame.f_lineno} in {code.co_name}"
+        frame = frame.f_back
+    return 'unknown'
+
+
+class RequestQueryStats:
+    """Query totals collected for a single request"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.rows = 0
+        self.queries = []
+        self.by_fingerprint = {}
+        self.repeated = {}
+
+    def add(self, sql_fingerprint, duration_ms, rows, caller):
+        self.count += 1
+        self.total_ms += duration_ms
+        self.rows += rows or 0
+        if len(self.queries) < MAX_RECORDED_QUERIES:
+            self.queries.append((sql_fingerprint, duration_ms, rows, caller))
+
+        seen = self.by_fingerprint.get(sql_fingerprint, 0) + 1
+        self.by_fingerprint[sql_fingerprint] = seen
+        if seen == Config.N_PLUS_ONE_THRESHOLD:
+            # Flag once per statement shape; the final count is logged with the response
+            self.repeated[sql_fingerprint] = caller
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total_ms': round(self.total_ms, 2),
+            'rows': self.rows,
+            'repeated': {fp: self.by_fingerprint[fp] for fp in self.repeated}
+        }
+
+
+def current_stats():
+    """Get the stats object for the active request, or None outside a request"""
+    if not has_request_context():
+        return None
+    stats = g.get('query_stats')
+    if stats is None:
+        stats = g.query_stats = RequestQueryStats()
+    return stats
+
+
+def record(query, duration, rows):
+    """Record one executed statement. duration is in seconds."""
+    duration_ms = duration * 1000
+    sql_fingerprint = fingerprint(query)
+    caller = find_caller()
+
+    if duration_ms >= Config.SLOW_QUERY_MS:
+        logger.warning("Slow query (%.1f ms, %s rows) from %s: %s",
+                       duration_ms, rows, caller, sql_fingerprint)
+
+    stats = current_stats()
+    if stats is not None:
+        stats.add(sql_fingerprint, duration_ms, rows, caller)
+
+
+def init_app(app):
+    """Attach per-request query reporting to the Flask app"""
+
+    @app.after_request
+    def add_query_stats_headers(response):
+        stats = g.get('query_stats')
+        if stats is None:
+            return response
+
+        for sql_fingerprint, caller in stats.repeated.items():
+            logger.warning("Possible N+1 on %s %s: %d executions of %s (first flagged at %s)",
+                           request.method, request.path, stats.by_fingerprint[sql_fingerprint],
+                           sql_fingerprint, caller)
+
+        if app.config.get('QUERY_STATS_HEADERS'):
+            response.headers['X-Query-Count'] = str(stats.count)
+            response.headers['X-Query-Time-Ms'] = f"{stats.total_ms:.2f}"
+            response.headers['X-Query-Repeated'] = str(len(stats.repeated))
+        return response
@@ -0,0 +1,116 @@
+"""
+Write-behind read receipts for message threads
+
+Opening or polling a conversation marks the other participant's messages as
+read. Instead of an UPDATE per poll, receipts are coalesced per (reader,
+sender) pair and written by a background thread every
+READ_RECEIPT_FLUSH_INTERVAL seconds as one batched UPDATE.
+
+Each worker remembers which pairs it knows to have nothing unread and skips
+them entirely until a new message arrives. A message sent through another
+worker can be missed for up to UNREAD_STATE_TTL seconds. A receipt only
+covers messages created before the read, so a message that arrives while
+the receipt waits in the buffer stays unread. read_at is the time the
+receipt was queued, not the time it was flushed.
+"""
+import threading
+from datetime import datetime
+from config import Config
+from app.cache import TTLCache
+from app.database import db
+from app.write_behind import BackgroundFlusher
+
+# Pairs per UPDATE statement
+FLUSH_BATCH_SIZE = 200
+
+# (reader_id, sender_id) -> unread count known to this worker
+unread_cache = TTLCache(max_entries=20000, default_ttl=Config.UNREAD_STATE_TTL)
+
+
+def _apply(pending):
+    """Mark messages read for {(reader_id, sender_id): [read_at, ...]}; returns rows updated
+
+    Each message gets the earliest queued read time at or after its creation.
+    """
+    items = sorted(pending.items())
+    updated = 0
+    for offset in range(0, len(items), FLUSH_BATCH_SIZE):
+        batch = items[offset:offset + FLUSH_BATCH_SIZE]
+        cases = []
+        case_params = []
+        condition_params = []
+        for (reader_id, sender_id), read_times in batch:
+            for read_at in sorted(read_times):
+                cases.append('WHEN receiver_id = %s AND sender_id = %s AND created_at <= %s THEN %s')
+                case_params.extend([reader_id, sender_id, read_at, read_at])
+            condition_params.extend([reader_id, sender_id, max(read_times)])
+        conditions = ' OR '.join(['(receiver_id = %s AND sender_id = %s AND created_at <= %s)'] * len(batch))
+        updated += db.execute_update(
+            f"UPDATE messages SET is_read = 1, read_at = CASE {' '.join(cases)} END "
+            f"WHERE is_read = 0 AND ({conditions})",
+            tuple(case_params + condition_params)
+        )
+    return updated
+
+
+class ReadReceiptBuffer(BackgroundFlusher):
+    """Coalesces read receipts per (reader, sender) and writes them in batches"""
+
+    thread_name = 'read-receipt-flush'
+
+    def __init__(self, interval=Config.READ_RECEIPT_FLUSH_INTERVAL):
+        super().__init__(interval)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def mark_read(self, reader_id, sender_id, read_at=None):
+        """Queue a receipt for sender's messages to reader. Returns False if nothing was unread."""
+        key = (reader_id, sender_id)
+        if unread_cache.get(key) == 0:
+            return False
+        self._ensure_thread()
+        with self._lock:
+            self._pending.setdefault(key, []).append(read_at or datetime.now())
+        unread_cache.set(key, 0)
+        return True
+
+    def reset(self):
+        with self._lock:
+            self._pending = {}
+
+    def flush(self):
+        """Write queued receipts. Returns the number of messages marked read."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            try:
+                # Inside a transaction database errors raise instead of being swallowed
+                with db.transaction():
+                    return _apply(pending)
+            except Exception as e:
+                print(f"Error flushing read receipts: {e}")
+                with self._lock:
+                    for key, read_times in pending.items():
+                        self._pending.setdefault(key, []).extend(read_times)
+                return 0
+
+
+read_receipts = ReadReceiptBuffer()
+
+
+def mark_read(reader_id, sender_id):
+    """Mark sender's messages to reader as read, write-behind"""
+    return read_receipts.mark_read(reader_id, sender_id)
+
+
+def message_sent(sender_id, receiver_id):
+    """Forget that the receiver had nothing unread from the sender"""
+    unread_cache.delete((receiver_id, sender_id))
+
+
+def init_app(app):
+    # Write receipts still queued when the process exits
+    read_receipts.register_shutdown()
@@ -1,7 +1,9 @@
 from flask import Blueprint, jsonify, request
 from flask_login import login_required, current_user
-from app.models import User, Review, Listing
-import json
+from app.models import User, Review, Listing, Favorite
+from app import analytics, geo_index, pricing
+from datetime import date, datetime, timedelta
+import base64
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -13,34 +15,43 @@ def check_email():
         return jsonify({'available': user is None})
     return jsonify({'available': False})
 
+# Largest page the user reviews endpoint will return
+MAX_USER_REVIEWS_PAGE = 50
+
 @api_bp.route('/user/reviews')
 @login_required
 def get_user_reviews():
-    """API endpoint to get all reviews posted by the current user"""
+    """API endpoint to get the reviews posted by the current user, newest first.
+
+    Returns one page per call (limit, default 20); follow next_cursor for the next page.
+    """
     try:
-        user_reviews = Review.get_by_user(current_user.id)
+        limit = min(max(int(request.args.get('limit', 20)), 1), MAX_USER_REVIEWS_PAGE)
+        user_reviews = Review.get_by_user(current_user.id, limit=limit + 1, cursor=request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid limit or cursor'}), 400
+    
+    try:
+        next_cursor = Review.encode_cursor(user_reviews[limit - 1]) if len(user_reviews) > limit else None
         
         reviews_data = []
-        for review in user_reviews:
-            listing = Listing.get(review.listing_id)
-            
+        for review in user_reviews[:limit]:
             review_data = {
                 'id': review.id,
                 'rating': review.rating,
                 'comment': review.comment,
                 'created_date': review.created_date.strftime('%B %d, %Y') if review.created_date else '',
-                'listing_title': listing.title if listing else 'Listing not found',
-                'listing_location': listing.location if listing else '',
+                'listing_title': review.listing_title or 'Listing not found',
+                'listing_location': review.listing_location,
                 'listing_id': review.listing_id
             }
             reviews_data.append(review_data)
         
-        reviews_data.sort(key=lambda x: x['created_date'], reverse=True)
-        
         return jsonify({
             'success': True,
             'reviews': reviews_data,
-            'total_count': len(reviews_data)
+            'total_count': Review.count_by_user(current_user.id),
+            'next_cursor': next_cursor
         })
         
     except Exception as e:
@@ -49,12 +60,15 @@ def get_user_reviews():
             'error': f'Error fetching reviews: {str(e)}'
         }), 500
 
+# Most listing ids the bulk favorites check accepts in one request
+MAX_FAVORITES_CHECK = 200
+
 @api_bp.route('/favorites', methods=['POST'])
 @login_required
 def toggle_favorite():
     """API endpoint to add or remove a listing from favorites"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         listing_id = data.get('listing_id')
         action = data.get('action')  # 'add' or 'remove'
         
@@ -64,34 +78,20 @@ def toggle_favorite():
                 'error': 'Missing listing_id or action'
             }), 400
         
-        # Check if listing exists
-        listing = Listing.get(listing_id)
-        if not listing:
-            return jsonify({
-                'success': False,
-                'error': 'Listing not found'
-            }), 404
-        
-        # Get current user's favorites
-        user_favorites = current_user.favorites if hasattr(current_user, 'favorites') and current_user.favorites else []
-        
-        if isinstance(user_favorites, str):
-            try:
-                user_favorites = json.loads(user_favorites)
-            except:
-                user_favorites = []
-        
         listing_id_int = int(listing_id)
         
         if action == 'add':
-            if listing_id_int not in user_favorites:
-                user_favorites.append(listing_id_int)
+            if Favorite.add(current_user.id, listing_id_int):
                 message = 'Added to favorites'
-            else:
+            elif Favorite.is_favorited(current_user.id, listing_id_int):
                 message = 'Already in favorites'
+            else:
+                return jsonify({
+                    'success': False,
+                    'error': 'Listing not found'
+                }), 404
         elif action == 'remove':
-            if listing_id_int in user_favorites:
-                user_favorites.remove(listing_id_int)
+            if Favorite.remove(current_user.id, listing_id_int):
                 message = 'Removed from favorites'
             else:
                 message = 'Not in favorites'
@@ -101,13 +101,7 @@ def toggle_favorite():
                 'error': 'Invalid action. Use "add" or "remove"'
             }), 400
         
-        # Update user's favorites in database
-        # Note: This assumes you have a favorites field in your User model
-        # You might need to adjust this based on your actual database schema
-        current_user.favorites = json.dumps(user_favorites)
-        # You'll need to implement a save method or use your ORM's save method
-        # current_user.save()
-        
+        user_favorites = Favorite.get_listing_ids(current_user.id)
         return jsonify({
             'success': True,
             'message': message,
@@ -126,20 +120,9 @@ def toggle_favorite():
 def check_favorite_status(listing_id):
     """API endpoint to check if a listing is in user's favorites"""
     try:
-        # Get current user's favorites
-        user_favorites = current_user.favorites if hasattr(current_user, 'favorites') and current_user.favorites else []
-        
-        if isinstance(user_favorites, str):
-            try:
-                user_favorites = json.loads(user_favorites)
-            except:
-                user_favorites = []
-        
-        is_favorited = int(listing_id) in user_favorites
-        
         return jsonify({
             'success': True,
-            'is_favorited': is_favorited,
+            'is_favorited': Favorite.is_favorited(current_user.id, listing_id),
             'listing_id': listing_id
         })
         
@@ -149,35 +132,51 @@ def check_favorite_status(listing_id):
             'error': f'Error checking favorite status: {str(e)}'
         }), 500
 
+@api_bp.route('/favorites/check', methods=['POST'])
+@login_required
+def check_favorites_bulk():
+    """API endpoint to check a page of listings at once: {"listing_ids": [...]}"""
+    data = request.get_json(silent=True) or {}
+    listing_ids = data.get('listing_ids')
+    if not isinstance(listing_ids, list) or len(listing_ids) > MAX_FAVORITES_CHECK:
+        return jsonify({
+            'success': False,
+            'error': f'listing_ids must be a list of at most {MAX_FAVORITES_CHECK} ids'
+        }), 400
+    try:
+        listing_ids = [int(listing_id) for listing_id in listing_ids]
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'listing_ids must be integers'}), 400
+    
+    try:
+        favorited = Favorite.check_many(current_user.id, listing_ids)
+        return jsonify({
+            'success': True,
+            'favorited_ids': sorted(favorited)
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Error checking favorite status: {str(e)}'
+        }), 500
+
 @api_bp.route('/favorites')
 @login_required
 def get_favorites():
     """API endpoint to get all favorite listings for the current user"""
     try:
-        # Get current user's favorites
-        user_favorites = current_user.favorites if hasattr(current_user, 'favorites') and current_user.favorites else []
-        
-        if isinstance(user_favorites, str):
-            try:
-                user_favorites = json.loads(user_favorites)
-            except:
-                user_favorites = []
-        
-        # Get listing details for each favorite
         favorite_listings = []
-        for listing_id in user_favorites:
-            listing = Listing.get(listing_id)
-            if listing:
-                listing_data = {
-                    'id': listing.id,
-                    'title': listing.title,
-                    'location': listing.location,
-                    'price_per_night': listing.price,
-                    'image': 'demo_listing_1.jpg',  # Default image, update based on your schema
-                    'rating': 0.0,  # Calculate if you have reviews
-                    'room_type': listing.property_type
-                }
-                favorite_listings.append(listing_data)
+        for row in Favorite.get_listings_by_user(current_user.id):
+            favorite_listings.append({
+                'id': row['listing_id'],
+                'title': row['title'],
+                'location': f"{row['city']}, {row['country']}" if row['city'] else '',
+                'price_per_night': float(row['price_per_night']),
+                'image': row['image'] or 'demo_listing_1.jpg',
+                'rating': round(float(row['rating_sum']) / row['review_count'], 1) if row['review_count'] else 0.0,
+                'room_type': row['room_type']
+            })
         
         return jsonify({
             'success': True,
@@ -190,3 +189,231 @@ def get_favorites():
             'success': False,
             'error': f'Error fetching favorites: {str(e)}'
         }), 500
+
+# Longest window the calendar endpoint will return in one response
+MAX_CALENDAR_DAYS = 731
+
+def _ranges_to_bitmask(ranges, start, days):
+    """Pack booked ranges into one bit per day from start (bit 0 = LSB of byte 0)"""
+    bits = bytearray((days + 7) // 8)
+    for range_start, range_end in ranges:
+        for offset in range((range_start - start).days, (range_end - start).days):
+            bits[offset // 8] |= 1 << (offset % 8)
+    return base64.b64encode(bytes(bits)).decode('ascii')
+
+@api_bp.route('/listings/<int:listing_id>/calendar')
+def listing_calendar(listing_id):
+    """Booked date ranges for a listing within [start, end).
+
+    format=ranges (default) returns [start, end) date pairs; format=bitmask returns a
+    base64 bitmap with one bit per day of the window, set when the night is booked.
+    """
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start') else date.today()
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else start + timedelta(days=365)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Dates must be in YYYY-MM-DD format'}), 400
+    
+    days = (end - start).days
+    if days <= 0 or days > MAX_CALENDAR_DAYS:
+        return jsonify({'success': False, 'error': f'end must be after start and at most {MAX_CALENDAR_DAYS} days later'}), 400
+    
+    output_format = request.args.get('format', 'ranges')
+    if output_format not in ('ranges', 'bitmask'):
+        return jsonify({'success': False, 'error': 'format must be ranges or bitmask'}), 400
+    
+    ranges = Listing.get_booked_ranges(listing_id, start, end)
+    if ranges is None:
+        return jsonify({'success': False, 'error': 'Listing not found'}), 404
+    
+    data = {
+        'success': True,
+        'listing_id': listing_id,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'format': output_format
+    }
+    if output_format == 'bitmask':
+        data['days'] = days
+        data['bitmask'] = _ranges_to_bitmask(ranges, start, days)
+    else:
+        data['booked'] = [[range_start.isoformat(), range_end.isoformat()] for range_start, range_end in ranges]
+    
+    response = jsonify(data)
+    response.headers['Cache-Control'] = 'public, max-age=0, must-revalidate'
+    response.add_etag()
+    return response.make_conditional(request)
+
+@api_bp.route('/listings/<int:listing_id>/quote')
+def listing_quote(listing_id):
+    """Price breakdown for a stay, used by the booking widget"""
+    try:
+        check_in = datetime.strptime(request.args.get('check_in', ''), '%Y-%m-%d').date()
+        check_out = datetime.strptime(request.args.get('check_out', ''), '%Y-%m-%d').date()
+        guests = int(request.args.get('guests', 1))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'check_in and check_out must be YYYY-MM-DD and guests a number'}), 400
+    
+    if check_out <= check_in or guests < 1:
+        return jsonify({'success': False, 'error': 'Check-out must be after check-in with at least one guest'}), 400
+    
+    listing = Listing.get_pricing_basics(listing_id)
+    if not listing:
+        return jsonify({'success': False, 'error': 'Listing not found'}), 404
+    if guests > listing['max_guests']:
+        return jsonify({'success': False, 'error': f"This listing can accommodate maximum {listing['max_guests']} guests"}), 400
+    
+    return jsonify({
+        'success': True,
+        'listing_id': listing_id,
+        'check_in': check_in.isoformat(),
+        'check_out': check_out.isoformat(),
+        'guests': guests,
+        'quote': pricing.quote(listing_id, listing['price_per_night'], check_in, check_out, guests)
+    })
+
+@api_bp.route('/listings/<int:listing_id>/pricing', methods=['GET', 'PUT'])
+@login_required
+def listing_pricing_rules(listing_id):
+    """Read or replace a listing's pricing rules (host only)"""
+    listing = Listing.get_pricing_basics(listing_id)
+    if not listing:
+        return jsonify({'success': False, 'error': 'Listing not found'}), 404
+    if listing['host_id'] != current_user.id:
+        return jsonify({'success': False, 'error': 'Only the host can manage pricing for this listing'}), 403
+    
+    if request.method == 'PUT':
+        try:
+            pricing.save_rules(listing_id, request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+    
+    entry = pricing.get_rules(listing_id)
+    return jsonify({'success': True, 'listing_id': listing_id, 'version': entry['version'], 'rules': entry['rules']})
+
+# Largest page the reviews endpoint will return
+MAX_REVIEWS_PAGE = 50
+
+@api_bp.route('/listings/<int:listing_id>/reviews')
+def listing_reviews(listing_id):
+    """One page of a listing's reviews, newest first; follow next_cursor for the next page"""
+    try:
+        limit = min(max(int(request.args.get('limit', 6)), 1), MAX_REVIEWS_PAGE)
+        reviews = Review.get_by_listing(listing_id, limit=limit + 1, cursor=request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid limit or cursor'}), 400
+    
+    next_cursor = Review.encode_cursor(reviews[limit - 1]) if len(reviews) > limit else None
+    return jsonify({
+        'success': True,
+        'listing_id': listing_id,
+        'reviews': [{
+            'id': review.id,
+            'user_name': review.user_name or 'Guest',
+            'user_profile_photo': review.user_profile_photo,
+            'rating': review.rating,
+            'comment': review.comment,
+            'created_date': review.created_date.strftime('%B %Y') if review.created_date else ''
+        } for review in reviews[:limit]],
+        'next_cursor': next_cursor
+    })
+
+# Most listings a nearby or map-viewport query returns, and the widest radius
+MAX_GEO_RESULTS = 200
+MAX_GEO_RADIUS_KM = 500
+
+def _parse_bbox(value):
+    """(south, west, north, east) from a 'west,south,east,north' bbox parameter"""
+    west, south, east, north = (float(part) for part in value.split(','))
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise ValueError('bbox out of range')
+    return south, west, north, east
+
+def _geo_listing(listing):
+    return {
+        'id': listing.id,
+        'title': listing.title,
+        'location': listing.location,
+        'price_per_night': listing.price,
+        'image': listing.images[0] if listing.images else 'demo_listing_1.jpg',
+        'rating': listing.rating,
+        'room_type': listing.room_type,
+        'latitude': listing.latitude,
+        'longitude': listing.longitude,
+        'distance_km': listing.distance_km
+    }
+
+@api_bp.route('/listings/near')
+def listings_near():
+    """Listings within `radius` km (default 10) of lat/lon, nearest first"""
+    try:
+        lat = float(request.args['lat'])
+        lon = float(request.args['lon'])
+        radius = float(request.args.get('radius', 10))
+        limit = min(max(int(request.args.get('limit', 50)), 1), MAX_GEO_RESULTS)
+    except (KeyError, ValueError):
+        return jsonify({'success': False, 'error': 'lat and lon are required; radius and limit must be numbers'}), 400
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180 and 0 < radius <= MAX_GEO_RADIUS_KM):
+        return jsonify({'success': False, 'error': f'Coordinates out of range or radius not in (0, {MAX_GEO_RADIUS_KM}] km'}), 400
+    
+    listings = Listing.search_near(lat, lon, radius, limit)
+    return jsonify({'success': True, 'listings': [_geo_listing(listing) for listing in listings]})
+
+@api_bp.route('/listings/within')
+def listings_within():
+    """Listings inside bbox=west,south,east,north, nearest to the box centre first"""
+    try:
+        south, west, north, east = _parse_bbox(request.args.get('bbox', ''))
+        limit = min(max(int(request.args.get('limit', 50)), 1), MAX_GEO_RESULTS)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'bbox must be west,south,east,north in degrees'}), 400
+    
+    listings = Listing.search_bbox(south, west, north, east, limit)
+    return jsonify({'success': True, 'listings': [_geo_listing(listing) for listing in listings]})
+
+# Most tiles one clusters response covers
+MAX_MAP_TILES = 64
+
+@api_bp.route('/map/clusters')
+def map_clusters():
+    """Listing clusters for a map viewport: bbox=west,south,east,north and zoom.
+
+    Each cluster is [lat, lon, count, min_price]. A bbox spanning more than
+    MAX_MAP_TILES tiles at the requested zoom is clustered at a coarser zoom,
+    returned as `zoom`.
+    """
+    try:
+        south, west, north, east = _parse_bbox(request.args.get('bbox', ''))
+        zoom = min(max(int(request.args.get('zoom', 10)), 0), geo_index.MAX_ZOOM)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'bbox must be west,south,east,north in degrees and zoom a number'}), 400
+    
+    while zoom > 0 and geo_index.tile_count(south, west, north, east, zoom) > MAX_MAP_TILES:
+        zoom -= 1
+    return jsonify({
+        'success': True,
+        'zoom': zoom,
+        'fields': ['lat', 'lon', 'count', 'min_price'],
+        'clusters': geo_index.clusters(south, west, north, east, zoom)
+    })
+
+# Longest window the host analytics endpoint will return
+MAX_ANALYTICS_DAYS = 366
+
+@api_bp.route('/host/analytics')
+@login_required
+def host_analytics():
+    """Daily bookings, nights sold, revenue and views across the host's listings for the last `days` days"""
+    if current_user.user_type != 'host':
+        return jsonify({'success': False, 'error': 'Only hosts have analytics'}), 403
+    try:
+        days = min(max(int(request.args.get('days', 30)), 1), MAX_ANALYTICS_DAYS)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid days'}), 400
+    
+    end = date.today()
+    return jsonify({
+        'success': True,
+        'summary': analytics.get_host_summary(current_user.id, days),
+        'trend': analytics.get_host_trend(current_user.id, end - timedelta(days=days), end)
+    })
@@ -1,7 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from app.models import User, Listing, Booking, ListingImage
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 
 bookings_bp = Blueprint('bookings', __name__)
 
@@ -36,7 +36,6 @@ def book_listing(listing_id):
         
         # Get host and images
         host = User.get(listing.host_id)
-        unavailable_dates = listing.get_unavailable_dates()
         listing_images = ListingImage.get_by_listing(listing_id)
         
         # Prepare listing data
@@ -58,8 +57,7 @@ def book_listing(listing_id):
             'host': {
                 'name': host.full_name if host else 'Unknown Host',
                 'avatar': 'user-gear.png'
-            },
-            'unavailable_dates': unavailable_dates
+            }
         }
         
         return render_template('guest/booking.html', listing=listing_data)
@@ -100,9 +98,6 @@ def confirm_booking(listing_id):
             if checkout_date <= checkin_date:
                 errors.append('Check-out date must be after check-in date.')
             
-            if not listing.is_available(checkin_date, checkout_date):
-                errors.append('These dates are not available.')
-            
         except ValueError:
             errors.append('Please enter valid dates.')
         
@@ -120,7 +115,7 @@ def confirm_booking(listing_id):
                 flash(error, 'error')
             return redirect(url_for('bookings.book_listing', listing_id=listing_id))
         
-        # Create booking
+        # Create booking; availability is checked atomically with the insert
         booking = Booking.create(
             listing_id=listing_id,
             user_id=current_user.id,
@@ -132,6 +127,9 @@ def confirm_booking(listing_id):
         if booking:
             flash('Booking request submitted successfully! Waiting for host approval.', 'success')
             return redirect(url_for('main.dashboard'))
+        elif not listing.is_available(checkin_date, checkout_date):
+            flash('These dates are not available.', 'error')
+            return redirect(url_for('bookings.book_listing', listing_id=listing_id))
         else:
             flash('Failed to create booking. Please try again.', 'error')
             return redirect(url_for('bookings.book_listing', listing_id=listing_id))
@@ -145,133 +143,66 @@ def confirm_booking(listing_id):
 def my_bookings():
     """View user's bookings with real-time updates"""
     try:
-        # Debug: Print current user info and authentication status
-        print(f"DEBUG: Current user ID: {current_user.id}, Name: {current_user.name}, Email: {current_user.email}")
-        print(f"DEBUG: User authenticated: {current_user.is_authenticated}")
-        print(f"DEBUG: User type: {getattr(current_user, 'user_type', 'unknown')}")
-        print(f"DEBUG: Session data: {dict(request.cookies)}")
-        
         # Update expired booking statuses first
         try:
             Booking.update_expired_statuses()
         except Exception as e:
-            print(f"DEBUG: Error updating expired statuses: {e}")
-            # Continue without updating expired statuses
+            print(f"Error updating expired statuses: {e}")
         
-        # Get all user bookings
-        try:
-            bookings = Booking.get_by_user(current_user.id)
-            print(f"DEBUG: Found {len(bookings)} bookings for user {current_user.id}")
-        except Exception as e:
-            print(f"DEBUG: Error getting user bookings: {e}")
-            bookings = []
+        # One query returns every booking with its listing, host, confirmer and review flag
+        bookings = Booking.get_timeline(current_user.id)
         
-        # Get upcoming check-ins and recently completed stays
-        try:
-            upcoming_checkins = Booking.get_upcoming_checkins(current_user.id, days_ahead=7)
-        except Exception as e:
-            print(f"DEBUG: Error getting upcoming checkins: {e}")
-            upcoming_checkins = []
-            
-        try:
-            recently_completed = Booking.get_recently_completed(current_user.id, days_back=30)
-        except Exception as e:
-            print(f"DEBUG: Error getting recently completed: {e}")
-            recently_completed = []
+        today = date.today()
+        upcoming_until = today + timedelta(days=7)
+        recent_since = today - timedelta(days=30)
+        upcoming_checkins = [b for b in bookings
+                             if b.status == 'confirmed' and b.check_in and today <= b.check_in <= upcoming_until]
+        upcoming_checkins.sort(key=lambda b: b.check_in)
+        recently_completed = [b for b in bookings
+                              if b.status == 'completed' and b.check_out and recent_since <= b.check_out < today]
+        recently_completed.sort(key=lambda b: b.check_out, reverse=True)
         
-        # Enrich bookings with listing information and real-time data
         enriched_bookings = []
         total_spent = 0
-        
         for booking in bookings:
-            try:
-                listing = Listing.get(booking.listing_id)
-                host = User.get(listing.host_id) if listing else None
-                confirmed_by_user = User.get(booking.confirmed_by) if booking.confirmed_by else None
-            except Exception as e:
-                print(f"DEBUG: Error getting listing/user data for booking {booking.id}: {e}")
-                listing = None
-                host = None
-                confirmed_by_user = None
-            
-            # Skip this booking if we can't get basic data
-            if not listing:
-                print(f"DEBUG: Skipping booking {booking.id} - no listing data")
-                continue
-            
-            # Check if user has already reviewed this booking
-            has_reviewed = False
-            try:
-                if hasattr(booking, 'can_review') and booking.can_review:
-                    from app.models import Review
-                    has_reviewed = Review.has_user_reviewed_booking(current_user.id, booking.id)
-            except Exception as e:
-                print(f"DEBUG: Error checking review status for booking {booking.id}: {e}")
-                has_reviewed = False
-            
             # Calculate total spent for confirmed/completed bookings
-            try:
-                if booking.status in ['confirmed', 'completed']:
-                    total_spent += float(booking.total_price or 0)
-            except Exception as e:
-                print(f"DEBUG: Error calculating total spent for booking {booking.id}: {e}")
-                # Continue with the booking even if price calculation fails
+            if booking.status in ['confirmed', 'completed']:
+                total_spent += float(booking.total_price or 0)
             
-            try:
-                booking_data = {
-                    'id': booking.id,
-                    'booking_id': booking.booking_id,
-                    'user_id': booking.user_id,
-                    'listing_id': booking.listing_id,
-                    'check_in': booking.check_in,
-                    'check_out': booking.check_out,
-                    'guests': booking.guests,
-                    'total_price': booking.total_price,
-                    'total_amount': booking.total_price,  # Alias for template
-                    'status': booking.status,
-                    'created_at': booking.created_at,
-                    'confirmed_by': booking.confirmed_by,
-                    'confirmed_at': booking.confirmed_at,
-                    'confirmed_by_name': confirmed_by_user.full_name if confirmed_by_user else None,
-                    
-                    # Real-time properties - with safe property access
-                    'is_checkin_today': getattr(booking, 'is_checkin_today', False),
-                    'is_checkout_today': getattr(booking, 'is_checkout_today', False),
-                    'days_until_checkin': getattr(booking, 'days_until_checkin', None),
-                    'days_until_checkout': getattr(booking, 'days_until_checkout', None),
-                    'stay_duration': getattr(booking, 'stay_duration', None),
-                    'can_review': getattr(booking, 'can_review', False),
-                    'has_reviewed': has_reviewed,
-                    
-                    'listing': {
-                        'id': getattr(listing, 'id', None) if listing else None,
-                        'title': getattr(listing, 'title', 'Unknown Listing') if listing else 'Unknown Listing',
-                        'location': getattr(listing, 'location', '') if listing else '',
-                        'image': 'demo_listing_1.jpg',
-                        'host_name': getattr(host, 'full_name', 'Unknown Host') if host else 'Unknown Host'
-                    } if listing else None
+            enriched_bookings.append({
+                'id': booking.id,
+                'booking_id': booking.booking_id,
+                'user_id': booking.user_id,
+                'listing_id': booking.listing_id,
+                'check_in': booking.check_in,
+                'check_out': booking.check_out,
+                'guests': booking.guests,
+                'total_price': booking.total_price,
+                'total_amount': booking.total_price,  # Alias for template
+                'status': booking.status,
+                'created_at': booking.created_at,
+                'confirmed_by': booking.confirmed_by,
+                'confirmed_at': booking.confirmed_at,
+                'confirmed_by_name': booking.confirmed_by_name,
+                
+                # Real-time properties
+                'is_checkin_today': booking.is_checkin_today,
+                'is_checkout_today': booking.is_checkout_today,
+                'days_until_checkin': booking.days_until_checkin,
+                'days_until_checkout': booking.days_until_checkout,
+                'stay_duration': booking.stay_duration,
+                'can_review': booking.can_review,
+                'has_reviewed': booking.has_reviewed,
+                
+                'listing': {
+                    'id': booking.listing_id,
+                    'title': booking.listing_title,
+                    'location': booking.listing_location,
+                    'image': booking.listing_image,
+                    'host_id': booking.host_id,
+                    'host_name': booking.host_name
                 }
-                enriched_bookings.append(booking_data)
-            except Exception as e:
-                print(f"DEBUG: Error creating booking data for booking {booking.id}: {e}")
-                # Continue with next booking
-                continue
-        
-        # Sort by creation date
-        try:
-            enriched_bookings.sort(key=lambda x: x.get('created_at', datetime.now()), reverse=True)
-        except Exception as e:
-            print(f"DEBUG: Error sorting bookings: {e}")
-            # Continue without sorting
-        
-        # Debug: Print final data being passed to template
-        print(f"DEBUG: Passing to template - Bookings: {len(enriched_bookings)}, Total spent: {total_spent}")
-        print(f"DEBUG: Upcoming checkins: {len(upcoming_checkins)}, Recently completed: {len(recently_completed)}")
-        print(f"DEBUG: About to render template with {len(enriched_bookings)} bookings")
-        
-        # Check if we're actually going to render the template
-        if len(enriched_bookings) == 0:
-            print("DEBUG: WARNING - No enriched bookings to pass to template!")
+            })
         
         return render_template('guest/my_bookings.html', 
                              bookings=enriched_bookings, 
@@ -281,8 +212,7 @@ def my_bookings():
                              recently_completed=recently_completed)
     
     except Exception as e:
-        print(f"DEBUG: EXCEPTION OCCURRED: {e}")
-        print(f"DEBUG: Exception type: {type(e)}")
+        print(f"Error loading bookings: {e}")
         import traceback
         traceback.print_exc()
         flash('Error loading bookings.', 'error')
@@ -361,9 +291,9 @@ def review_form(booking_id):
             flash('This booking cannot be reviewed yet.', 'error')
             return redirect(url_for('bookings.my_bookings'))
         
-        # Check if user has already reviewed this booking
+        # Guests review each listing once, whichever stay it was for
         from app.models import Review
-        if Review.has_user_reviewed_booking(current_user.id, int(booking_id)):
+        if Review.exists(booking.listing_id, current_user.id):
             flash('You have already reviewed this stay.', 'info')
             return redirect(url_for('bookings.my_bookings'))
         
@@ -405,20 +335,19 @@ def submit_review():
         if not booking.can_review:
             return jsonify({'success': False, 'message': 'This booking cannot be reviewed yet'})
         
-        # Check if user has already reviewed this booking
-        from app.models import Review
-        if Review.has_user_reviewed_booking(current_user.id, int(booking_id)):
+        # Create the review; a guest can review each listing once
+        from app.models import Review, DuplicateReviewError
+        try:
+            review = Review.create(
+                listing_id=booking.listing_id,
+                user_id=current_user.id,
+                rating=float(rating),
+                comment=comment,
+                booking_id=int(booking_id)
+            )
+        except DuplicateReviewError:
             return jsonify({'success': False, 'message': 'You have already reviewed this stay'})
         
-        # Create the review
-        review = Review.create(
-            listing_id=booking.listing_id,
-            user_id=current_user.id,
-            rating=float(rating),
-            comment=comment,
-            booking_id=int(booking_id)
-        )
-        
         if review:
             return jsonify({'success': True, 'message': 'Review submitted successfully'})
         else:
@@ -1,21 +1,69 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, make_response
 from flask_login import login_required, current_user
-from app.models import User, Listing, Review, ListingImage, Location
-from datetime import datetime
+from app.models import User, Listing, Review, ListingImage, Location, DuplicateReviewError
+from app.view_counts import record_view
+from app import amenity_index
+from config import Config
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
 import os
 import uuid
 
 listings_bp = Blueprint('listings', __name__)
 
+# Reviews shown on the detail page before "Show more reviews"
+REVIEWS_PAGE_SIZE = 6
+
 @listings_bp.route('/listing/<int:listing_id>')
 def listing_redirect(listing_id):
     """Redirect singular /listing/ to plural /listings/"""
     return redirect(url_for('listings.listing_detail', listing_id=listing_id), code=301)
 
+def _database_time_to_utc(value):
+    """Aware UTC datetime for a naive timestamp read from MySQL (see Config.DATABASE_TIMEZONE)"""
+    if Config.DATABASE_TIMEZONE:
+        value = value.replace(tzinfo=ZoneInfo(Config.DATABASE_TIMEZONE))
+    else:
+        value = value.astimezone()  # naive values are taken as local time
+    return value.astimezone(timezone.utc)
+
+def _listing_not_modified(etag, last_modified):
+    """Check the request's validators against the listing page's current version"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+    return False
+
+def _set_listing_cache_headers(response, etag, last_modified, shared):
+    """Add validators and let shared caches keep anonymous copies for a short while"""
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    if shared:
+        response.headers['Cache-Control'] = f'public, max-age=0, s-maxage={Config.LISTING_PROXY_MAX_AGE}'
+    else:
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @listings_bp.route('/listings/<int:listing_id>')
 def listing_detail(listing_id):
     """Display detailed listing information"""
     try:
+        # Answer revalidations from the version stamp before loading the page data.
+        # Pages with pending flash messages are one-off and never cached.
+        stamp = Listing.get_version_stamp(listing_id) if '_flashes' not in session else None
+        if stamp:
+            viewer = current_user.id if current_user.is_authenticated else 'anon'
+            etag = f"{stamp['etag']}-{viewer}"
+            last_modified = stamp['last_modified']
+            if last_modified:
+                last_modified = _database_time_to_utc(last_modified)
+            shared = not current_user.is_authenticated
+            if _listing_not_modified(etag, last_modified):
+                record_view(listing_id)
+                return _set_listing_cache_headers(make_response('', 304), etag, last_modified, shared)
+
         listing = Listing.get(listing_id)
         
         if not listing:
@@ -35,25 +83,20 @@ def listing_detail(listing_id):
             """
             return error_html, 404
         
+        record_view(listing_id)
+        
         # Get host information
         host = User.get(listing.host_id)
         
-        # Get reviews
-        reviews = Review.get_by_listing(listing_id)
-        
-        # Get unavailable dates
-        unavailable_dates = listing.get_unavailable_dates()
+        # Get the rating summary and the first page of reviews
+        rating_stats = Review.get_rating_stats(listing_id)
+        reviews = Review.get_by_listing(listing_id, limit=REVIEWS_PAGE_SIZE + 1)
+        next_reviews_cursor = Review.encode_cursor(reviews[REVIEWS_PAGE_SIZE - 1]) if len(reviews) > REVIEWS_PAGE_SIZE else None
+        reviews = reviews[:REVIEWS_PAGE_SIZE]
         
         # Get listing images
         listing_images = ListingImage.get_by_listing(listing_id)
         
-        # Calculate rating
-        avg_rating = 0.0
-        review_count = len(reviews)
-        if reviews:
-            total_rating = sum(review.rating for review in reviews)
-            avg_rating = total_rating / review_count
-        
         # Prepare listing data
         listing_data = {
             'id': listing.id,
@@ -65,8 +108,9 @@ def listing_detail(listing_id):
             'country': listing.country,
             'price': listing.price,
             'price_per_night': listing.price,
-            'rating': avg_rating,
-            'reviews': review_count,
+            'rating': rating_stats['average'],
+            'reviews': rating_stats['count'],
+            'rating_histogram': rating_stats['histogram'],
             'images': [img.image_filename for img in listing_images] if listing_images else ['demo_listing_1.jpg'],
             'image': listing_images[0].image_filename if listing_images else 'demo_listing_1.jpg',
             'type': listing.property_type.title(),
@@ -84,11 +128,22 @@ def listing_detail(listing_id):
                 'joined': host.joined_date.year if host else '2023',
                 'verified': host.verified if host else False,
                 'bio': host.bio if host else ''
-            },
-            'unavailable_dates': unavailable_dates
+            }
         }
         
-        return render_template('host/listing_detail.html', listing=listing_data, reviews=reviews)
+        if not stamp:
+            return render_template('host/listing_detail.html', listing=listing_data, reviews=reviews,
+                                   next_reviews_cursor=next_reviews_cursor)
+        
+        if shared:
+            # Shared copies must not carry anyone's session CSRF token; rendering
+            # without one also keeps the response free of a Set-Cookie header
+            html = render_template('host/listing_detail.html', listing=listing_data, reviews=reviews,
+                                   next_reviews_cursor=next_reviews_cursor, csrf_token=lambda: '')
+        else:
+            html = render_template('host/listing_detail.html', listing=listing_data, reviews=reviews,
+                                   next_reviews_cursor=next_reviews_cursor)
+        return _set_listing_cache_headers(make_response(html), etag, last_modified, shared)
     
     except Exception as e:
         print(f"ERROR in listing_detail: {str(e)}")
@@ -127,15 +182,13 @@ def add_review(listing_id):
             flash('Invalid rating value.', 'error')
             return redirect(url_for('listings.listing_detail', listing_id=listing_id))
         
-        # Check if user has already reviewed
-        existing_reviews = Review.get_by_listing(listing_id)
-        for review in existing_reviews:
-            if review.user_id == current_user.id:
-                flash('You have already reviewed this listing.', 'error')
-                return redirect(url_for('listings.listing_detail', listing_id=listing_id))
+        # Create review; the unique (listing, reviewer) key rejects a second one
+        try:
+            review = Review.create(listing_id, current_user.id, rating, comment)
+        except DuplicateReviewError:
+            flash('You have already reviewed this listing.', 'error')
+            return redirect(url_for('listings.listing_detail', listing_id=listing_id))
         
-        # Create review
-        review = Review.create(listing_id, current_user.id, rating, comment)
         if review:
             flash('Your review has been added successfully!', 'success')
         else:
@@ -427,14 +480,16 @@ def edit_listing(listing_id):
             # Validate required fields
             if not all([title, description, price, property_type, guests]):
                 flash('All fields are required.', 'error')
-                return render_template('host/edit_listing.html', listing=listing)
+                return render_template('host/edit_listing.html', listing=listing,
+                                       amenity_choices=amenity_index.AMENITIES)
             
             try:
                 price = float(price)
                 guests = int(guests)
             except ValueError:
                 flash('Price must be a number and guests must be an integer.', 'error')
-                return render_template('host/edit_listing.html', listing=listing)
+                return render_template('host/edit_listing.html', listing=listing,
+                                       amenity_choices=amenity_index.AMENITIES)
             
             # Update the listing
             success = listing.update(
@@ -452,7 +507,8 @@ def edit_listing(listing_id):
             else:
                 flash('Failed to update listing. Please try again.', 'error')
         
-        return render_template('host/edit_listing.html', listing=listing)
+        return render_template('host/edit_listing.html', listing=listing,
+                               amenity_choices=amenity_index.AMENITIES)
     
     except Exception as e:
         flash('Error updating listing.', 'error')
@@ -2,49 +2,78 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_required, current_user
 from app.models import User, Listing, Booking, Review, ListingImage, Message
 from app.database import db
+from app import amenity_index, cache, catalog, pricing, text_search
+from config import Config
 from datetime import datetime
 
 main_bp = Blueprint('main', __name__)
 
+def _hosting_stats(all_listings):
+    """Homepage hosting statistics, cached until the catalog changes or the TTL expires"""
+    def compute():
+        booking_result = db.execute_query("SELECT COUNT(*) as count FROM bookings")
+        
+        ratings = [l.rating for l in all_listings if hasattr(l, 'rating') and l.rating > 0]
+        avg_rating = round(sum(ratings) / len(ratings), 1) if ratings else 0.0
+        
+        unique_hosts = set()
+        for listing in all_listings:
+            if hasattr(listing, 'host_id') and listing.host_id:
+                unique_hosts.add(listing.host_id)
+        
+        return {
+            'total_listings': len(all_listings),
+            'total_bookings': booking_result[0]['count'] if booking_result else 0,
+            'avg_rating': avg_rating,
+            'total_hosts': len(unique_hosts),
+            'version': cache.catalog_version()
+        }
+    
+    return cache.fragment_cache.get_or_set(('hosting-stats-data', cache.catalog_version()), compute,
+                                           ttl=Config.PAGE_CACHE_TTL)
+
+def _listing_card(listing):
+    """Template data for a listing card; 'version' keys the card's fragment cache"""
+    return {
+        'id': listing.id,
+        'version': cache.listing_version(listing.id),
+        'title': listing.title,
+        'location': listing.location,
+        'price': listing.price,
+        'rating': round(listing.rating, 1),
+        'reviews': listing.reviews_count,
+        'image': listing.images[0] if listing.images else 'demo_listing_1.jpg',
+        'type': listing.property_type.title(),
+        'guests': listing.guests,
+        'room_type': listing.room_type,
+        'price_per_night': listing.price
+    }
+
 @main_bp.route('/')
 def index():
     """Homepage - explore all listings with featured content"""
+    # Anonymous visitors without pending flash messages all see the same page
+    page_cacheable = not current_user.is_authenticated and not session.get('_flashes')
+    if page_cacheable:
+        cached_page = cache.get_page('index')
+        if cached_page:
+            return cache.page_response(*cached_page)
+    
     try:
-        # Get all listings from database
+        # Get all listings from database (already includes images and rating)
         all_listings = Listing.get_all()
+        listings_data = [_listing_card(listing) for listing in all_listings]
         
-        # Convert to format expected by template (show all listings)
-        listings_data = []
-        for listing in all_listings:
-            listing_images = ListingImage.get_by_listing(listing.id)
-            listing_reviews = Review.get_by_listing(listing.id)
-            avg_rating = 0.0
-            review_count = len(listing_reviews)
-            if listing_reviews:
-                total_rating = sum(review.rating for review in listing_reviews)
-                avg_rating = round(total_rating / review_count, 1)
-            
-            listings_data.append({
-                'id': listing.id,
-                'title': listing.title,
-                'location': listing.location,
-                'price': listing.price,
-                'rating': avg_rating,
-                'reviews': review_count,
-                'image': listing_images[0].image_filename if listing_images else 'demo_listing_1.jpg',
-                'type': listing.property_type.title(),
-                'guests': listing.guests
-            })
-        
-        # Get recent reviews for the homepage
-        all_reviews = Review.get_all()
-        recent_reviews = sorted(all_reviews, key=lambda x: x.created_date, reverse=True)[:6]
+        # Get recent reviews for the homepage, with their guests and listings in one query each
+        recent_reviews = Review.get_all(limit=6)
+        guests = {user.id: user for user in User.get_many(dict.fromkeys(r.user_id for r in recent_reviews))}
+        reviewed = {l.id: l for l in Listing.get_many(dict.fromkeys(r.listing_id for r in recent_reviews))}
         
         # Convert reviews to format expected by template
         reviews_data = []
         for review in recent_reviews:
-            guest = User.get(review.user_id)
-            listing = Listing.get(review.listing_id)
+            guest = guests.get(review.user_id)
+            listing = reviewed.get(review.listing_id)
             
             reviews_data.append({
                 'guest_name': guest.name if guest else 'Anonymous Guest',
@@ -54,28 +83,14 @@ def index():
                 'listing_title': listing.title if listing else 'Unknown Listing'
             })
         
-        # Calculate hosting statistics
-        all_bookings = Booking.get_all()
-        
-        ratings = [l.rating for l in all_listings if hasattr(l, 'rating') and l.rating > 0]
-        avg_rating = round(sum(ratings) / len(ratings), 1) if ratings else 0.0
-        
-        unique_hosts = set()
-        for listing in all_listings:
-            if hasattr(listing, 'host_id') and listing.host_id:
-                unique_hosts.add(listing.host_id)
-        
-        hosting_stats = {
-            'total_listings': len(all_listings),
-            'total_bookings': len(all_bookings),
-            'avg_rating': avg_rating,
-            'total_hosts': len(unique_hosts)
-        }
+        html = render_template('explore.html', 
+                               listings=listings_data, 
+                               reviews=reviews_data, 
+                               hosting_stats=_hosting_stats(all_listings))
         
-        return render_template('explore.html', 
-                             listings=listings_data, 
-                             reviews=reviews_data, 
-                             hosting_stats=hosting_stats)
+        if page_cacheable:
+            return cache.page_response(*cache.store_page('index', html))
+        return html
         
     except Exception as e:
         flash('Error loading homepage data.', 'error')
@@ -86,77 +101,139 @@ def index():
                                  'total_listings': 0,
                                  'total_bookings': 0,
                                  'avg_rating': 0.0,
-                                 'total_hosts': 0
+                                 'total_hosts': 0,
+                                 'version': -1
                              })
 
+def _float_arg(name):
+    """Query-string float, or None when missing or malformed"""
+    try:
+        return float(request.args[name])
+    except (KeyError, ValueError):
+        return None
+
+def _search_page_url(page):
+    return url_for('main.search', **{**request.args.to_dict(flat=False), 'page': page})
+
 @main_bp.route('/search')
 def search():
-    """Search listings with filters"""
+    """Search listings with filters, one page at a time"""
     try:
         query = request.args.get('query', '')
+        if not text_search.has_terms(query):
+            # Punctuation and the like: nothing to match on
+            query = ''
         location = request.args.get('location', '')
         checkin = request.args.get('checkin', '')
         checkout = request.args.get('checkout', '')
         guests = request.args.get('guests', '')
+        sort = request.args.get('sort', '')
+        amenities = [key for key in request.args.getlist('amenities') if key in amenity_index.BITS]
+        room_types = [room_type for room_type in request.args.getlist('room_type') if room_type in catalog.ROOM_TYPES]
+        min_price = _float_arg('min_price')
+        max_price = _float_arg('max_price')
+        lat, lon, radius = _float_arg('lat'), _float_arg('lon'), _float_arg('radius')
+        near = (lat, lon) if lat is not None and lon is not None else None
+        page = max(request.args.get('page', 1, type=int), 1)
+        page_size = Config.SEARCH_PAGE_SIZE
         
-        listings = Listing.get_all()
+        filters = {
+            'min_price': min_price,
+            'max_price': max_price,
+            'room_types': room_types,
+            'amenity_mask': amenity_index.to_mask(amenities),
+            'near': near,
+            'radius_km': radius if near else None,
+        }
+        
+        if sort in ('price', 'rating'):
+            order = sort
+        elif query:
+            order = 'rank'
+        elif near:
+            order = 'distance'
+        else:
+            order = 'newest'
+        
+        if query:
+            matches = text_search.match(query)
+            if order == 'rank':
+                # Best-scored matches first; the rest, past the ranking cap, newest listing id first
+                ranked = [listing_id for listing_id in text_search.search(query) if listing_id in matches]
+                ranked_set = set(ranked)
+                filters['listing_ids'] = ranked + sorted((i for i in matches if i not in ranked_set), reverse=True)
+            else:
+                filters['listing_ids'] = matches
         
-        # Apply filters
         if location:
-            listings = [l for l in listings if location.lower() in l.location.lower()]
+            matches = text_search.match_location(location)
+            filters['listing_ids'] = [listing_id for listing_id in filters.get('listing_ids', matches)
+                                      if listing_id in matches]
         
+        stay = None
         if checkin and checkout:
             try:
-                from datetime import datetime
                 checkin_date = datetime.strptime(checkin, '%Y-%m-%d').date()
                 checkout_date = datetime.strptime(checkout, '%Y-%m-%d').date()
-                listings = [l for l in listings if l.is_available(checkin_date, checkout_date)]
+                if checkout_date > checkin_date:
+                    stay = (checkin_date, checkout_date)
+                filters['exclude_ids'] = Listing.get_unavailable_listing_ids(checkin_date, checkout_date)
             except ValueError:
                 pass
         
+        guest_count = 1
         if guests:
             try:
                 guest_count = int(guests)
-                listings = [l for l in listings if l.guests >= guest_count]
+                filters['guests'] = guest_count
             except ValueError:
                 pass
         
-        # Convert to template format
-        listings_data = []
-        for listing in listings:
-            listing_images = ListingImage.get_by_listing(listing.id)
-            listing_reviews = Review.get_by_listing(listing.id)
-            avg_rating = 0.0
-            review_count = len(listing_reviews)
-            if listing_reviews:
-                total_rating = sum(review.rating for review in listing_reviews)
-                avg_rating = round(total_rating / review_count, 1)
-            
-            listings_data.append({
-                'id': listing.id,
-                'title': listing.title,
-                'location': listing.location,
-                'price': listing.price,
-                'rating': avg_rating,
-                'reviews': review_count,
-                'image': listing_images[0].image_filename if listing_images else 'demo_listing_1.jpg',
-                'type': listing.property_type.title(),
-                'guests': listing.guests,
-                'room_type': listing.room_type,
-                'price_per_night': listing.price
-            })
+        offset = (page - 1) * page_size
+        if stay and sort == 'total_price':
+            # The stay price depends on each listing's rules: quote every match, then page
+            result = catalog.search(order='price', **filters)
+            quotes = pricing.quote_prices(catalog.prices(result['ids']), stay[0], stay[1], max(guest_count, 1))
+            ranked = sorted(quotes, key=lambda listing_id: (quotes[listing_id]['total'], listing_id))
+            page_ids = ranked[offset:offset + page_size]
+        else:
+            result = catalog.search(order=order, offset=offset, limit=page_size, **filters)
+            page_ids = result['ids']
         
+        # Only the listings on this page are loaded
+        listings = Listing.get_many(page_ids)
+        listings_data = [_listing_card(listing) for listing in listings]
+        
+        # With stay dates, show the full price of the stay
+        if stay:
+            quotes = pricing.quote_many(listings, stay[0], stay[1], max(guest_count, 1))
+            for card in listings_data:
+                card['total_price'] = quotes[card['id']]['total']
+        
+        total = result['total']
         return render_template('host/search.html', 
                              listings=listings_data,
+                             total=total,
+                             page=page,
+                             prev_url=_search_page_url(page - 1) if page > 1 else None,
+                             next_url=_search_page_url(page + 1) if offset + page_size < total else None,
                              query=query, 
                              location=location,
                              checkin=checkin,
                              checkout=checkout,
-                             guests=guests)
+                             guests=guests,
+                             sort=sort,
+                             min_price=min_price,
+                             max_price=max_price,
+                             near=near,
+                             radius=radius,
+                             room_types=room_types,
+                             amenity_choices=amenity_index.AMENITIES,
+                             selected_amenities=amenities)
     
     except Exception as e:
         flash('Error performing search.', 'error')
-        return render_template('host/search.html', listings=[])
+        return render_template('host/search.html', listings=[], total=0)
 
 @main_bp.route('/test-password/<password>')
 def test_password(password):
@@ -373,38 +450,56 @@ def book_listing(listing_id):
     """Booking page - redirect to bookings blueprint"""
     return redirect(url_for('bookings.book_listing', listing_id=listing_id))
 
+def _readiness():
+    """Readiness check built from connection state, without scanning tables
+
+    A busy pool makes transactions queue for up to MYSQL_POOL_TIMEOUT seconds
+    rather than fail, so saturation and the number of waiting callers are
+    reported (here and on /metrics) but do not fail the check.
+    """
+    pool_status = db.get_pool_status()
+    database_ready = False
+    if pool_status['connected']:
+        try:
+            database_ready = db.connection.is_connected()
+        except Exception:
+            database_ready = False
+    
+    ready = database_ready
+    return ready, {
+        'status': 'ready' if ready else 'unavailable',
+        'timestamp': str(datetime.now()),
+        'database': {
+            'connected': database_ready,
+            'pool_size': pool_status['pool_size'],
+            'pool_in_use': pool_status['in_use'],
+            'pool_saturated': pool_status['in_use'] >= pool_status['pool_size'],
+            'pool_waiting': pool_status['waiting']
+        }
+    }
+
+@main_bp.route('/health/live')
+def liveness_check():
+    """Liveness probe - the process is up and serving requests"""
+    return jsonify({'status': 'alive', 'timestamp': str(datetime.now())})
+
+@main_bp.route('/health/ready')
+def readiness_check():
+    """Readiness probe - the database connection can take traffic"""
+    ready, health_data = _readiness()
+    return jsonify(health_data), 200 if ready else 503
+
 @main_bp.route('/health')
 def health_check():
     """Health check endpoint to monitor application and database status"""
     try:
-        # Check database connection
-        db_status = db.get_connection_info()
-        
-        # Test database query
-        try:
-            from app.models import User
-            user_count = len(User.get_all()) if hasattr(User, 'get_all') else 0
-            db_working = True
-        except Exception as e:
-            db_working = False
-            user_count = 0
-        
-        health_data = {
-            'status': 'healthy' if db_working else 'unhealthy',
-            'timestamp': str(datetime.now()),
-            'database': {
-                'status': db_status,
-                'working': db_working,
-                'user_count': user_count
-            },
-            'application': {
-                'flask': True,
-                'blueprints': True
-            }
+        ready, health_data = _readiness()
+        health_data['status'] = 'healthy' if ready else 'unhealthy'
+        health_data['application'] = {
+            'flask': True,
+            'blueprints': True
         }
-        
-        status_code = 200 if db_working else 503
-        return jsonify(health_data), status_code
+        return jsonify(health_data), 200 if ready else 503
         
     except Exception as e:
         return jsonify({
@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash
 from flask_login import login_required, current_user
 from app.models import Message, User
+from app import presence
 
 messages_bp = Blueprint('messages', __name__, url_prefix='/messages')
 
@@ -12,6 +13,9 @@ def messages():
         # Get user's conversations
         conversations_data = Message.get_user_conversations(current_user.id)
         
+        # Online status for the whole inbox in one lookup
+        online = presence.presence([conv_data['other_user_id'] for conv_data in conversations_data])
+        
         # Process conversations to get user details
         conversations = []
         for conv_data in conversations_data:
@@ -40,7 +44,7 @@ def messages():
                         'user_id': other_user.id,
                         'name': other_user.name,
                         'profile_photo': other_user.profile_photo,
-                        'is_online': False  # TODO: Implement online status
+                        'is_online': online.get(other_user_id, False)
                     },
                     'last_message': {
                         'content': conv_data['last_message_content'] or 'No messages yet',
@@ -189,6 +193,25 @@ def get_unread_count():
             'count': 0
         })
 
+# Most users one presence request may ask about
+MAX_PRESENCE_USERS = 200
+
+@messages_bp.route('/presence')
+@login_required
+def get_presence():
+    """Online status for a comma-separated list of user ids (?user_ids=1,2,3)"""
+    try:
+        user_ids = [int(user_id) for user_id in request.args.get('user_ids', '').split(',') if user_id.strip()]
+    except ValueError:
+        return jsonify({'success': False, 'message': 'user_ids must be integers'}), 400
+    if len(user_ids) > MAX_PRESENCE_USERS:
+        return jsonify({'success': False, 'message': f'At most {MAX_PRESENCE_USERS} user ids'}), 400
+    
+    return jsonify({
+        'success': True,
+        'online': {str(user_id): is_online for user_id, is_online in presence.presence(user_ids).items()}
+    })
+
 @messages_bp.route('/upload-attachment', methods=['POST'])
 @login_required
 def upload_attachment():
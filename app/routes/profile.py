@@ -6,6 +6,7 @@ import os
 import time
 from app.models import User
 from app.database import db
+from app import counters
 
 profile_bp = Blueprint("profile", __name__)
 
@@ -13,7 +14,8 @@ profile_bp = Blueprint("profile", __name__)
 @login_required
 def profile():
     """User profile page for all user types"""
-    return render_template('profile/profile.html', user=current_user)
+    return render_template('profile/profile.html', user=current_user,
+                         counts=counters.get_counts(current_user.id))
 
 @profile_bp.route("/profile/edit", methods=['GET', 'POST'])
 @login_required
@@ -153,47 +155,21 @@ def update_privacy_settings():
 def my_listings():
     """User's property listings (for hosts)"""
     if current_user.user_type == 'host':
-        # Get user's listings from database
-        from app.models import Listing, Booking, Review
+        from app.models import Listing
+        from app import analytics
         
         try:
-            # Get user's listings
-            listings = Listing.get_by_host(current_user.id)
-            print(f"DEBUG: My Listings - Retrieved {len(listings)} listings")
-            
-            # Get booking counts and add missing attributes for each listing
-            total_bookings = 0
-            for listing in listings:
-                print(f"  - Listing: {listing.title} (ID: {listing.id})")
-                
-                # Get booking count for this listing
-                booking_query = "SELECT COUNT(*) as count FROM bookings WHERE listing_id = %s"
-                booking_result = db.execute_query(booking_query, (listing.id,))
-                booking_count = booking_result[0]['count'] if booking_result else 0
-                
-                # Add missing attributes to the listing object
-                listing.booking_count = booking_count
-                total_bookings += booking_count
-                
-                # Ensure images is always a list and get the images for this listing
-                if not hasattr(listing, 'images') or listing.images is None:
-                    from app.models import ListingImage
-                    images = ListingImage.get_by_listing(listing.id)
-                    listing.images = [img.image_filename for img in images] if images else []
-                
-                # Ensure other required attributes exist
-                if not hasattr(listing, 'reviews_count'):
-                    listing.reviews_count = 0
-                if not hasattr(listing, 'rating'):
-                    listing.rating = 0.0
-            
-            print(f"DEBUG: Rendering template with {len(listings)} listings")
+            # Listings with booking counts, ratings, images and occupancy in a fixed number of queries
+            listings = Listing.get_host_portfolio(current_user.id)
+            total_bookings = sum(listing.booking_count for listing in listings)
+            summary = analytics.get_host_summary(current_user.id)
             
             return render_template('host/my_listings.html', 
                                  listings=listings,
                                  total_bookings=total_bookings,
                                  pending_listings=0,  # You can implement this later
-                                 total_views=0)  # You can implement this later
+                                 total_views=summary['total_views'],
+                                 analytics=summary)
         except Exception as e:
             print(f"Error loading listings: {str(e)}")
             import traceback
@@ -222,19 +198,20 @@ def api_profile_data():
         )
         
         # Get statistics based on user type
+        counts = counters.get_counts(current_user.id)
         statistics = {
-            'favorites': len(current_user.favorites) if current_user.favorites else 0,
-            'reviews': 0  # Placeholder for review count
+            'favorites': counts['favorites'],
+            'reviews': counts['reviews']
         }
         
         if current_user.user_type == 'host':
             statistics.update({
-                'properties': len(current_user.listings) if current_user.listings else 0,
-                'host_bookings': len(current_user.host_bookings) if current_user.host_bookings else 0
+                'properties': counts['properties'],
+                'host_bookings': counts['host_bookings']
             })
         else:
             statistics.update({
-                'bookings': len(current_user.guest_bookings) if current_user.guest_bookings else 0
+                'bookings': counts['bookings']
             })
         
         # Add verification status
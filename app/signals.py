@@ -0,0 +1,18 @@
+"""
+Application signals for cache and index invalidation
+
+Models send these after their writes commit; caches and in-memory indexes
+subscribe to them instead of being called from every write path.
+"""
+from blinker import Namespace
+from app.database import db
+
+_signals = Namespace()
+
+# Sent with listing_id=<id> and reason='created'|'updated'|'deleted'|'images'|'reviews'
+listing_changed = _signals.signal('listing-changed')
+
+
+def notify_listing_changed(listing_id, reason):
+    """Send listing_changed once the current transaction (if any) commits"""
+    db.on_commit(lambda: listing_changed.send(None, listing_id=listing_id, reason=reason))
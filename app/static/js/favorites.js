@@ -11,6 +11,9 @@ function initializeFavorites() {
     // Initialize favorite buttons
     initializeFavoriteButtons();
     
+    // Fill in heart icons for every card on the page with one request
+    loadFavoriteStates();
+    
     // Initialize favorites page functionality
     initializeFavoritesPage();
     
@@ -43,6 +46,70 @@ function initializeFavoriteButtons() {
     });
 }
 
+/**
+ * Mark the favorite buttons of listings the user has saved
+ */
+async function loadFavoriteStates() {
+    const buttons = document.querySelectorAll('.favorite-btn[data-listing-id]:not(.active)');
+    const listingIds = [...new Set(Array.from(buttons, button => parseInt(button.dataset.listingId, 10)))];
+    
+    if (listingIds.length === 0) return;
+    
+    try {
+        const response = await fetch('/api/favorites/check', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': getCSRFToken()
+            },
+            body: JSON.stringify({ listing_ids: listingIds })
+        });
+        
+        // Signed-out visitors have no favorites to show
+        if (!response.ok) return;
+        
+        const data = await response.json();
+        const favorited = new Set(data.favorited_ids || []);
+        
+        buttons.forEach(button => {
+            const heartIcon = button.querySelector('i');
+            if (heartIcon) {
+                setFavoriteButtonState(button, heartIcon, favorited.has(parseInt(button.dataset.listingId, 10)));
+            }
+        });
+    } catch (error) {
+        console.error('Error loading favorite states:', error);
+    }
+}
+
+/**
+ * Update a favorite button's icon and title
+ * @param {HTMLElement} button - The favorite button element
+ * @param {HTMLElement} heartIcon - The heart icon element
+ * @param {boolean} isFavorite - Whether the listing is favorited
+ */
+function setFavoriteButtonState(button, heartIcon, isFavorite) {
+    if (isFavorite) {
+        heartIcon.classList.remove('bi-heart');
+        heartIcon.classList.add('bi-heart-fill');
+        button.classList.add('text-danger');
+        button.title = 'Remove from favorites';
+    } else {
+        heartIcon.classList.remove('bi-heart-fill');
+        heartIcon.classList.add('bi-heart');
+        button.classList.remove('text-danger');
+        button.title = 'Add to favorites';
+    }
+}
+
+/**
+ * Read the CSRF token rendered into the page head
+ */
+function getCSRFToken() {
+    const meta = document.querySelector('meta[name="csrf-token"]');
+    return meta ? meta.getAttribute('content') : '';
+}
+
 /**
  * Initialize favorites page functionality
  */
@@ -98,12 +165,17 @@ function initializeFavoriteFilters() {
 async function toggleFavoriteStatus(button, listingId, heartIcon) {
     try {
         const config = window.OtithiConfig?.API || {};
-        const endpoint = config.LISTINGS || '/api/listings';
-        const response = await fetch(`${endpoint}/${listingId}/favorite`, {
+        const endpoint = config.FAVORITES || '/api/favorites';
+        const response = await fetch(endpoint, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
-            }
+                'X-CSRFToken': getCSRFToken()
+            },
+            body: JSON.stringify({
+                listing_id: listingId,
+                action: heartIcon.classList.contains('bi-heart-fill') ? 'remove' : 'add'
+            })
         });
         
         if (!response.ok) {
@@ -114,21 +186,11 @@ async function toggleFavoriteStatus(button, listingId, heartIcon) {
         
         if (data.success) {
             // Update button appearance
-            if (data.isFavorite) {
-                heartIcon.classList.remove('bi-heart');
-                heartIcon.classList.add('bi-heart-fill');
-                button.classList.add('text-danger');
-                button.title = 'Remove from favorites';
-            } else {
-                heartIcon.classList.remove('bi-heart-fill');
-                heartIcon.classList.add('bi-heart');
-                button.classList.remove('text-danger');
-                button.title = 'Add to favorites';
-            }
+            setFavoriteButtonState(button, heartIcon, data.is_favorited);
             
             showNotification(data.message, 'success');
         } else {
-            showNotification(data.message, 'error');
+            showNotification(data.error, 'error');
         }
     } catch (error) {
         console.error('Error toggling favorite:', error);
@@ -144,12 +206,14 @@ async function toggleFavoriteStatus(button, listingId, heartIcon) {
 async function removeFromFavorites(button, listingId) {
     try {
         const config = window.OtithiConfig?.API || {};
-        const endpoint = config.LISTINGS || '/api/listings';
-        const response = await fetch(`${endpoint}/${listingId}/favorite`, {
-            method: 'DELETE',
+        const endpoint = config.FAVORITES || '/api/favorites';
+        const response = await fetch(endpoint, {
+            method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
-            }
+                'X-CSRFToken': getCSRFToken()
+            },
+            body: JSON.stringify({ listing_id: listingId, action: 'remove' })
         });
         
         if (!response.ok) {
@@ -178,7 +242,7 @@ async function removeFromFavorites(button, listingId) {
             
             showNotification('Removed from favorites', 'success');
         } else {
-            showNotification(data.message || 'Failed to remove from favorites', 'error');
+            showNotification(data.error || 'Failed to remove from favorites', 'error');
         }
     } catch (error) {
         console.error('Error removing from favorites:', error);
@@ -363,11 +427,13 @@ function bulkRemoveFavorites() {
             const card = checkbox.closest('.listing-card');
             const listingId = card.dataset.listingId;
             
-            return fetch(`/api/listings/${listingId}/favorite`, {
-                method: 'DELETE',
+            return fetch('/api/favorites', {
+                method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
-                }
+                    'X-CSRFToken': getCSRFToken()
+                },
+                body: JSON.stringify({ listing_id: listingId, action: 'remove' })
             });
         });
         
@@ -0,0 +1,417 @@
+"""
+Keyword search over listings
+
+search(query) ranks active listings by title, description, city and
+amenities, and match(query) returns every listing it would rank, unranked
+and uncapped; match_location(text) finds the listings at a city, country or
+address. Both match every word of the input, the last one as a prefix, so
+results narrow as the user types ("gulshan balc" finds balconies in Gulshan).
+
+Backends (SEARCH_BACKEND):
+
+    memory  an inverted index in this process, loaded in the background as
+            the worker starts and kept current as a ListingMirror (see
+            app/listing_mirror.py). Ranking is BM25 with per-field weights.
+            Until the index is loaded, queries go to the mysql backend.
+    mysql   InnoDB FULLTEXT indexes on listings and locations. Ranking is
+            MySQL's relevance score and, because the words may be split
+            between the two tables, a listing matches if any word does.
+
+A backend provides search(query, limit), match(query), match_location(text),
+refresh_listing(listing_id) and remove_listing(listing_id).
+"""
+import heapq
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+from itertools import islice
+from config import Config
+from app.database import db
+from app.listing_mirror import ListingMirror, warmer
+from app.signals import listing_changed
+
+TOKEN_RE = re.compile(r'[^\W_]+')
+
+STOPWORDS = frozenset((
+    'a', 'an', 'and', 'at', 'by', 'for', 'from', 'in', 'is', 'near', 'of', 'on', 'or', 'the', 'to', 'with'
+))
+
+# Field weights: a word in the title counts three times one in the description
+TEXT_FIELDS = {'title': 3.0, 'city': 2.0, 'amenities': 1.5, 'description': 1.0}
+LOCATION_FIELDS = {'city': 1.0, 'country': 1.0, 'address': 1.0}
+
+# Vocabulary terms a trailing prefix may expand to
+MAX_PREFIX_TERMS = 32
+
+# Matches scored per query; the rest of a very common word's postings are skipped
+MAX_CANDIDATES = 1000
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    """Lowercase words of text; amenity keys like air_conditioning split on the underscore"""
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+def _query_terms(text):
+    tokens = tokenize(text)
+    # Drop stopwords unless the query is nothing but stopwords
+    return [token for token in tokens if token not in STOPWORDS] or tokens
+
+
+def _unique(iterable):
+    seen = set()
+    for item in iterable:
+        if item not in seen:
+            seen.add(item)
+            yield item
+
+
+class InvertedIndex:
+    """Weighted-field inverted index with BM25 ranking and prefix expansion
+
+    Each posting stores its document's BM25 term weight (the saturated,
+    length-normalised term frequency), and every term keeps its postings in
+    descending weight order as well. A query walks the postings of its rarest
+    word best-first, checks the other words by dictionary lookup and stops
+    after MAX_CANDIDATES matches, so a query costs the same on 100k listings
+    as on 1k. Weights use the average document length at the time a document
+    was added; load() recomputes them all.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+        self._postings = {}   # term -> {doc_id: weight}
+        self._ranked = {}     # term -> [(-weight, doc_id)], sorted
+        self._doc_terms = {}  # doc_id -> {term: weighted term frequency}
+        self._doc_len = {}
+        self._total_len = 0.0
+        self._vocab = []      # sorted terms, for prefix expansion
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._doc_len
+
+    def _analyze(self, values):
+        frequencies = {}
+        length = 0.0
+        for field, weight in self.fields.items():
+            for token in tokenize(values.get(field)):
+                frequencies[token] = frequencies.get(token, 0.0) + weight
+                length += weight
+        return frequencies, length
+
+    @staticmethod
+    def _weight(tf, length, avg_len):
+        return tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_len))
+
+    def load(self, documents):
+        """Replace the whole index with documents given as (doc_id, {field: text}) pairs"""
+        analyzed = {doc_id: self._analyze(values) for doc_id, values in documents}
+        total_len = sum(length for _, length in analyzed.values())
+        avg_len = total_len / len(analyzed) if analyzed and total_len else 1.0
+        postings = {}
+        for doc_id, (frequencies, length) in analyzed.items():
+            for term, tf in frequencies.items():
+                postings.setdefault(term, {})[doc_id] = self._weight(tf, length, avg_len)
+        ranked = {term: sorted((-weight, doc_id) for doc_id, weight in docs.items())
+                  for term, docs in postings.items()}
+        with self._lock:
+            self._postings = postings
+            self._ranked = ranked
+            self._doc_terms = {doc_id: frequencies for doc_id, (frequencies, _) in analyzed.items()}
+            self._doc_len = {doc_id: length for doc_id, (_, length) in analyzed.items()}
+            self._total_len = total_len
+            self._vocab = sorted(postings)
+
+    def add(self, doc_id, values):
+        """Index a document given {field: text}, replacing any earlier version"""
+        frequencies, length = self._analyze(values)
+        with self._lock:
+            self._remove(doc_id)
+            self._doc_terms[doc_id] = frequencies
+            self._doc_len[doc_id] = length
+            self._total_len += length
+            avg_len = self._total_len / len(self._doc_len) or 1.0
+            for term, tf in frequencies.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                    self._ranked[term] = []
+                    insort(self._vocab, term)
+                weight = self._weight(tf, length, avg_len)
+                postings[doc_id] = weight
+                insort(self._ranked[term], (-weight, doc_id))
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        frequencies = self._doc_terms.pop(doc_id, None)
+        if frequencies is None:
+            return
+        self._total_len -= self._doc_len.pop(doc_id)
+        for term in frequencies:
+            postings = self._postings[term]
+            ranked = self._ranked[term]
+            del ranked[bisect_left(ranked, (-postings.pop(doc_id), doc_id))]
+            if not postings:
+                del self._postings[term]
+                del self._ranked[term]
+                del self._vocab[bisect_left(self._vocab, term)]
+
+    def _expand(self, prefix):
+        """The term itself and up to MAX_PREFIX_TERMS vocabulary terms starting with it"""
+        start = bisect_left(self._vocab, prefix)
+        terms = []
+        for term in self._vocab[start:start + MAX_PREFIX_TERMS]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def _groups(self, text):
+        """Per query word, the terms it matches; None if some word matches nothing"""
+        words = _query_terms(text)
+        if not words:
+            return None
+        groups = []
+        for position, word in enumerate(words):
+            terms = self._expand(word) if position == len(words) - 1 else [word]
+            terms = [term for term in terms if term in self._postings]
+            if not terms:
+                return None
+            # Likeliest match first, so membership checks stop early
+            terms.sort(key=lambda term: len(self._postings[term]), reverse=True)
+            groups.append(terms)
+        return groups
+
+    def match(self, text):
+        """Ids of documents containing every word of text"""
+        with self._lock:
+            groups = self._groups(text)
+            if not groups:
+                return set()
+            keysets = [set().union(*(self._postings[term] for term in terms)) if len(terms) > 1
+                       else self._postings[terms[0]].keys() for terms in groups]
+            keysets.sort(key=len)
+            matches = set(keysets[0])
+            for keys in keysets[1:]:
+                matches.intersection_update(keys)
+            return matches
+
+    def search(self, text, limit):
+        """Ids of documents containing every word of text, best BM25 score first"""
+        with self._lock:
+            groups = self._groups(text)
+            if not groups:
+                return []
+            count = len(self._doc_len)
+
+            def scored_terms(terms):
+                scored = []
+                for term in terms:
+                    df = len(self._postings[term])
+                    scored.append((self._postings[term], math.log(1 + (count - df + 0.5) / (df + 0.5))))
+                return scored
+
+            groups.sort(key=lambda terms: sum(len(self._postings[term]) for term in terms))
+            driver, others = groups[0], [scored_terms(terms) for terms in groups[1:]]
+            driver_terms = scored_terms(driver)
+
+            if len(driver) == 1:
+                # Best-weighted documents first
+                ranked = self._ranked[driver[0]]
+                if not others:
+                    return [doc_id for _, doc_id in ranked[:limit]]
+                driver_idf = driver_terms[0][1]
+                stream = ((-neg_weight * driver_idf, doc_id) for neg_weight, doc_id in ranked)
+            else:
+                merged = _unique(doc_id for _, doc_id in heapq.merge(*(self._ranked[term] for term in driver)))
+                stream = ((max(postings.get(doc_id, 0.0) * idf for postings, idf in driver_terms), doc_id)
+                          for doc_id in merged)
+
+            results = []
+            for score, doc_id in stream:
+                for terms in others:
+                    best = 0.0
+                    for postings, idf in terms:
+                        weight = postings.get(doc_id)
+                        if weight is not None and weight * idf > best:
+                            best = weight * idf
+                    if not best:
+                        break
+                    score += best
+                else:
+                    results.append((score, doc_id))
+                    if len(results) >= MAX_CANDIDATES:
+                        break
+            return [doc_id for _, doc_id in heapq.nlargest(limit, results)]
+
+
+class MemorySearchBackend(ListingMirror):
+    """Inverted indexes over the active listings, held in this process"""
+
+    QUERY = """
+        SELECT l.listing_id, l.title, l.description, l.amenities, l.updated_at,
+               loc.city, loc.country, loc.address
+        FROM listings l
+        LEFT JOIN locations loc ON l.location_id = loc.location_id
+        WHERE l.is_active = 1
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.text = InvertedIndex(TEXT_FIELDS)
+        self.locations = InvertedIndex(LOCATION_FIELDS)
+
+    def load(self, rows):
+        self.text.load((row['listing_id'], row) for row in rows)
+        self.locations.load((row['listing_id'], row) for row in rows)
+
+    def index(self, row):
+        self.text.add(row['listing_id'], row)
+        self.locations.add(row['listing_id'], row)
+
+    def unindex(self, listing_id):
+        self.text.remove(listing_id)
+        self.locations.remove(listing_id)
+
+    def search(self, query, limit):
+        if not self.ready:
+            return MySQLSearchBackend().search(query, limit)
+        self.ensure_current()
+        return self.text.search(query, limit)
+
+    def match(self, query):
+        if not self.ready:
+            return MySQLSearchBackend().match(query)
+        self.ensure_current()
+        return self.text.match(query)
+
+    def match_location(self, text):
+        if not self.ready:
+            return MySQLSearchBackend().match_location(text)
+        self.ensure_current()
+        return self.locations.match(text)
+
+
+class MySQLSearchBackend:
+    """FULLTEXT queries against ft_listing_text and ft_location_text"""
+
+    @staticmethod
+    def _boolean_query(text, require_all):
+        words = _query_terms(text)
+        if not words:
+            return None
+        operator = '+' if require_all else ''
+        # Only word characters reach MATCH, so input can't inject boolean operators
+        return ' '.join(f"{operator}{word}" for word in words[:-1]) + f" {operator}{words[-1]}*"
+
+    def search(self, query, limit):
+        terms = self._boolean_query(query, require_all=False)
+        if not terms:
+            return []
+        rows = db.execute_query("""
+            SELECT l.listing_id,
+                   MATCH(l.title, l.description, l.amenities) AGAINST(%s IN BOOLEAN MODE)
+                   + 2 * MATCH(loc.city, loc.country, loc.address) AGAINST(%s IN BOOLEAN MODE) AS score
+            FROM listings l
+            LEFT JOIN locations loc ON l.location_id = loc.location_id
+            WHERE l.is_active = 1
+              AND (MATCH(l.title, l.description, l.amenities) AGAINST(%s IN BOOLEAN MODE)
+                   OR MATCH(loc.city, loc.country, loc.address) AGAINST(%s IN BOOLEAN MODE))
+            ORDER BY score DESC
+            LIMIT %s
+        """, (terms,) * 4 + (limit,))
+        return [row['listing_id'] for row in rows]
+
+    def match(self, query):
+        terms = self._boolean_query(query, require_all=True)
+        if not terms:
+            return set()
+        rows = db.execute_query("""
+            SELECT l.listing_id
+            FROM listings l
+            LEFT JOIN locations loc ON l.location_id = loc.location_id
+            WHERE l.is_active = 1
+              AND (MATCH(l.title, l.description, l.amenities) AGAINST(%s IN BOOLEAN MODE)
+                   OR MATCH(loc.city, loc.country, loc.address) AGAINST(%s IN BOOLEAN MODE))
+        """, (terms, terms))
+        return {row['listing_id'] for row in rows}
+
+    def match_location(self, text):
+        terms = self._boolean_query(text, require_all=True)
+        if not terms:
+            return set()
+        rows = db.execute_query("""
+            SELECT l.listing_id
+            FROM listings l
+            JOIN locations loc ON l.location_id = loc.location_id
+            WHERE l.is_active = 1
+              AND MATCH(loc.city, loc.country, loc.address) AGAINST(%s IN BOOLEAN MODE)
+        """, (terms,))
+        return {row['listing_id'] for row in rows}
+
+    def refresh_listing(self, listing_id):
+        # InnoDB maintains FULLTEXT indexes as part of the write
+        pass
+
+    def remove_listing(self, listing_id):
+        pass
+
+
+BACKENDS = {
+    'memory': MemorySearchBackend,
+    'mysql': MySQLSearchBackend,
+}
+
+backend = MemorySearchBackend()
+
+
+def search(query, limit=None):
+    """Ids of active listings matching query, most relevant first"""
+    return backend.search(query, limit or Config.SEARCH_MAX_RESULTS)
+
+
+def match(query):
+    """Ids of all active listings matching query, unranked"""
+    return backend.match(query)
+
+
+def has_terms(text):
+    """Whether text has any word to search for"""
+    return bool(_query_terms(text))
+
+
+def match_location(text):
+    """Ids of active listings whose city, country or address contain every word of text"""
+    return backend.match_location(text)
+
+
+def _on_listing_changed(sender, listing_id=None, reason=None, **extra):
+    if reason in ('created', 'updated'):
+        backend.refresh_listing(listing_id)
+    elif reason == 'deleted':
+        backend.remove_listing(listing_id)
+
+
+listing_changed.connect(_on_listing_changed)
+
+
+def init_app(app):
+    global backend
+    backend_class = BACKENDS.get(Config.SEARCH_BACKEND)
+    if backend_class is None:
+        raise ValueError(f"Unknown SEARCH_BACKEND {Config.SEARCH_BACKEND!r}; use one of {', '.join(BACKENDS)}")
+    backend = backend_class()
+    if isinstance(backend, ListingMirror):
+        warmer.register(backend)
@@ -0,0 +1,95 @@
+"""
+Listing page view counting without a write per hit
+
+Views are counted in process, in counters split across lock stripes so that
+concurrent requests for different listings rarely contend. A daemon thread
+drains the stripes every VIEW_FLUSH_INTERVAL seconds and adds the totals to
+listing_daily_stats.views in one multi-row upsert.
+
+Each worker process flushes its own counts. The upsert adds to the stored
+value instead of replacing it, and it writes rows in key order, so workers
+flushing at the same time neither lose increments nor deadlock each other.
+Counts that fail to flush are put back for the next attempt.
+"""
+import threading
+from collections import Counter
+from datetime import date
+from config import Config
+from app.write_behind import BackgroundFlusher
+
+STRIPES = 16
+
+
+class StripedCounter:
+    """Counter of hashable keys split across independently locked stripes"""
+
+    def __init__(self, stripes=STRIPES):
+        self._stripes = [(threading.Lock(), Counter()) for _ in range(stripes)]
+
+    def add(self, key, amount=1):
+        lock, counts = self._stripes[hash(key) % len(self._stripes)]
+        with lock:
+            counts[key] += amount
+
+    def merge(self, totals):
+        for key, amount in totals.items():
+            self.add(key, amount)
+
+    def drain(self):
+        """Take and reset all counts, one stripe at a time"""
+        totals = Counter()
+        for lock, counts in self._stripes:
+            with lock:
+                totals.update(counts)
+                counts.clear()
+        return totals
+
+
+class ViewCounter(BackgroundFlusher):
+    """Per-process listing view counts with a background flush thread"""
+
+    thread_name = 'listing-view-flush'
+
+    def __init__(self, interval=Config.VIEW_FLUSH_INTERVAL):
+        super().__init__(interval)
+        self._counts = StripedCounter()
+        self._flush_lock = threading.Lock()
+
+    def record(self, listing_id, day=None):
+        self._ensure_thread()
+        self._counts.add((listing_id, day or date.today()))
+
+    def reset(self):
+        self._counts = StripedCounter()
+
+    def flush(self):
+        """Write pending counts to the database. Returns the number of views written."""
+        from app import analytics
+        from app.database import db
+
+        with self._flush_lock:
+            totals = self._counts.drain()
+            if not totals:
+                return 0
+            try:
+                # Inside a transaction database errors raise instead of being swallowed
+                with db.transaction():
+                    analytics.add_views(totals)
+            except Exception as e:
+                print(f"Error flushing listing views: {e}")
+                self._counts.merge(totals)
+                return 0
+            return sum(totals.values())
+
+
+view_counter = ViewCounter()
+
+
+def record_view(listing_id):
+    """Count one view of a listing page"""
+    view_counter.record(listing_id)
+
+
+def init_app(app):
+    # Write the last few seconds of views when the process exits
+    view_counter.register_shutdown()
@@ -0,0 +1,61 @@
+"""
+Base class for in-process buffers written to the database by a background thread
+"""
+import atexit
+import os
+import threading
+from abc import ABC, abstractmethod
+
+
+class BackgroundFlusher(ABC):
+    """Runs flush() every `interval` seconds on a daemon thread in each process.
+
+    Subclasses buffer writes in memory and implement flush() and reset(). The
+    thread starts on first use, and again in a forked worker, where reset()
+    drops the buffer copied from the parent. Call shutdown() (registered at
+    exit by register_shutdown()) to write what is left.
+    """
+
+    thread_name = 'write-behind-flush'
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    @abstractmethod
+    def flush(self):
+        """Write what is buffered"""
+
+    @abstractmethod
+    def reset(self):
+        """Drop what is buffered, without writing it"""
+
+    def _ensure_thread(self):
+        # Threads don't survive fork, so each worker process starts its own
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Buffered writes copied from the parent process belong to the parent
+                self.reset()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def shutdown(self):
+        """Stop the flush thread and write what is left"""
+        self._stop.set()
+        self.flush()
+
+    def register_shutdown(self):
+        atexit.register(self.shutdown)
@@ -15,6 +15,61 @@ class Config:
     MYSQL_USER = os.environ.get('MYSQL_USER') or 'root'
     MYSQL_PASSWORD = os.environ.get('MYSQL_PASSWORD') or ''
     MYSQL_DATABASE = os.environ.get('MYSQL_DATABASE') or 'otithi'
+    # Connections reserved for transactions: request threads plus the background flush/rollup threads
+    # (listing views, read receipts, presence, analytics). mysql-connector allows at most 32.
+    MYSQL_POOL_SIZE = int(os.environ.get('MYSQL_POOL_SIZE') or 16)
+    MYSQL_POOL_TIMEOUT = float(os.environ.get('MYSQL_POOL_TIMEOUT') or 10)  # Seconds to wait for a free connection
+    
+    # Query instrumentation
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS') or 200)  # Log statements slower than this
+    N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD') or 10)  # Same statement shape per request
+    
+    # /metrics is served to these client addresses, or to requests with "Authorization: Bearer <METRICS_TOKEN>"
+    METRICS_ALLOWED_IPS = [ip.strip() for ip in (os.environ.get('METRICS_ALLOWED_IPS') or '127.0.0.1,::1').split(',') if ip.strip()]
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or ''
+    
+    # Render caches (seconds)
+    PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL') or 60)  # Anonymous homepage
+    FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL') or 600)  # Listing cards, stats block
+    FRAGMENT_CACHE_MAX_ENTRIES = int(os.environ.get('FRAGMENT_CACHE_MAX_ENTRIES') or 5000)
+    LISTING_PROXY_MAX_AGE = int(os.environ.get('LISTING_PROXY_MAX_AGE') or 60)  # s-maxage for anonymous listing pages
+    # Zone of the naive DATETIME/TIMESTAMP values read from MySQL (IANA name); empty = this server's local zone
+    DATABASE_TIMEZONE = os.environ.get('DATABASE_TIMEZONE', '')
+    
+    # Pricing caches (seconds)
+    PRICING_RULES_TTL = int(os.environ.get('PRICING_RULES_TTL') or 60)  # Bounds staleness across workers
+    QUOTE_CACHE_TTL = int(os.environ.get('QUOTE_CACHE_TTL') or 600)
+    
+    # Per-user favorite listing id sets (seconds); bounds how long other workers show stale hearts
+    FAVORITES_CACHE_TTL = int(os.environ.get('FAVORITES_CACHE_TTL') or 10)
+    
+    # Profile statistics counters (seconds)
+    COUNTERS_CACHE_TTL = int(os.environ.get('COUNTERS_CACHE_TTL') or 30)
+    
+    # Host analytics rollups: changes younger than this (seconds) wait for the next run
+    ANALYTICS_WATERMARK_LAG = int(os.environ.get('ANALYTICS_WATERMARK_LAG') or 60)
+    # Seconds between in-process rollups; 0 leaves them to cron (`flask --app run rollup-analytics`)
+    ANALYTICS_ROLLUP_INTERVAL = int(os.environ.get('ANALYTICS_ROLLUP_INTERVAL') or 300)
+    VIEW_FLUSH_INTERVAL = int(os.environ.get('VIEW_FLUSH_INTERVAL') or 5)  # Seconds between listing view flushes
+    
+    # Message read receipts (seconds)
+    READ_RECEIPT_FLUSH_INTERVAL = float(os.environ.get('READ_RECEIPT_FLUSH_INTERVAL') or 1)
+    UNREAD_STATE_TTL = int(os.environ.get('UNREAD_STATE_TTL') or 30)  # Bounds staleness across workers
+    
+    # Online presence: 'local' (single process) or 'database' (shared via user_presence)
+    PRESENCE_BACKEND = os.environ.get('PRESENCE_BACKEND', 'local')
+    PRESENCE_TIMEOUT = int(os.environ.get('PRESENCE_TIMEOUT') or 90)  # Seconds since last activity
+    PRESENCE_FLUSH_INTERVAL = int(os.environ.get('PRESENCE_FLUSH_INTERVAL') or 15)
+    
+    # Listing keyword search: 'memory' (in-process inverted index) or 'mysql' (FULLTEXT indexes)
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'memory')
+    SEARCH_MAX_RESULTS = int(os.environ.get('SEARCH_MAX_RESULTS') or 500)
+    SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE') or 24)  # Listing cards per search results page
+    
+    # In-process listing indexes (search, map): seconds between picking up other workers' writes
+    LISTING_INDEX_SYNC_INTERVAL = int(os.environ.get('LISTING_INDEX_SYNC_INTERVAL') or 60)
+    MAP_TILE_CACHE_TTL = int(os.environ.get('MAP_TILE_CACHE_TTL') or 600)  # Clustered map tiles (seconds)
+    MAP_TILE_CACHE_MAX_ENTRIES = int(os.environ.get('MAP_TILE_CACHE_MAX_ENTRIES') or 20000)
     
     # SQLAlchemy database URI for MySQL
     SQLALCHEMY_DATABASE_URI = (
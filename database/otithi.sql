@@ -23,6 +23,21 @@ SET time_zone = "+00:00";
 
 -- --------------------------------------------------------
 
+--
+-- Table structure for table `analytics_watermarks`
+--
+-- High-water mark of each incremental aggregation job: the `bookings.updated_at`
+-- up to which changes have been rolled up.
+--
+
+CREATE TABLE `analytics_watermarks` (
+  `job` varchar(64) NOT NULL,
+  `watermark` datetime NOT NULL,
+  `updated_at` datetime DEFAULT current_timestamp() ON UPDATE current_timestamp()
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- --------------------------------------------------------
+
 --
 -- Table structure for table `bookings`
 --
@@ -52,6 +67,31 @@ INSERT INTO `bookings` (`booking_id`, `user_id`, `listing_id`, `check_in`, `chec
 
 -- --------------------------------------------------------
 
+--
+-- Table structure for table `booking_nights`
+--
+-- One row per night held by a pending, confirmed or completed booking.
+-- Derived from `bookings`; the primary key makes double-booking impossible.
+--
+
+CREATE TABLE `booking_nights` (
+  `listing_id` int(11) NOT NULL,
+  `night` date NOT NULL,
+  `booking_id` int(11) NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+--
+-- Dumping data for table `booking_nights`
+--
+
+INSERT INTO `booking_nights` (`listing_id`, `night`, `booking_id`) VALUES
+(3, '2025-08-20', 2),
+(3, '2025-08-21', 2),
+(3, '2025-08-25', 1),
+(3, '2025-08-26', 1);
+
+-- --------------------------------------------------------
+
 --
 -- Table structure for table `email_verifications`
 --
@@ -96,6 +136,7 @@ CREATE TABLE `listings` (
   `price_per_night` decimal(10,2) NOT NULL,
   `max_guests` int(11) NOT NULL DEFAULT 1,
   `amenities` text DEFAULT NULL,
+  `amenity_mask` bigint(20) UNSIGNED NOT NULL DEFAULT 0,
   `is_active` tinyint(1) DEFAULT 1,
   `created_at` datetime DEFAULT current_timestamp(),
   `updated_at` datetime DEFAULT current_timestamp() ON UPDATE current_timestamp()
@@ -105,10 +146,29 @@ CREATE TABLE `listings` (
 -- Dumping data for table `listings`
 --
 
-INSERT INTO `listings` (`listing_id`, `host_id`, `location_id`, `title`, `description`, `room_type`, `price_per_night`, `max_guests`, `amenities`, `is_active`, `created_at`, `updated_at`) VALUES
-(1, 2, 1, 'Cozy Apartment in Gulshan', 'Beautiful modern apartment in the heart of Gulshan with all amenities. Perfect for business travelers and tourists. Features include a spacious living room, modern kitchen, comfortable bedroom, and a lovely balcony with city views.', 'entire_place', 3500.00, 4, 'wifi,air_conditioning,kitchen,parking,tv,balcony', 1, '2025-08-20 08:42:53', '2025-08-20 08:42:53'),
-(2, 2, 2, 'Modern Studio in Banani', 'Stylish studio apartment in Banani.', 'private_room', 2500.00, 2, 'wifi,air_conditioning,tv', 1, '2025-08-20 08:48:38', '2025-08-20 08:48:38'),
-(3, 2, 3, 'small room', 'small room', 'private_room', 1205.00, 2, 'wifi, parking, etc', 1, '2025-08-20 05:10:15', '2025-08-20 05:10:15');
+INSERT INTO `listings` (`listing_id`, `host_id`, `location_id`, `title`, `description`, `room_type`, `price_per_night`, `max_guests`, `amenities`, `amenity_mask`, `is_active`, `created_at`, `updated_at`) VALUES
+(1, 2, 1, 'Cozy Apartment in Gulshan', 'Beautiful modern apartment in the heart of Gulshan with all amenities. Perfect for business travelers and tourists. Features include a spacious living room, modern kitchen, comfortable bedroom, and a lovely balcony with city views.', 'entire_place', 3500.00, 4, 'wifi,air_conditioning,kitchen,parking,tv,balcony', 63, 1, '2025-08-20 08:42:53', '2025-08-20 08:42:53'),
+(2, 2, 2, 'Modern Studio in Banani', 'Stylish studio apartment in Banani.', 'private_room', 2500.00, 2, 'wifi,air_conditioning,tv', 19, 1, '2025-08-20 08:48:38', '2025-08-20 08:48:38'),
+(3, 2, 3, 'small room', 'small room', 'private_room', 1205.00, 2, 'wifi, parking, etc', 9, 1, '2025-08-20 05:10:15', '2025-08-20 05:10:15');
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `listing_daily_stats`
+--
+-- Daily rollup per listing for host analytics: bookings made, nights sold and
+-- their revenue (by stay date), and page views. Filled by `flask rollup-analytics`.
+--
+
+CREATE TABLE `listing_daily_stats` (
+  `listing_id` int(11) NOT NULL,
+  `day` date NOT NULL,
+  `bookings` int(11) NOT NULL DEFAULT 0,
+  `nights_sold` int(11) NOT NULL DEFAULT 0,
+  `revenue` decimal(12,2) NOT NULL DEFAULT 0.00,
+  `views` int(11) NOT NULL DEFAULT 0,
+  `updated_at` datetime DEFAULT current_timestamp() ON UPDATE current_timestamp()
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- --------------------------------------------------------
 
@@ -135,6 +195,44 @@ INSERT INTO `listing_images` (`image_id`, `listing_id`, `image_filename`, `image
 
 -- --------------------------------------------------------
 
+--
+-- Table structure for table `listing_pricing`
+--
+-- Per-listing pricing rules (weekend, seasonal, length-of-stay, extra guest)
+-- as a compact JSON document; `version` is bumped on every change and keys
+-- cached quotes.
+--
+
+CREATE TABLE `listing_pricing` (
+  `listing_id` int(11) NOT NULL,
+  `rules` longtext CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL CHECK (json_valid(`rules`)),
+  `version` int(11) NOT NULL DEFAULT 1,
+  `updated_at` datetime DEFAULT current_timestamp() ON UPDATE current_timestamp()
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `listing_rating_stats`
+--
+-- Review count, rating sum and 1-5 star histogram per listing, kept in step
+-- with `reviews` on every review write.
+--
+
+CREATE TABLE `listing_rating_stats` (
+  `listing_id` int(11) NOT NULL,
+  `review_count` int(11) NOT NULL DEFAULT 0,
+  `rating_sum` decimal(10,1) NOT NULL DEFAULT 0.0,
+  `stars_1` int(11) NOT NULL DEFAULT 0,
+  `stars_2` int(11) NOT NULL DEFAULT 0,
+  `stars_3` int(11) NOT NULL DEFAULT 0,
+  `stars_4` int(11) NOT NULL DEFAULT 0,
+  `stars_5` int(11) NOT NULL DEFAULT 0,
+  `updated_at` datetime DEFAULT current_timestamp() ON UPDATE current_timestamp()
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- --------------------------------------------------------
+
 --
 -- Table structure for table `locations`
 --
@@ -263,10 +361,30 @@ INSERT INTO `user_details` (`user_id`, `profile_photo`, `phone`, `bio`, `user_ty
 (2, 'ibrahim_hasan_7_profile.jpg', '+8801712345678', 'Experienced host with multiple properties. Passionate about providing excellent guest experiences.', 'host', '2025-08-17 01:53:50', 1, 1, '2025-08-17 01:53:50', '2025-08-19 23:33:24'),
 (3, 'marzia_hossain_8_profile.jpeg', '+8801798765432', 'Travel enthusiast and frequent guest. Love exploring new places and meeting new people.', 'guest', '2025-08-17 01:53:50', 1, 1, '2025-08-17 01:53:50', '2025-08-19 23:33:24');
 
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `user_presence`
+--
+-- Last activity per user for online indicators when PRESENCE_BACKEND=database;
+-- written in batches by each worker's presence flush thread.
+--
+
+CREATE TABLE `user_presence` (
+  `user_id` int(11) NOT NULL,
+  `last_seen` datetime NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 --
 -- Indexes for dumped tables
 --
 
+--
+-- Indexes for table `analytics_watermarks`
+--
+ALTER TABLE `analytics_watermarks`
+  ADD PRIMARY KEY (`job`);
+
 --
 -- Indexes for table `bookings`
 --
@@ -274,7 +392,17 @@ ALTER TABLE `bookings`
   ADD PRIMARY KEY (`booking_id`),
   ADD KEY `user_id` (`user_id`),
   ADD KEY `listing_id` (`listing_id`),
-  ADD KEY `confirmed_by` (`confirmed_by`);
+  ADD KEY `confirmed_by` (`confirmed_by`),
+  ADD KEY `idx_listing_created` (`listing_id`,`created_at`),
+  ADD KEY `idx_updated_at` (`updated_at`);
+
+--
+-- Indexes for table `booking_nights`
+--
+ALTER TABLE `booking_nights`
+  ADD PRIMARY KEY (`listing_id`,`night`),
+  ADD KEY `idx_night_listing` (`night`,`listing_id`),
+  ADD KEY `booking_id` (`booking_id`);
 
 --
 -- Indexes for table `email_verifications`
@@ -303,7 +431,15 @@ ALTER TABLE `listings`
   ADD KEY `idx_host_id` (`host_id`),
   ADD KEY `idx_location_id` (`location_id`),
   ADD KEY `idx_active` (`is_active`),
-  ADD KEY `idx_created` (`created_at`);
+  ADD KEY `idx_created` (`created_at`),
+  ADD FULLTEXT KEY `ft_listing_text` (`title`,`description`,`amenities`);
+
+--
+-- Indexes for table `listing_daily_stats`
+--
+ALTER TABLE `listing_daily_stats`
+  ADD PRIMARY KEY (`listing_id`,`day`),
+  ADD KEY `idx_day` (`day`);
 
 --
 -- Indexes for table `listing_images`
@@ -314,6 +450,18 @@ ALTER TABLE `listing_images`
   ADD KEY `idx_order` (`listing_id`,`image_order`),
   ADD KEY `idx_primary` (`listing_id`,`is_primary`);
 
+--
+-- Indexes for table `listing_pricing`
+--
+ALTER TABLE `listing_pricing`
+  ADD PRIMARY KEY (`listing_id`);
+
+--
+-- Indexes for table `listing_rating_stats`
+--
+ALTER TABLE `listing_rating_stats`
+  ADD PRIMARY KEY (`listing_id`);
+
 --
 -- Indexes for table `locations`
 --
@@ -321,7 +469,8 @@ ALTER TABLE `locations`
   ADD PRIMARY KEY (`location_id`),
   ADD KEY `idx_city_country` (`city`,`country`),
   ADD KEY `idx_coordinates` (`latitude`,`longitude`),
-  ADD KEY `idx_listing_id` (`listing_id`);
+  ADD KEY `idx_listing_id` (`listing_id`),
+  ADD FULLTEXT KEY `ft_location_text` (`city`,`country`,`address`);
 
 --
 -- Indexes for table `messages`
@@ -348,6 +497,9 @@ ALTER TABLE `payments`
 --
 ALTER TABLE `reviews`
   ADD PRIMARY KEY (`review_id`),
+  ADD UNIQUE KEY `unique_listing_reviewer` (`listing_id`,`reviewer_id`),
+  ADD KEY `idx_listing_date` (`listing_id`,`review_date`),
+  ADD KEY `idx_reviewer_date` (`reviewer_id`,`review_date`),
   ADD KEY `reviewer_id` (`reviewer_id`),
   ADD KEY `listing_id` (`listing_id`),
   ADD KEY `booking_id` (`booking_id`);
@@ -365,6 +517,12 @@ ALTER TABLE `users`
 ALTER TABLE `user_details`
   ADD PRIMARY KEY (`user_id`);
 
+--
+-- Indexes for table `user_presence`
+--
+ALTER TABLE `user_presence`
+  ADD PRIMARY KEY (`user_id`);
+
 --
 -- AUTO_INCREMENT for dumped tables
 --
@@ -441,6 +599,13 @@ ALTER TABLE `bookings`
   ADD CONSTRAINT `bookings_ibfk_2` FOREIGN KEY (`listing_id`) REFERENCES `listings` (`listing_id`) ON DELETE CASCADE,
   ADD CONSTRAINT `bookings_ibfk_3` FOREIGN KEY (`confirmed_by`) REFERENCES `users` (`user_id`) ON DELETE SET NULL;
 
+--
+-- Constraints for table `booking_nights`
+--
+ALTER TABLE `booking_nights`
+  ADD CONSTRAINT `booking_nights_ibfk_1` FOREIGN KEY (`listing_id`) REFERENCES `listings` (`listing_id`) ON DELETE CASCADE,
+  ADD CONSTRAINT `booking_nights_ibfk_2` FOREIGN KEY (`booking_id`) REFERENCES `bookings` (`booking_id`) ON DELETE CASCADE;
+
 --
 -- Constraints for table `email_verifications`
 --
@@ -461,12 +626,30 @@ ALTER TABLE `listings`
   ADD CONSTRAINT `listings_ibfk_1` FOREIGN KEY (`host_id`) REFERENCES `users` (`user_id`) ON DELETE CASCADE,
   ADD CONSTRAINT `listings_ibfk_2` FOREIGN KEY (`location_id`) REFERENCES `locations` (`location_id`) ON DELETE CASCADE;
 
+--
+-- Constraints for table `listing_daily_stats`
+--
+ALTER TABLE `listing_daily_stats`
+  ADD CONSTRAINT `listing_daily_stats_ibfk_1` FOREIGN KEY (`listing_id`) REFERENCES `listings` (`listing_id`) ON DELETE CASCADE;
+
 --
 -- Constraints for table `listing_images`
 --
 ALTER TABLE `listing_images`
   ADD CONSTRAINT `listing_images_ibfk_1` FOREIGN KEY (`listing_id`) REFERENCES `listings` (`listing_id`) ON DELETE CASCADE;
 
+--
+-- Constraints for table `listing_pricing`
+--
+ALTER TABLE `listing_pricing`
+  ADD CONSTRAINT `listing_pricing_ibfk_1` FOREIGN KEY (`listing_id`) REFERENCES `listings` (`listing_id`) ON DELETE CASCADE;
+
+--
+-- Constraints for table `listing_rating_stats`
+--
+ALTER TABLE `listing_rating_stats`
+  ADD CONSTRAINT `listing_rating_stats_ibfk_1` FOREIGN KEY (`listing_id`) REFERENCES `listings` (`listing_id`) ON DELETE CASCADE;
+
 --
 -- Constraints for table `locations`
 --
@@ -502,6 +685,12 @@ ALTER TABLE `reviews`
 --
 ALTER TABLE `user_details`
   ADD CONSTRAINT `user_details_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`user_id`) ON DELETE CASCADE;
+
+--
+-- Constraints for table `user_presence`
+--
+ALTER TABLE `user_presence`
+  ADD CONSTRAINT `user_presence_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`user_id`) ON DELETE CASCADE;
 COMMIT;
 
 /*!40101 SET CHARACTER_SET_CLIENT=@OLD_CHARACTER_SET_CLIENT */;